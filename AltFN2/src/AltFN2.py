@@ -6,8 +6,11 @@
 @retval 1 - 失敗
 """
 import sys
+import time
+
+startup_time = time.perf_counter()  # 起動時間の計測用
 
 from main import main
 
 if __name__ == "__main__":
-    sys.exit(main(sys.argv))
+    sys.exit(main(sys.argv, startup_time))
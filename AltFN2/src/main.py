@@ -3,22 +3,33 @@
 """
 
 import argparse
+import bisect
+import collections
 import dataclasses
+import functools
+import glob
 from datetime import datetime
 from datetime import timedelta
+import hashlib
 import json
+import math
 import os
+import pickle
+import queue
 import re
-import subprocess
+import stat
+import sys
+import threading
+import time
 import tkinter
+import types
 from dataclasses import dataclass, field
-from tkinter import messagebox, ttk
-from typing import List, Optional, Union
-import keyboard
+from tkinter import messagebox
+from typing import Any, Callable, Iterable, List, Optional, Union, get_args, get_origin, get_type_hints
 
-import win32con
-import win32gui
-from dacite import from_dict
+# 起動時間の短縮のため、特定の処理でだけ使うモジュール(keyboard,win32gui,win32con,dacite,subprocess,tkinter.ttk,
+# multiprocessing.connection)は
+# 使用する関数の中でimportする。
 
 # グローバル変数
 __version__ = "0.5.0"
@@ -27,7 +38,15 @@ g_args = argparse.Namespace()  # コマンド引数。ダミー初期化
 #
 
 
-@dataclass(kw_only=True)
+# 同じ値が繰り返し現れる文字列のフィールド。設定ファイルの読み込み中は同じ値の文字列を共有する
+INTERN = {"intern": True}
+# 設定ファイルでは親と同じ階層に書くdataclassのフィールド
+FLATTEN = {"flatten": True}
+
+# 常駐するプロセスで大量のアプリケーション情報を保持するため、設定のdataclassは__slots__を使う
+
+
+@dataclass(kw_only=True, slots=True)
 class WindowGeometry:
     width: int = 0
     height: int = 0
@@ -35,22 +54,63 @@ class WindowGeometry:
     y: int = 0
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class Launch:
     title: str = ""
-    program_path: str  # プログラムパス
-    args: Optional[list[str]]  # コマンドオプション
-    work_dir: Optional[str]  # 作業ディレクトリ
+    program_path: str = field(default="", metadata=INTERN)  # プログラムパス。グループの場合は不要
+    args: Optional[list[str]] = field(metadata=INTERN)  # コマンドオプション
+    work_dir: Optional[str] = field(metadata=INTERN)  # 作業ディレクトリ
     shell: Optional[bool]  # アプリケーションをシェルによって起動する
+    options: Optional["LaunchOptions"] = field(default=None, metadata=FLATTEN)  # 使用頻度の低い設定。無い場合はNone
 
+    @property
+    def single_instance(self) -> Optional[bool]:
+        return None if self.options is None else self.options.single_instance
 
-@dataclass(kw_only=True)
+    @property
+    def env(self) -> Optional[dict[str, str]]:
+        return None if self.options is None else self.options.env
+
+    @property
+    def group(self) -> Optional[list[Union[str, "GroupMember"]]]:
+        return None if self.options is None else self.options.group
+
+    @property
+    def group_parallel(self) -> Optional[int]:
+        return None if self.options is None else self.options.group_parallel
+
+
+@dataclass(kw_only=True, slots=True)
+class LaunchOptions:
+    """!
+    @brief アプリケーション情報の使用頻度の低い設定
+    @detail 大半のLaunchはどれも指定しないので、Launchから分けてLaunchを小さくする。
+    設定ファイルではLaunchの他のフィールドと同じ階層に書く。Launchの同名のプロパティで参照する。
+    """
+
+    single_instance: Optional[bool] = None  # 起動したプロセスが実行中の場合は起動せずにウィンドウを表示する
+    env: Optional[dict[str, str]] = None  # 追加・上書きする環境変数。値は変数を展開する
+    group: Optional[list[Union[str, "GroupMember"]]] = None  # グループ。メンバー(キーまたはGroupMember)を同時に起動する
+    group_parallel: Optional[int] = None  # グループの同時起動数。省略時はLAUNCH_GROUP_PARALLEL
+
+
+@dataclass(kw_only=True, slots=True)
+class GroupMember:
+    key: Optional[str] = None  # launch_dictのキー
+    launch: Optional[Launch] = None  # アプリケーション情報。keyの代わりに直接指定する
+    delay: int = 0  # グループの起動開始からの待ち時間[ms]
+
+
+LAUNCH_GROUP_PARALLEL = 4  # グループの同時起動数の既定値
+
+
+@dataclass(kw_only=True, slots=True)
 class Variable:
     name: str = ""
     value: str = ""
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class Config:
     version: str = ""
     main_window_geometry: WindowGeometry = field(default_factory=WindowGeometry)
@@ -60,21 +120,1586 @@ class Config:
     font_name: str = "ＭＳ ゴシック"
     font_size: int = 12
     hotkey: str ="" # ショートカットキー
+    launch_table_limit: int = 1000  # 一覧表の最大表示件数。0は無制限
+    watch_config: bool = False  # 設定ファイルの更新を監視して反映する
+    fuzzy_match: bool = False  # キーとタイトルのあいまい検索
+    include: Optional[list[str]] = None  # 統合する設定ファイル(パスまたはglobパターン)。後のファイルほど優先
+    stats: bool = False  # 処理時間の統計を記録する
+    speculative_launch: bool = False  # 一意に一致したアプリケーションの起動を先に準備する
     variable_list: list[Variable] = field(default_factory=list)
     launch_dict: dict[str, Launch] = field(default_factory=dict)
 
 
+class StartupProfile:
+    """!
+    @brief 起動時間の計測
+    @detail mark()を呼び出すたびに、前回からの経過時間を工程の時間として記録する。
+    """
+
+    def __init__(self, start_time: Optional[float] = None):
+        self.start_time = time.perf_counter() if start_time is None else start_time  # 計測開始時刻
+        self.last_time = self.start_time
+        self.phases: dict[str, float] = {}  # 工程:時間[ms]
+
+    def mark(self, phase: str) -> None:
+        """!
+        @brief 工程の終了を記録する
+        @param[in] phase 工程名
+        """
+        now = time.perf_counter()
+        self.phases[phase] = (now - self.last_time) * 1000
+        self.last_time = now
+
+    def to_dict(self) -> dict:
+        return {"phases": self.phases, "total": (self.last_time - self.start_time) * 1000}
+
+    def write(self, path: str) -> None:
+        """!
+        @brief 計測結果をJSON形式で出力する
+        @param[in] path 出力ファイル。"-"の場合は標準出力
+        """
+        json_data = json.dumps(self.to_dict(), ensure_ascii=False)
+        if path == "-":
+            if sys.stdout is not None:  # pythonwの場合は標準出力なし
+                print(json_data)
+        else:
+            with open(path, mode="a", encoding="utf-8") as f:
+                f.write(json_data + "\n")
+
+
+class LatencyStats:
+    """!
+    @brief 処理時間の統計
+    @detail 直近の値をリングバッファに保持する。全ての値はヒストグラム(HISTOGRAM_BOUNDSごとの件数)に集計する。
+    """
+
+    HISTOGRAM_BOUNDS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)  # ヒストグラムの区間の上限[ms]
+
+    def __init__(self, size: int = 256):
+        self.values: collections.deque = collections.deque(maxlen=size)  # 直近の値[ms]
+        self.count = 0  # 記録した回数
+        self.total = 0.0  # 全ての値の合計[ms]
+        self.histogram = [0] * (len(self.HISTOGRAM_BOUNDS) + 1)  # 区間ごとの件数。最後は上限を超えた件数
+
+    def add(self, value: float) -> None:
+        """!
+        @brief 値を記録する
+        @param[in] value 値[ms]
+        """
+        self.values.append(value)
+        self.count += 1
+        self.total += value
+        self.histogram[bisect.bisect_left(self.HISTOGRAM_BOUNDS, value)] += 1
+
+    def to_dict(self) -> dict:
+        """!
+        @brief 直近の値の要約
+        @return count:記録した回数,last,min,p50,p95,max:直近の値の統計[ms],mean:全ての値の平均[ms],
+        histogram:区間("<=上限[ms]")ごとの件数
+        """
+        values = sorted(self.values)
+        if len(values) == 0:
+            return {"count": self.count}
+        histogram = {f"<={bound}": n for bound, n in zip(self.HISTOGRAM_BOUNDS, self.histogram) if n > 0}
+        if self.histogram[-1] > 0:
+            histogram[f">{self.HISTOGRAM_BOUNDS[-1]}"] = self.histogram[-1]
+        return {
+            "count": self.count,
+            "last": self.values[-1],
+            "min": values[0],
+            "p50": values[len(values) // 2],
+            "p95": values[min(len(values) - 1, len(values) * 95 // 100)],
+            "max": values[-1],
+            "mean": self.total / self.count,
+            "histogram": histogram,
+        }
+
+
+class Metrics:
+    """!
+    @brief 処理時間の計測
+    @detail 処理名ごとにLatencyStatsに記録する。無効(enabled=False)の場合は呼び出し側で時刻の取得も省略する。
+    ```
+    t = time.perf_counter() if metrics.enabled else 0.0
+    ...
+    if metrics.enabled:
+        metrics.add("name", t)
+    ```
+    add()は他のスレッドから呼び出してよい。
+    """
+
+    NAMES = {  # 処理名:表示名
+        "hotkey": "ホットキーから表示",
+        "key_event": "キー入力",
+        "refresh": "一覧表の更新",
+        "config_read": "設定ファイルの読み込み",
+        "config_write": "設定ファイルの書き込み",
+        "expand": "変数の展開",
+        "spawn": "プロセスの起動",
+        "speculation": "起動の事前準備",
+        "profile": "プロファイルの切り替え",
+    }
+
+    def __init__(self, enabled: bool = False, size: int = 256):
+        self.enabled = enabled  # 計測する
+        self.size = size  # 処理ごとに保持する直近の値の件数
+        self.stats: dict[str, LatencyStats] = {}  # 処理名:統計
+        self.sources: dict[str, Callable[[], dict]] = {}  # 名前:処理時間以外の統計(回数など)を返す関数
+        self.lock = threading.Lock()
+
+    def add(self, name: str, start_time: float) -> None:
+        """!
+        @brief 処理時間を記録する
+        @param[in] name 処理名
+        @param[in] start_time 処理の開始時刻(time.perf_counter())
+        """
+        value = (time.perf_counter() - start_time) * 1000
+        with self.lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = LatencyStats(self.size)
+            stats.add(value)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            result = {name: stats.to_dict() for name, stats in self.stats.items()}
+        for name, source in self.sources.items():
+            result[name] = source()
+        return result
+
+    def format(self) -> str:
+        """!
+        @brief 統計の表示用の文字列
+        @return 処理ごとの回数,p50,p95,最大[ms]
+        """
+        lines = []
+        for name, stats in self.to_dict().items():
+            label = self.NAMES.get(name, name)
+            if name in self.sources:
+                lines.append(f"{label}: " + " ".join(f"{k}={v}" for k, v in stats.items()))
+                continue
+            if stats["count"] == 0:
+                continue
+            lines.append(
+                f"{label}: {stats['count']}回 p50={stats['p50']:.2f}ms p95={stats['p95']:.2f}ms max={stats['max']:.2f}ms"
+            )
+        return "\n".join(lines) if len(lines) > 0 else "記録なし"
+
+    def write(self, path: str) -> None:
+        """!
+        @brief 統計をJSON形式で出力する
+        @param[in] path 出力ファイル。"-"の場合は標準出力
+        """
+        json_data = json.dumps(self.to_dict(), ensure_ascii=False)
+        if path == "-":
+            if sys.stdout is not None:  # pythonwの場合は標準出力なし
+                print(json_data)
+        else:
+            with open(path, mode="a", encoding="utf-8") as f:
+                f.write(json_data + "\n")
+
+
+@dataclass(kw_only=True)
+class ConfigDiff:
+    added: list[str] = field(default_factory=list)  # 追加されたキー
+    removed: list[str] = field(default_factory=list)  # 削除されたキー
+    changed: list[str] = field(default_factory=list)  # 変更されたキー
+    variables_changed: bool = False  # variable_listの変更
+
+
+def diff_config(old: Config, new: Config) -> ConfigDiff:
+    """!
+    @brief 設定の差分
+    @param[in] old 変更前の設定
+    @param[in] new 変更後の設定
+    @return launch_dictとvariable_listの差分
+    """
+    diff = ConfigDiff(variables_changed=old.variable_list != new.variable_list)
+    for key, launch in new.launch_dict.items():
+        old_launch = old.launch_dict.get(key)
+        if old_launch is None:
+            diff.added.append(key)
+        elif old_launch != launch:
+            diff.changed.append(key)
+    diff.removed = [key for key in old.launch_dict if key not in new.launch_dict]
+    return diff
+
+
+class ConfigWatcher:
+    """!
+    @brief 設定ファイルの更新の監視
+    @detail 更新時刻とサイズを一定間隔で確認し、変わった場合にon_change()を呼び出す。
+    on_change()は監視用のスレッドから呼び出される。
+    """
+
+    def __init__(self, paths: list[str], on_change: Callable[[], None], interval: float = 0.5):
+        self.paths = paths  # 監視するファイル
+        self.on_change = on_change
+        self.interval = interval  # 確認間隔[秒]
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.last_signature = self.signature()
+
+    def signature(self) -> tuple:
+        result = []
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+                result.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                result.append(None)
+        return tuple(result)
+
+    def set_paths(self, paths: list[str]) -> None:
+        """!
+        @brief 監視するファイルを変更する
+        @detail on_change()から呼び出す。
+        """
+        self.paths = paths
+        self.last_signature = self.signature()
+
+    def watch(self, paths: list[str], signature: Optional[tuple] = None) -> tuple:
+        """!
+        @brief 監視するファイルを入れ替える。プロファイルの切り替え用
+        @param[in] paths 監視するファイル
+        @param[in] signature 前回監視していた時点の更新時刻とサイズ。Noneの場合は現在の値
+        @return 入れ替える前のファイルの更新時刻とサイズ
+        @detail 監視していない間にファイルが変わっていれば、次の確認でon_change()を呼び出す。
+        """
+        previous = self.last_signature
+        self.paths = paths
+        self.last_signature = signature if signature is not None else self.signature()
+        return previous
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.run, name="ConfigWatcher", daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            signature = self.signature()
+            if signature != self.last_signature:
+                self.last_signature = signature
+                self.on_change()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+
+
+class VariableExpander:
+    """!
+    @brief 変数(%NAME%形式)の展開
+    @detail 設定変数の辞書は生成時に1回だけ作成する。文字列ごとにテンプレートと展開結果をキャッシュする。
+    環境変数を参照した展開結果は、その環境変数の値が変わった場合に再展開する。
+    """
+
+    PATTERN = re.compile(r"%([^%]+)%")
+
+    def __init__(self, variable_list: Iterable[Variable] = (), *, cache_limit: int = 4096):
+        self.variables: dict[str, str] = {}  # 変数名:値
+        for variable in variable_list:
+            self.variables.setdefault(variable.name, variable.value)  # 同名の変数は先勝ち
+        self.cache_limit = cache_limit  # キャッシュの最大件数
+        self.template_cache: dict[str, tuple[tuple[str, ...], tuple[str, ...]]] = {}  # 文字列:(リテラル,変数名)
+        # 文字列:(展開結果,環境変数)
+        self.result_cache: dict[str, tuple[str, tuple[tuple[str, Optional[str]], ...]]] = {}
+
+    def compile(self, s: str) -> tuple[tuple[str, ...], tuple[str, ...]]:
+        """!
+        @brief 文字列をテンプレートに変換する
+        @param[in] s 変換元文字列
+        @return (リテラルの一覧, 変数名の一覧)。リテラルは変数名より1つ多い
+        """
+        template = self.template_cache.get(s)
+        if template is None:
+            parts = self.PATTERN.split(s)  # [リテラル, 変数名, リテラル, ..., リテラル]
+            template = (tuple(parts[0::2]), tuple(parts[1::2]))
+            if len(self.template_cache) >= self.cache_limit:
+                self.template_cache.clear()
+            self.template_cache[s] = template
+        return template
+
+    def expand(self, s: str) -> str:
+        """!
+        @brief 変数を展開する。設定変数と環境変数
+        @param[in] s 展開元文字列
+        @return 展開後文字列
+        @detail 設定変数を優先する。変数が存在しない場合は展開しない。
+        """
+        cached = self.result_cache.get(s)
+        if cached is not None:
+            result, env_values = cached
+            if all(os.environ.get(name) == value for name, value in env_values):  # 環境変数の変更なし?
+                return result
+        literals, names = self.compile(s)
+        env_values = []  # 参照した環境変数とその値
+        pieces = [literals[0]]
+        for name, literal in zip(names, literals[1:]):
+            value = self.variables.get(name)
+            if value is None:  # 設定変数なし?
+                value = os.environ.get(name)  # 環境変数
+                env_values.append((name, value))
+                if value is None:
+                    value = f"%{name}%"
+            pieces.append(value)
+            pieces.append(literal)
+        result = "".join(pieces)
+        if len(self.result_cache) >= self.cache_limit:
+            self.result_cache.clear()
+        self.result_cache[s] = (result, tuple(env_values))
+        return result
+
+
+class PrefixIndex:
+    """!
+    @brief キーの前方一致検索用インデックス
+    @detail ソート済みのキー配列を二分探索する。検索時間はキー数Nではなく前方一致の件数に依存する。
+    """
+
+    def __init__(self, keys: Iterable[str] = ()):
+        self.order: dict[str, int] = {key: i for i, key in enumerate(keys)}  # キー:登録順
+        self.sorted_keys: list[str] = sorted(self.order)
+        self.next_order = len(self.order)  # 次に追加するキーの登録順
+
+    def __len__(self) -> int:
+        return len(self.sorted_keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.order
+
+    def add(self, key: str) -> None:
+        """!
+        @brief キーを追加する。登録順は最後
+        """
+        if key in self.order:
+            return
+        self.order[key] = self.next_order
+        self.next_order += 1
+        bisect.insort(self.sorted_keys, key)
+
+    def remove(self, key: str) -> None:
+        """!
+        @brief キーを削除する
+        """
+        if self.order.pop(key, None) is None:
+            return
+        del self.sorted_keys[bisect.bisect_left(self.sorted_keys, key)]
+
+    def range(self, prefix: str) -> tuple[int, int]:
+        """!
+        @brief 前方一致するキーの範囲
+        @param[in] prefix 前方一致文字列
+        @return (開始位置, 終了位置) sorted_keysの添字
+        """
+        lo = bisect.bisect_left(self.sorted_keys, prefix)
+        n = len(prefix)
+        hi = bisect.bisect_right(self.sorted_keys, prefix, lo=lo, key=lambda key: key[:n])
+        return lo, hi
+
+    def count(self, prefix: str) -> int:
+        lo, hi = self.range(prefix)
+        return hi - lo
+
+    def keys_with_prefix(self, prefix: str) -> list[str]:
+        """!
+        @brief 前方一致するキーの一覧
+        @param[in] prefix 前方一致文字列
+        @return キーの一覧。登録順
+        """
+        if prefix == "":  # 全件
+            return list(self.order)
+        lo, hi = self.range(prefix)
+        keys = self.sorted_keys[lo:hi]
+        keys.sort(key=self.order.__getitem__)
+        return keys
+
+    def unique_key(self, prefix: str) -> Optional[str]:
+        """!
+        @brief 前方一致するキーが1件だけの場合にそのキーを返す
+        @param[in] prefix 前方一致文字列
+        @return キー。0件または複数件の場合はNone
+        """
+        lo, hi = self.range(prefix)
+        if hi - lo != 1:
+            return None
+        return self.sorted_keys[lo]
+
+
+class StatCache:
+    """!
+    @brief パスの種類(ファイル,ディレクトリ,なし)のキャッシュ
+    @detail 有効期間(ttl)を過ぎた結果は再取得する。件数が上限を超えた場合は最も古く参照したものから削除する。
+    複数のスレッドから呼び出してよい。
+    """
+
+    KIND_NONE = 0  # 存在しない
+    KIND_FILE = 1  # ファイル
+    KIND_DIR = 2  # ディレクトリ
+
+    def __init__(self, *, ttl: float = 300.0, max_size: int = 100000, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl  # 有効期間[秒]
+        self.max_size = max_size  # 最大件数
+        self.clock = clock
+        # パス:(取得時刻,種類)
+        self.entries: collections.OrderedDict[str, tuple[float, int]] = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0  # キャッシュの命中数
+        self.misses = 0  # キャッシュの失敗数
+
+    def kind(self, path: str, *, refresh_missing: bool = False) -> int:
+        """!
+        @brief パスの種類
+        @param[in] path パス
+        @param[in] refresh_missing 存在しないという結果はキャッシュを使わずに再取得する
+        @return KIND_NONE,KIND_FILE,KIND_DIR
+        """
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and now - entry[0] < self.ttl:
+                if not (refresh_missing and entry[1] == self.KIND_NONE):
+                    self.entries.move_to_end(path)
+                    self.hits += 1
+                    return entry[1]
+            self.misses += 1
+        try:
+            mode = os.stat(path).st_mode
+        except (OSError, ValueError):
+            kind = self.KIND_NONE
+        else:
+            kind = self.KIND_FILE if stat.S_ISREG(mode) else self.KIND_DIR if stat.S_ISDIR(mode) else self.KIND_NONE
+        with self.lock:
+            self.entries[path] = (now, kind)
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return kind
+
+    def isfile(self, path: str, *, refresh_missing: bool = False) -> bool:
+        return self.kind(path, refresh_missing=refresh_missing) == self.KIND_FILE
+
+    def isdir(self, path: str, *, refresh_missing: bool = False) -> bool:
+        return self.kind(path, refresh_missing=refresh_missing) == self.KIND_DIR
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        """!
+        @brief キャッシュを破棄する
+        @param[in] path パス。Noneの場合は全て
+        """
+        with self.lock:
+            if path is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(path, None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+class LaunchError(Exception):
+    """!
+    @brief アプリケーションの起動の失敗
+    @detail メッセージはそのままエラーダイアログに表示する。
+    """
+
+
+@dataclass(frozen=True, slots=True)
+class LaunchPlan:
+    """!
+    @brief 起動の計画。変数を展開済みのコマンド等
+    @detail 設定ファイルの読み込み時にLaunchPlannerで作成し、変数が変わるまで使い回す。
+    """
+
+    argv: tuple[str, ...]  # コマンド。先頭はプログラムパス
+    cwd: str  # 作業ディレクトリ
+    shell: bool  # シェルによって起動する
+    # 追加・上書きする環境変数(展開済み)。起動時に引き継ぐ環境変数と統合する。変更しないこと
+    env: Optional[dict[str, str]] = None
+    check_work_dir: bool = False  # 作業ディレクトリを検証する(work_dirの指定あり)
+
+
+def compile_launch(launch: Launch, expand: Callable[[str], str]) -> LaunchPlan:
+    """!
+    @brief 起動の計画を作成する。パスは検証しない
+    @param[in] launch アプリケーション情報
+    @param[in] expand 変数の展開関数
+    @return 起動の計画
+    """
+    program_path = expand(launch.program_path)
+    argv = [program_path]
+    if launch.args is not None:
+        argv.extend(map(expand, launch.args))
+    if launch.work_dir is not None:
+        cwd = expand(launch.work_dir)
+    else:
+        cwd = os.path.dirname(program_path)
+    env = None
+    if launch.env:
+        env = {name: expand(value) for name, value in launch.env.items()}
+    return LaunchPlan(
+        argv=tuple(argv), cwd=cwd, shell=launch.shell == True, env=env, check_work_dir=launch.work_dir is not None
+    )
+
+
+def check_launch_plan(plan: LaunchPlan, stat_cache: Optional[StatCache] = None) -> None:
+    """!
+    @brief 起動の計画のパスを検証する
+    @param[in] plan 起動の計画
+    @param[in] stat_cache パスの種類のキャッシュ。Noneの場合は毎回検証する
+    @exception LaunchError プログラムまたは作業ディレクトリが見つからない
+    @detail キャッシュの「存在しない」という結果は使わずに再検証する。
+    """
+    if stat_cache is not None:
+        isfile = functools.partial(stat_cache.isfile, refresh_missing=True)
+        isdir = functools.partial(stat_cache.isdir, refresh_missing=True)
+    else:
+        isfile = os.path.isfile
+        isdir = os.path.isdir
+    if isfile(plan.argv[0]) == False:
+        raise LaunchError(f"ファイルが見つかりません。\nprogram_path={plan.argv[0]}")
+    if plan.check_work_dir and isdir(plan.cwd) == False:
+        raise LaunchError(f"ディレクトリが見つかりません。\nwork_dir={plan.cwd}")
+
+
+def prepare_launch(launch: Launch, expand: Callable[[str], str], stat_cache: Optional[StatCache] = None) -> LaunchPlan:
+    """!
+    @brief アプリケーションの起動の準備。変数の展開とパスの検証
+    @param[in] launch アプリケーション情報
+    @param[in] expand 変数の展開関数
+    @param[in] stat_cache パスの種類のキャッシュ。Noneの場合は毎回検証する
+    @return 起動の計画
+    @exception LaunchError プログラムまたは作業ディレクトリが見つからない
+    """
+    plan = compile_launch(launch, expand)
+    check_launch_plan(plan, stat_cache)
+    return plan
+
+
+class LaunchPlanner:
+    """!
+    @brief 起動の計画のキャッシュ
+    @detail キーごとに、アプリケーション情報が同じ(同一のオブジェクト)で、参照する環境変数の値が変わっていない間は
+    作成済みの計画を使う。変数が変わった場合は、新しい変数の展開関数で作り直す(インスタンスごと置き換える)。
+    他のスレッドから呼び出してよい。
+    """
+
+    def __init__(self, expand: Callable[[str], str], variables: Iterable[str] = ()):
+        self.expand = expand  # 変数の展開関数
+        self.variables = frozenset(variables)  # 設定変数の名前。環境変数を参照しない
+        # キー:(アプリケーション情報, 計画, 作成時の(変数名, 環境変数の値))
+        self.plans: dict[str, tuple[Launch, LaunchPlan, tuple[tuple[str, Optional[str]], ...]]] = {}
+
+    def get(self, key: str, launch: Launch) -> LaunchPlan:
+        """!
+        @brief 起動の計画
+        @param[in] key キー
+        @param[in] launch アプリケーション情報
+        @return 起動の計画。未作成、アプリケーション情報が変わった、または参照する環境変数が変わった場合は作成する
+        @detail variablesに無い変数名は環境変数を参照したものとして扱う。
+        """
+        entry = self.plans.get(key)
+        if entry is not None and entry[0] is launch:
+            if all(os.environ.get(name) == value for name, value in entry[2]):  # 環境変数の変更なし?
+                return entry[1]
+        env_values: dict[str, Optional[str]] = {}  # 展開前の環境変数の値
+
+        def expand(s: str) -> str:
+            for name in VariableExpander.PATTERN.findall(s):
+                if name not in self.variables:
+                    env_values.setdefault(name, os.environ.get(name))
+            return self.expand(s)
+
+        plan = compile_launch(launch, expand)
+        self.plans[key] = (launch, plan, tuple(env_values.items()))
+        return plan
+
+    def discard(self, key: str) -> None:
+        self.plans.pop(key, None)
+
+
+def validate_launches(
+    launch_dict: dict[str, Launch],
+    expand: Callable[[str], str],
+    stat_cache: StatCache,
+    planner: Optional[LaunchPlanner] = None,
+) -> set[str]:
+    """!
+    @brief 全てのアプリケーション情報のパスを検証する
+    @param[in] launch_dict アプリケーション情報
+    @param[in] expand 変数の展開関数
+    @param[in] stat_cache パスの種類のキャッシュ。検証結果を格納する
+    @param[in] planner 起動の計画のキャッシュ。検証と同時に計画を作成する。expandと同じ展開関数を使うこと
+    @return プログラムまたは作業ディレクトリが見つからないキーの集合
+    """
+    if planner is None:
+        planner = LaunchPlanner(expand)
+    broken_keys = set()
+    for key, launch in list(launch_dict.items()):
+        if launch.group is not None:  # グループは起動時にメンバーを検証する
+            continue
+        plan = planner.get(key, launch)
+        if not stat_cache.isfile(plan.argv[0]):
+            broken_keys.add(key)
+        elif plan.check_work_dir and not stat_cache.isdir(plan.cwd):
+            broken_keys.add(key)
+    return broken_keys
+
+
+def spawn_launch(plan: LaunchPlan):
+    """!
+    @brief アプリケーションを起動する
+    @param[in] plan 起動の計画
+    @return subprocess.Popen
+    @exception LaunchError 起動の失敗
+    @detail Windows以外は新しいセッションで起動する(ランチャの端末やシグナルの影響を受けない)。
+    _posixsubprocessはvfork()で起動するので、os.posix_spawn()と同程度に速い(作業ディレクトリを指定できる)。
+    環境変数の指定がある場合は、起動時の環境変数に統合する。
+    """
+    import subprocess
+
+    env = None
+    if plan.env:
+        env = dict(os.environ)
+        env.update(plan.env)
+    try:
+        if sys.platform == "win32":
+            return subprocess.Popen(list(plan.argv), cwd=plan.cwd, shell=plan.shell, env=env)
+        return subprocess.Popen(
+            list(plan.argv), cwd=plan.cwd, shell=plan.shell, env=env, close_fds=True, start_new_session=True
+        )
+    except Exception as e:
+        raise LaunchError(f"その他エラー。\n詳細:{e}") from e
+
+
+def launch_by_key(config: "Config", key: str):
+    """!
+    @brief キーのアプリケーションを起動する。画面を使わない起動
+    @param[in] config 設定
+    @param[in] key キー
+    @return subprocess.Popen。グループの場合はNone
+    @exception LaunchError キーまたはプログラム,作業ディレクトリが見つからない,起動の失敗
+    @detail グループの場合は全てのメンバーの起動を待つ。
+    """
+    launch = config.launch_dict.get(key)
+    if launch is None:
+        raise LaunchError(f"キーが見つかりません。\nkey={key}")
+    expand = VariableExpander(config.variable_list).expand
+    if launch.group is not None:
+        members = resolve_launch_group(config.launch_dict, key)
+        results: queue.SimpleQueue = queue.SimpleQueue()
+        launcher = Launcher(lambda func, *args: func(*args))
+        launcher.submit_group(key, members, launch.group_parallel, expand, lambda key, error: results.put(error))
+        error = results.get()
+        launcher.shutdown()
+        if error is not None:
+            raise LaunchError(error)
+        return None
+    return spawn_launch(prepare_launch(launch, expand))
+
+
+def resolve_launch_group(launch_dict: dict[str, Launch], key: str) -> list[tuple[str, Launch, int]]:
+    """!
+    @brief グループのメンバーの一覧
+    @param[in] launch_dict アプリケーション情報
+    @param[in] key グループのキー
+    @return (名前, アプリケーション情報, 待ち時間[ms])の一覧。名前はキー、直接指定したアプリケーション情報は"キー[番号]"
+    @exception LaunchError キーが見つからない,グループの循環参照,メンバーの指定なし
+    @detail メンバーがグループの場合は、そのメンバーに展開する(待ち時間は加算する)。
+    """
+    members = []
+
+    def add(key: str, delay: int, path: tuple[str, ...]) -> None:
+        launch = launch_dict.get(key)
+        if launch is None:
+            raise LaunchError(f"キーが見つかりません。\nkey={key}")
+        if launch.group is None:
+            members.append((key, launch, delay))
+            return
+        if key in path:
+            raise LaunchError(f"グループが循環しています。\nkey={'→'.join(path + (key,))}")
+        for i, member in enumerate(launch.group):
+            if isinstance(member, str):
+                add(member, delay, path + (key,))
+            elif member.key is not None:
+                add(member.key, delay + member.delay, path + (key,))
+            elif member.launch is not None:
+                members.append((f"{key}[{i}]", member.launch, delay + member.delay))
+            else:
+                raise LaunchError(f"グループのメンバーにkeyまたはlaunchがありません。\nkey={key}[{i}]")
+
+    add(key, 0, ())
+    return members
+
+
+def format_group_result(key: str, results: list[tuple[str, Optional[str]]]) -> Optional[str]:
+    """!
+    @brief グループの起動結果のメッセージ
+    @param[in] key グループのキー
+    @param[in] results メンバーの順の(名前, エラーメッセージ(成功時はNone))。同じ名前のメンバーは別々に表示する
+    @return 全てのメンバーの結果。全て成功した場合はNone
+    """
+    if all(error is None for _, error in results):
+        return None
+    lines = [f"グループの一部のアプリケーションを起動できませんでした。\nkey={key}", ""]
+    for name, error in results:
+        if error is None:
+            lines.append(f"○ {name}")
+        else:
+            lines.append(f"× {name}: " + error.replace("\n", " "))
+    return "\n".join(lines)
+
+
+@dataclass(kw_only=True, eq=False)
+class ProcessRecord:
+    key: tuple[str, str]  # (起動元の設定ファイル, launch_dictのキー)
+    process: Any  # subprocess.Popen
+    pid: int  # プロセスID
+    spawn_time: float  # 起動時刻(time.time())
+    exit_time: Optional[float] = None  # 終了を検出した時刻(time.time())
+    returncode: Optional[int] = None  # 終了コード。Noneは実行中
+
+
+class ProcessRegistry:
+    """!
+    @brief 起動したプロセスの管理
+    @detail キーごとに実行中のプロセスを保持する。キーは(起動元の設定ファイル, launch_dictのキー)で、
+    プロファイルごとに区別する。終了したプロセスは専用のスレッドで回収(reap)し、終了コードを記録する。
+    回収用のスレッドは実行中のプロセスがある間だけ一定間隔で確認する。
+    """
+
+    def __init__(self, interval: float = 0.5, history: int = 100):
+        self.interval = interval  # 終了の確認間隔[秒]
+        self.running: dict[tuple[str, str], list[ProcessRecord]] = {}  # キー:実行中のプロセス。起動順
+        self.exited: collections.deque = collections.deque(maxlen=history)  # 終了したプロセス。終了順
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)  # プロセスの追加または停止
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = False
+
+    def add(self, key: tuple[str, str], process: Any) -> ProcessRecord:
+        """!
+        @brief 起動したプロセスを登録する
+        @param[in] key (起動元の設定ファイル, launch_dictのキー)
+        @param[in] process subprocess.Popen
+        @return 登録したプロセス
+        """
+        record = ProcessRecord(key=key, process=process, pid=process.pid, spawn_time=time.time())
+        with self.changed:
+            self.running.setdefault(key, []).append(record)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="ProcessRegistry", daemon=True)
+                self.thread.start()
+            self.changed.notify()
+        return record
+
+    def alive(self, key: tuple[str, str]) -> Optional[ProcessRecord]:
+        """!
+        @brief キーの実行中のプロセス
+        @param[in] key (起動元の設定ファイル, launch_dictのキー)
+        @return 最後に起動した実行中のプロセス。無い場合はNone
+        @detail 回収用のスレッドの確認を待たずに、終了したプロセスを回収してから調べる。
+        """
+        self.reap(key)
+        with self.lock:
+            records = self.running.get(key)
+            return records[-1] if records else None
+
+    def reap(self, key: Optional[tuple[str, str]] = None) -> list[ProcessRecord]:
+        """!
+        @brief 終了したプロセスを回収する
+        @param[in] key (起動元の設定ファイル, launch_dictのキー)。Noneの場合は全てのキー
+        @return 回収したプロセス
+        """
+        with self.lock:
+            keys = list(self.running) if key is None else [key]
+            records = [record for k in keys for record in self.running.get(k, ())]
+        exited = []
+        for record in records:
+            returncode = record.process.poll()  # 終了済みの場合は回収する(ゾンビプロセスを残さない)
+            if returncode is not None:
+                record.returncode = returncode
+                record.exit_time = time.time()
+                exited.append(record)
+        result = []
+        with self.lock:
+            for record in exited:
+                records = self.running.get(record.key)
+                if records is None or record not in records:  # 他のスレッドが回収済み
+                    continue
+                records.remove(record)
+                if len(records) == 0:
+                    del self.running[record.key]
+                self.exited.append(record)
+                result.append(record)
+        return result
+
+    def run(self) -> None:
+        while True:
+            with self.changed:
+                while len(self.running) == 0 and not self.stopped:  # 実行中のプロセスが無い間は待つ
+                    self.changed.wait()
+                if self.stopped:
+                    return
+                self.changed.wait(self.interval)
+                if self.stopped:
+                    return
+            self.reap()
+
+    def stop(self) -> None:
+        """!
+        @brief 回収用のスレッドを停止する。プロセスは終了させない
+        """
+        with self.changed:
+            self.stopped = True
+            self.changed.notify()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+
+
+def focus_process_window(pid: int) -> bool:
+    """!
+    @brief プロセスのウィンドウを前面に表示する
+    @param[in] pid プロセスID
+    @retval True 表示した
+    @retval False ウィンドウが無い、表示に失敗した、またはWindows以外
+    @detail 表示中のトップレベルウィンドウのうち最初に見つかったものを表示する。
+    """
+    if sys.platform != "win32":
+        return False
+    import win32con
+    import win32gui
+    import win32process
+
+    hwnds = []
+
+    def callback(hwnd, _) -> bool:
+        if win32gui.IsWindowVisible(hwnd) and win32process.GetWindowThreadProcessId(hwnd)[1] == pid:
+            hwnds.append(hwnd)
+        return True
+
+    try:
+        win32gui.EnumWindows(callback, None)
+        if len(hwnds) == 0:
+            return False
+        win32gui.ShowWindow(hwnds[0], win32con.SW_RESTORE)
+        win32gui.SetForegroundWindow(hwnds[0])
+    except Exception:  # 別のプロセスが前面にある場合など
+        return False
+    return True
+
+
+@dataclass(kw_only=True, eq=False)
+class Speculation:
+    key: str  # キー
+    launch: Launch  # アプリケーション情報
+    expand: Callable[[str], str]  # 変数の展開関数
+    plan: LaunchPlan  # 検証済みの起動の計画
+    time: float  # 準備した時刻(time.monotonic())
+
+
+def warm_up_file(path: str, max_bytes: int, cancelled: Callable[[], bool] = lambda: False) -> int:
+    """!
+    @brief ファイルをOSのページキャッシュに読み込む
+    @param[in] path ファイル
+    @param[in] max_bytes 読み込む最大サイズ[byte]
+    @param[in] cancelled 中止する場合にTrueを返す関数。読み込みの単位ごとに確認する
+    @return 読み込んだ(または先読みを依頼した)サイズ[byte]
+    @detail posix_fadviseがある場合は先読みを依頼するだけで待たない。無い場合(Windows)は読み込んで捨てる。
+    読み込めない場合は0。
+    """
+    chunk_size = 1024 * 1024
+    try:
+        with open(path, mode="rb", buffering=0) as f:
+            size = min(os.fstat(f.fileno()).st_size, max_bytes)
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, size, os.POSIX_FADV_WILLNEED)
+                return size
+            total = 0
+            while total < size and not cancelled():
+                data = f.read(min(chunk_size, size - total))
+                if not data:
+                    break
+                total += len(data)
+            return total
+    except OSError:
+        return 0
+
+
+class LaunchSpeculator:
+    """!
+    @brief アプリケーションの起動の投機的な準備
+    @detail 入力したキーが一意に一致した時点で、変数の展開,パスの検証,コマンドの作成と実行ファイルの先読みを
+    専用のスレッドで行う。Returnでの起動は準備した結果(検証済みのLaunchPlan)を使い、Popenだけを呼び出す。
+    一致が変わった場合は準備を中止する。先読みはmax_bytesまで。
+    """
+
+    PLAN_TTL = 30.0  # 準備した結果の有効期間[秒]。パスの検証結果が古くなる
+
+    def __init__(self, stat_cache: Optional[StatCache] = None, max_bytes: int = 32 * 1024 * 1024):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.stat_cache = stat_cache  # パスの種類のキャッシュ
+        self.max_bytes = max_bytes  # 先読みする最大サイズ[byte]
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="LaunchSpeculator")
+        self.lock = threading.Lock()
+        self.generation = 0  # 準備の世代。中止するたびに増やす
+        self.key: Optional[str] = None  # 準備中または準備済みのキー
+        self.launch: Optional[Launch] = None
+        self.speculation: Optional[Speculation] = None  # 準備した結果
+        # started:準備の開始,ready:準備の完了,hits:起動に使用,misses:起動時に準備が未完了,
+        # wasted:一致が変わって中止,errors:パスが見つからないなど,bytes:先読みしたサイズ
+        self.counters = {"started": 0, "ready": 0, "hits": 0, "misses": 0, "wasted": 0, "errors": 0, "bytes": 0}
+
+    def speculate(self, key: str, launch: Launch, expand: Callable[[str], str]) -> None:
+        """!
+        @brief 起動の準備を開始する。UIのスレッドから呼び出す
+        @param[in] key キー
+        @param[in] launch アプリケーション情報
+        @param[in] expand 変数の展開関数
+        @detail 同じキーを準備中または準備済みの場合は何もしない。
+        """
+        with self.lock:
+            if self.key == key and self.launch is launch:
+                return
+            self.discard()
+            self.generation += 1
+            self.key = key
+            self.launch = launch
+            self.counters["started"] += 1
+            generation = self.generation
+        self.executor.submit(self.run, generation, key, launch, expand)
+
+    def cancel(self) -> None:
+        """!
+        @brief 準備を中止する。一致が無くなった場合
+        """
+        with self.lock:
+            self.discard()
+
+    def discard(self) -> None:
+        # lockを取得して呼び出す
+        if self.key is not None:
+            self.counters["wasted"] += 1
+        self.generation += 1
+        self.key = None
+        self.launch = None
+        self.speculation = None
+
+    def run(self, generation: int, key: str, launch: Launch, expand: Callable[[str], str]) -> None:
+        # 準備用のスレッド
+        def cancelled() -> bool:
+            return generation != self.generation
+
+        if cancelled():
+            return
+        try:
+            plan = prepare_launch(launch, expand, self.stat_cache)
+        except Exception:  # 起動時にもう一度検証してエラーを表示する
+            with self.lock:
+                self.counters["errors"] += 1
+            return
+        if cancelled():
+            return
+        size = warm_up_file(plan.argv[0], self.max_bytes, cancelled)
+        speculation = Speculation(key=key, launch=launch, expand=expand, plan=plan, time=time.monotonic())
+        with self.lock:
+            self.counters["bytes"] += size
+            if not cancelled():
+                self.speculation = speculation
+                self.counters["ready"] += 1
+
+    def take(self, key: str, launch: Launch, expand: Callable[[str], str]) -> Optional[LaunchPlan]:
+        """!
+        @brief 準備した結果を取り出す。起動時に呼び出す
+        @param[in] key キー
+        @param[in] launch アプリケーション情報
+        @param[in] expand 変数の展開関数
+        @return 準備した結果。準備していない、未完了、または古い場合はNone
+        @detail 準備中の場合は中止する(呼び出し元で準備する)。他のスレッドから呼び出してよい。
+        """
+        with self.lock:
+            if self.key != key:
+                return None
+            speculation = self.speculation
+            self.key = None  # 使用済み。wastedに数えない
+            self.discard()
+            if speculation is None or speculation.launch is not launch or speculation.expand != expand:
+                self.counters["misses"] += 1
+                return None
+            if time.monotonic() - speculation.time > self.PLAN_TTL:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            return speculation.plan
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.counters)
+
+    def shutdown(self) -> None:
+        self.cancel()
+        self.executor.shutdown(wait=False)
+
+
+class Launcher:
+    """!
+    @brief アプリケーションの非同期起動
+    @detail 起動の準備と起動をワーカースレッドで行い、結果をpost()でUIのスレッドに通知する。
+    同じキーのアプリケーションを起動中の場合は受け付けない。グループはsubmit_group()で起動する。
+    キーはscope(起動元の設定ファイル)ごとに区別する。別のプロファイルの同じキーは別のアプリケーションとして扱う。
+    registryを指定した場合は起動したプロセスを登録し、single_instanceのアプリケーションは実行中なら起動しない。
+    speculatorを指定した場合は、準備済みの結果があれば使用する。
+    """
+
+    def __init__(
+        self,
+        post: Callable[..., None],
+        max_workers: int = 4,
+        stat_cache: Optional[StatCache] = None,
+        metrics: Optional[Metrics] = None,
+        registry: Optional[ProcessRegistry] = None,
+        speculator: Optional[LaunchSpeculator] = None,
+    ):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.post = post  # post(func, *args) funcをUIのスレッドで実行する
+        self.registry = registry  # 起動したプロセス。Noneの場合は管理しない
+        self.speculator = speculator  # 起動の投機的な準備。Noneの場合は使わない
+        self.stat_cache = stat_cache  # パスの種類のキャッシュ
+        self.metrics = metrics if metrics is not None else Metrics()  # 変数の展開と起動の処理時間
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="Launcher")
+        self.pending: set[tuple[str, str]] = set()  # 起動中の(scope, キー)。UIのスレッドだけで更新する
+
+    def submit(
+        self,
+        key: str,
+        launch: Launch,
+        expand: Callable[[str], str],
+        on_done: Callable[[str, Optional[str]], None],
+        planner: Optional[LaunchPlanner] = None,
+        scope: str = "",
+    ) -> bool:
+        """!
+        @brief 起動を依頼する。UIのスレッドから呼び出す
+        @param[in] key キー
+        @param[in] launch アプリケーション情報
+        @param[in] expand 変数の展開関数
+        @param[in] on_done 起動後にUIのスレッドで呼び出す関数。on_done(key, エラーメッセージ(成功時はNone))
+        @param[in] planner 起動の計画のキャッシュ。expandと同じ展開関数を使うこと。Noneの場合は毎回作成する
+        @param[in] scope 起動元の設定ファイル。起動中のキーと起動したプロセスをscopeごとに区別する
+        @retval True 受け付けた
+        @retval False 同じキーのアプリケーションを起動中
+        """
+        if (scope, key) in self.pending:
+            return False
+        self.pending.add((scope, key))
+        self.executor.submit(self.run, key, launch, expand, on_done, planner, scope)
+        return True
+
+    def submit_group(
+        self,
+        key: str,
+        members: list[tuple[str, Launch, int]],
+        parallel: Optional[int],
+        expand: Callable[[str], str],
+        on_done: Callable[[str, Optional[str]], None],
+        planner: Optional[LaunchPlanner] = None,
+        scope: str = "",
+    ) -> bool:
+        """!
+        @brief グループの起動を依頼する。UIのスレッドから呼び出す
+        @param[in] key グループのキー
+        @param[in] members メンバーの一覧。resolve_launch_group()の値
+        @param[in] parallel 同時起動数。Noneの場合はLAUNCH_GROUP_PARALLEL
+        @param[in] expand 変数の展開関数
+        @param[in] on_done 全てのメンバーの起動後にUIのスレッドで呼び出す関数。
+        on_done(key, 全てのメンバーの結果のメッセージ(全て成功した場合はNone))
+        @param[in] planner 起動の計画のキャッシュ。expandと同じ展開関数を使うこと。Noneの場合は毎回作成する
+        @param[in] scope 起動元の設定ファイル。起動中のキーと起動したプロセスをscopeごとに区別する
+        @retval True 受け付けた
+        @retval False 同じキーのグループを起動中
+        """
+        if (scope, key) in self.pending:
+            return False
+        self.pending.add((scope, key))
+        parallel = parallel if parallel is not None else LAUNCH_GROUP_PARALLEL
+        self.executor.submit(self.run_group, key, members, max(1, parallel), expand, on_done, planner, scope)
+        return True
+
+    def run(
+        self,
+        key: str,
+        launch: Launch,
+        expand: Callable[[str], str],
+        on_done: Callable,
+        planner: Optional[LaunchPlanner] = None,
+        scope: str = "",
+    ) -> None:
+        # ワーカースレッド
+        error = None
+        try:
+            plan = self.prepare(key, launch, expand, planner, scope)
+            if plan is not None:
+                self.spawn(key, plan, scope)
+        except LaunchError as e:
+            error = str(e)
+        except Exception as e:
+            error = f"その他エラー。\n詳細:{e}"
+        self.post(self.done, key, error, on_done, scope)
+
+    def run_group(
+        self,
+        key: str,
+        members: list[tuple[str, Launch, int]],
+        parallel: int,
+        expand: Callable[[str], str],
+        on_done: Callable,
+        planner: Optional[LaunchPlanner] = None,
+        scope: str = "",
+    ) -> None:
+        # ワーカースレッド。全てのメンバーを検証してから、parallel個ずつ同時に起動する
+        from concurrent.futures import ThreadPoolExecutor
+
+        # メンバーの順のエラーメッセージ。同じキーのメンバーがあるので番号で区別する
+        results: list[Optional[str]] = [None] * len(members)
+        commands = []  # (番号, 名前, 起動の計画, 待ち時間[ms])
+        for index, (name, launch, delay) in enumerate(members):
+            try:
+                plan = self.prepare(name, launch, expand, planner, scope)
+                if plan is not None:
+                    commands.append((index, name, plan, delay))
+            except Exception as e:
+                results[index] = str(e) if isinstance(e, LaunchError) else f"その他エラー。\n詳細:{e}"
+        commands.sort(key=lambda command: command[3])  # 待ち時間の短い順に起動する
+        start_time = time.monotonic()
+
+        def spawn_member(index: int, name: str, plan: LaunchPlan, delay: int) -> Optional[str]:
+            wait = start_time + delay / 1000 - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                self.spawn(name, plan, scope)
+            except LaunchError as e:
+                return str(e)
+            except Exception as e:
+                return f"その他エラー。\n詳細:{e}"
+            return None
+
+        with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="LaunchGroup") as pool:
+            errors = pool.map(lambda command: spawn_member(*command), commands)
+            for (index, _, _, _), error in zip(commands, errors):
+                results[index] = error
+        message = format_group_result(key, [(name, error) for (name, _, _), error in zip(members, results)])
+        self.post(self.done, key, message, on_done, scope)
+
+    def prepare(
+        self,
+        key: str,
+        launch: Launch,
+        expand: Callable[[str], str],
+        planner: Optional[LaunchPlanner] = None,
+        scope: str = "",
+    ) -> Optional[LaunchPlan]:
+        """!
+        @brief 起動の準備。ワーカースレッドで呼び出す
+        @param[in] key キー
+        @param[in] launch アプリケーション情報
+        @param[in] expand 変数の展開関数
+        @param[in] planner 起動の計画のキャッシュ。Noneの場合は計画を作成する
+        @param[in] scope 起動元の設定ファイル
+        @return 検証済みの起動の計画。single_instanceで実行中の場合はNone
+        @exception LaunchError プログラムまたは作業ディレクトリが見つからない
+        @detail single_instanceで実行中の場合は、起動せずにウィンドウを表示する。準備済みの結果があれば使う。
+        """
+        if launch.single_instance and self.registry is not None:
+            record = self.registry.alive((scope, key))
+            if record is not None:
+                focus_process_window(record.pid)
+                return None
+        plan = self.speculator.take(key, launch, expand) if self.speculator is not None else None
+        if plan is not None:  # 検証済み
+            return plan
+        metrics = self.metrics
+        start_time = time.perf_counter() if metrics.enabled else 0.0
+        plan = planner.get(key, launch) if planner is not None else compile_launch(launch, expand)
+        if metrics.enabled:
+            metrics.add("expand", start_time)
+        check_launch_plan(plan, self.stat_cache)
+        return plan
+
+    def spawn(self, key: str, plan: LaunchPlan, scope: str = "") -> None:
+        """!
+        @brief 起動の計画のとおりに起動する。ワーカースレッドで呼び出す
+        @exception LaunchError 起動の失敗
+        """
+        metrics = self.metrics
+        try:
+            start_time = time.perf_counter() if metrics.enabled else 0.0
+            process = spawn_launch(plan)
+            if metrics.enabled:
+                metrics.add("spawn", start_time)
+        except LaunchError:
+            if self.stat_cache is not None:  # キャッシュが古い可能性がある
+                self.stat_cache.invalidate(plan.argv[0])
+            raise
+        if self.registry is not None:
+            self.registry.add((scope, key), process)
+
+    def done(self, key: str, error: Optional[str], on_done: Callable, scope: str = "") -> None:
+        # UIのスレッド
+        self.pending.discard((scope, key))
+        on_done(key, error)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+class FuzzyIndex:
+    """!
+    @brief キーとタイトルのあいまい検索用インデックス
+    @detail 順位はキーの前方一致 > キーの部分一致 > タイトルの部分一致 > キーの部分列 > タイトルの部分列。同順位は登録順。
+    大文字と小文字は区別しない。
+    文字ごとに、その文字を含むエントリのビット集合(int)を作成して記憶する。検索文字列の全ての文字のビット集合の積で
+    候補を絞り込んでから照合する。部分一致と部分列は、全エントリを連結した文字列を検索する。
+    """
+
+    SEPARATOR = "\0"  # エントリの区切り
+    SCAN_THRESHOLD = 2000  # 候補がこれより多い場合は連結した文字列を正規表現で検索する
+
+    def __init__(self, launch_dict: dict[str, Launch]):
+        self.keys: list[str] = list(launch_dict)
+        keys_lower = [key.lower() for key in self.keys]
+        titles_lower = [launch.title.lower() for launch in launch_dict.values()]
+        self.sorted_keys: list[tuple[str, int]] = sorted((key, i) for i, key in enumerate(keys_lower))
+        self.texts: list[str] = [key + self.SEPARATOR + title for key, title in zip(keys_lower, titles_lower)]
+        self.key_blob, self.key_offsets = self.join(keys_lower)
+        self.title_blob, self.title_offsets = self.join(titles_lower)
+        self.char_bits: dict[str, int] = {}  # 文字:その文字を含むエントリのビット集合
+
+    @classmethod
+    def join(cls, texts: list[str]) -> tuple[str, list[int]]:
+        """!
+        @brief 文字列を連結する
+        @return (連結した文字列, 各文字列の開始位置)
+        """
+        offsets = []
+        pos = 0
+        for text in texts:
+            offsets.append(pos)
+            pos += len(text) + 1
+        return cls.SEPARATOR.join(texts), offsets
+
+    def bits(self, c: str) -> int:
+        """!
+        @brief 文字cを含むエントリのビット集合
+        """
+        result = self.char_bits.get(c)
+        if result is None:
+            flags = bytes(c in text for text in self.texts)[::-1]  # 1:含む 0:含まない
+            result = int(flags.translate(bytes.maketrans(b"\0\1", b"01")) or b"0", 2)
+            self.char_bits[c] = result
+        return result
+
+    def warm_up(self, chars: str = "abcdefghijklmnopqrstuvwxyz0123456789") -> None:
+        """!
+        @brief よく使う文字のビット集合を事前に作成する
+        @detail 別スレッドから呼び出してよい。
+        """
+        for c in chars:
+            self.bits(c)
+
+    def candidates(self, query: str) -> int:
+        """!
+        @brief 照合の候補
+        @param[in] query 検索文字列(小文字)
+        @return 候補のエントリのビット集合
+        """
+        result = (1 << len(self.keys)) - 1
+        for c in set(query):
+            result &= self.bits(c)
+            if result == 0:
+                break
+        return result
+
+    @staticmethod
+    def find_all(blob: str, offsets: list[int], matcher: Callable[[int], int]) -> Iterable[int]:
+        """!
+        @brief 連結した文字列を検索し、一致したエントリの番号を順に返す
+        @param[in] matcher matcher(開始位置)は一致した位置を返す。一致しない場合は-1
+        """
+        pos = matcher(0)
+        while pos >= 0:
+            i = bisect.bisect_right(offsets, pos) - 1
+            yield i
+            if i + 1 >= len(offsets):
+                break
+            pos = matcher(offsets[i + 1])
+
+    def search(self, query: str, limit: int = 100) -> list[str]:
+        """!
+        @brief あいまい検索
+        @param[in] query 検索文字列
+        @param[in] limit 最大件数
+        @return キーの一覧。順位順
+        """
+        query = query.lower()
+        result: dict[int, None] = {}  # 一致したエントリの番号。順位順
+        if query == "" or self.SEPARATOR in query:
+            return []
+        candidates = self.candidates(query)
+        if candidates == 0:
+            return []
+
+        def add(indexes: Iterable[int]) -> bool:
+            for i in indexes:
+                result.setdefault(i)
+                if len(result) >= limit:
+                    return True
+            return False
+
+        # キーの前方一致
+        lo = bisect.bisect_left(self.sorted_keys, (query,))
+        prefix_matches = []
+        for key, i in self.sorted_keys[lo:]:
+            if not key.startswith(query):
+                break
+            prefix_matches.append(i)
+        prefix_matches.sort()
+        if add(prefix_matches):
+            return [self.keys[i] for i in result]
+        # 部分一致
+        for blob, offsets in [(self.key_blob, self.key_offsets), (self.title_blob, self.title_offsets)]:
+            if add(self.find_all(blob, offsets, lambda pos: blob.find(query, pos))):
+                return [self.keys[i] for i in result]
+        # 部分列
+        pattern = re.compile(f"[^{self.SEPARATOR}]*?".join(map(re.escape, query)))
+        if candidates.bit_count() <= self.SCAN_THRESHOLD:  # 候補だけを照合
+            digits = format(candidates, "b")[::-1]
+            indexes = [i for i, digit in enumerate(digits) if digit == "1"]
+            key_matches = [i for i in indexes if pattern.search(self.texts[i], 0, len(self.keys[i]))]
+            title_matches = [i for i in indexes if pattern.search(self.texts[i], len(self.keys[i]) + 1)]
+            add(key_matches) or add(title_matches)
+        else:
+            for blob, offsets in [(self.key_blob, self.key_offsets), (self.title_blob, self.title_offsets)]:
+
+                def matcher(pos: int) -> int:
+                    m = pattern.search(blob, pos)
+                    return -1 if m is None else m.start()
+
+                if add(self.find_all(blob, offsets, matcher)):
+                    break
+        return [self.keys[i] for i in result]
+
+
+class UsageStore:
+    """!
+    @brief アプリケーションの起動履歴。frecency(頻度と最近度)による順位付け
+    @detail 履歴ファイルは追記のみで、1行が1回の起動("時刻\tキー")。行数が上限を超えたらキーごとに集約する
+    ("時刻\tキー\t重み")。スコアは重みを半減期HALF_LIFEで減衰させた合計。
+    ファイルの読み書きは専用のスレッドで順番に行う。
+    """
+
+    HALF_LIFE = 14 * 24 * 3600  # スコアの半減期[秒]
+
+    def __init__(self, path: str, *, max_lines: int = 10000, max_keys: int = 5000):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.path = path  # 履歴ファイル
+        self.max_lines = max_lines  # 集約する行数
+        self.max_keys = max_keys  # 集約後に残すキーの数
+        self.entries: dict[str, tuple[float, float]] = {}  # キー:(最終時刻, 最終時刻でのスコア)
+        self.rank_values: dict[str, float] = {}  # キー:順位付けの値。大きいほど上位
+        self.lines = 0  # 履歴ファイルの行数
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="UsageStore")
+
+    def add(self, key: str, t: float, weight: float = 1.0) -> None:
+        last = self.entries.get(key)
+        if last is None:
+            score = weight
+        elif t >= last[0]:
+            score = last[1] * 2 ** ((last[0] - t) / self.HALF_LIFE) + weight
+        else:  # 古い時刻
+            score = last[1] + weight * 2 ** ((t - last[0]) / self.HALF_LIFE)
+            t = last[0]
+        self.entries[key] = (t, score)
+        # log2(時刻nowでのスコア) = log2(score) + (t - now) / HALF_LIFE なので、nowに依存しない値で比較できる
+        self.rank_values[key] = math.log2(score) + t / self.HALF_LIFE
+
+    def load(self) -> None:
+        """!
+        @brief 履歴ファイルを読み込む
+        """
+        try:
+            with open(self.path, mode="r", encoding="utf-8") as f:
+                data = f.read()
+        except OSError:
+            return
+        lines = data.splitlines()
+        entries = self.entries
+        half_life = self.HALF_LIFE
+        for line in lines:
+            fields = line.split("\t")
+            try:
+                t = float(fields[0])
+                key = fields[1]
+                weight = float(fields[2]) if len(fields) >= 3 else 1.0
+            except (IndexError, ValueError):  # 書き込み途中の行など
+                continue
+            last = entries.get(key)
+            if last is None:
+                entries[key] = (t, weight)
+            elif t >= last[0]:
+                entries[key] = (t, last[1] * 2 ** ((last[0] - t) / half_life) + weight)
+            else:
+                entries[key] = (last[0], last[1] + weight * 2 ** ((t - last[0]) / half_life))
+        self.rank_values = {key: math.log2(score) + t / half_life for key, (t, score) in entries.items()}
+        self.lines += len(lines)
+
+    def load_async(self) -> None:
+        self.executor.submit(self.load)
+
+    def append(self, key: str, t: float) -> None:
+        """!
+        @brief 起動を記録する
+        @param[in] key キー
+        @param[in] t 時刻(time.time())
+        """
+        self.add(key, t)
+        try:
+            with open(self.path, mode="a", encoding="utf-8") as f:
+                f.write(f"{t:.0f}\t{key}\n")
+        except OSError:
+            return
+        self.lines += 1
+        if self.lines > self.max_lines:
+            self.compact()
+
+    def record(self, key: str) -> None:
+        """!
+        @brief 起動を記録する。ファイルへの書き込みは専用のスレッドで行う
+        """
+        self.executor.submit(self.append, key, time.time())
+
+    def compact(self) -> None:
+        """!
+        @brief 履歴ファイルをキーごとに集約する。スコアの低いキーは削除する
+        """
+        keys = sorted(self.rank_values, key=self.rank_values.__getitem__, reverse=True)[: self.max_keys]
+        entries = {key: self.entries[key] for key in keys}
+        try:
+            with open(self.path + ".tmp", mode="w", encoding="utf-8") as f:
+                for key, (t, score) in entries.items():
+                    f.write(f"{t:.0f}\t{key}\t{score:.6g}\n")
+            os.replace(self.path + ".tmp", self.path)
+        except OSError:
+            return
+        self.entries = entries
+        self.rank_values = {key: self.rank_values[key] for key in keys}
+        self.lines = len(entries)
+
+    def rank(self, keys: list[str]) -> list[str]:
+        """!
+        @brief キーを順位順に並べ替える
+        @param[in] keys キーの一覧
+        @return 起動履歴のあるキーをスコア順に先頭に移動した一覧。それ以外は元の順番
+        """
+        rank_values = self.rank_values
+        used = [key for key in keys if key in rank_values]
+        if len(used) == 0:
+            return keys
+        used.sort(key=lambda key: rank_values.get(key, 0.0), reverse=True)
+        used_set = set(used)
+        return used + [key for key in keys if key not in used_set]
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+
 class MainWindow(tkinter.Tk):
     """!
     @brief メインウィンド
     """
 
-    def __init__(self, *, config_path: str = ""):
+    UI_QUEUE_POLL_INTERVAL = 200  # call_in_ui()のキューの確認間隔[ms]。仮想イベントを送信できなかった場合用
+    PROFILE_LOAD_DELAY = 200  # 起動から他のプロファイルの読み込みを開始するまでの時間[ms]
+    INSTANCE_LAUNCH_TIMEOUT = 60  # 他プロセスから依頼された起動の結果の待ち時間[s]
+    PROFILE_ATTRS = (  # プロファイルごとの属性。切り替え時にProfile.stateと入れ替える
+        "config_path",
+        "config_data",
+        "config_file_data",
+        "config_paths",
+        "shard_cache",
+        "launch_index",
+        "fuzzy_index",
+        "variables",
+        "plans",
+        "broken_keys",
+        "validate_pending",
+        "config_writer",
+        "usage",
+    )
+
+    def __init__(
+        self,
+        *,
+        config_path: str = "",
+        profile_paths: Optional[list[str]] = None,
+        startup_profile: Optional[StartupProfile] = None,
+        instance_server: Optional["InstanceServer"] = None,
+        metrics: Optional[Metrics] = None,
+    ):
         super().__init__()
+        self.metrics = metrics if metrics is not None else Metrics()  # 処理時間の計測。設定のstatsでも有効になる
+        # 他のスレッドからの呼び出し(call_in_ui)。キューに入れて仮想イベントでTkのスレッドを起こす
+        self.ui_queue: queue.SimpleQueue = queue.SimpleQueue()  # (関数, 引数)
+        self.ui_wakeup_pending = False  # 仮想イベントを送信済み
+        self.bind("<<CallInUi>>", self.drain_ui_queue)
+        self.after(self.UI_QUEUE_POLL_INTERVAL, self.poll_ui_queue)
+        self.hotkey_time: Optional[float] = None  # 表示待ちのホットキーの入力時刻(time.perf_counter())
+        self.hotkey_latency = LatencyStats()  # ホットキーの入力からウィンドウの表示までの時間
         #
         self.config_path = config_path
-        self.config_data = Config()
+        self.profiles = [  # プロファイル。config_pathが最初のプロファイル
+            Profile(name=os.path.splitext(os.path.basename(path))[0], config_path=path)
+            for path in dict.fromkeys([config_path] + list(profile_paths or []))
+        ]
+        self.profile = self.profiles[0]  # 有効なプロファイル
+        self.profile_executor = None  # プロファイルの読み込み(concurrent.futures.ThreadPoolExecutor)
+        self.startup_profile = startup_profile  # 起動時間の計測。Noneの場合は計測しない
+        self.instance_server = instance_server  # 2重起動防止用のサーバ
+        self.config_data = Config()  # includeを統合した設定
+        self.config_file_data = Config()  # 設定ファイル自身の設定。config_write()で書き込む
+        self.config_paths: list[str] = [config_path]  # 設定ファイルとincludeのファイル
+        self.shard_cache: dict = {}  # includeのファイルのキャッシュ
+        self.launch_index = PrefixIndex()  # launch_dictのキーの前方一致検索用
+        self.fuzzy_index: Optional[FuzzyIndex] = None  # あいまい検索用。必要になった時に作成する
+        self.variables = VariableExpander()  # 変数の展開
+        # 起動の計画。変数を変更したら作り直す
+        self.plans = LaunchPlanner(self.variables.expand, self.variables.variables)
         self.launch_key: str = ""
+        self.launch_table_items: set[str] = set()  # 一覧表に作成済みの行ID(=キー)
+        self.stat_cache = StatCache()  # パスの種類のキャッシュ
+        self.broken_keys: set[str] = set()  # プログラムまたは作業ディレクトリが見つからないキー
+        self.validate_generation = 0  # 検証の世代。設定ファイルの読み込みとプロファイルの切り替えごとに更新する
+        self.validate_pending = 0  # 結果を待っている検証の件数。切り替えで中断した場合は0以外のまま残る
+        self.processes = ProcessRegistry()  # 起動したプロセス。全てのプロファイルで共有し、設定ファイルで区別する
+        self.speculator = LaunchSpeculator(self.stat_cache)  # 起動の投機的な準備(設定のspeculative_launch)
+        self.metrics.sources["speculation"] = self.speculator.stats
+        self.launcher = Launcher(  # アプリケーションの起動
+            self.call_in_ui,
+            stat_cache=self.stat_cache,
+            metrics=self.metrics,
+            registry=self.processes,
+            speculator=self.speculator,
+        )
+        self.exit_after_launch = False  # アプリケーションの起動後に終了する
+        self.config_writer = self.make_config_writer(config_path)  # 設定ファイルの書き込み
+        self.refresh_scheduled = False  # 一覧表の更新を予約済み
+        self.match_prefix: Optional[str] = None  # 前回の前方一致の検索文字列。Noneの場合は前回の結果を使わない
+        self.match_keys: list[str] = []  # 前回の前方一致の検索結果。順位順
         #
         self.key_event_modifier_last_time: int = 0  # 修飾キーの最終入力時刻
         self.key_event_character_last_time: int = 0  # 文字キーの最終入力時刻
@@ -82,98 +1707,334 @@ class MainWindow(tkinter.Tk):
         self.visiblility_time: datetime = datetime.now() # ウィンドウの表示時刻
         #
         self.config_read()
+        self.usage = UsageStore(self.config_path + ".usage")  # 起動履歴
+        self.usage.load_async()
+        if self.startup_profile is not None:
+            self.startup_profile.mark("config_read")
         self.MainWindow_load()
+        if self.startup_profile is not None:
+            self.startup_profile.mark("MainWindow_load")
+            self.after_idle(self.on_startup_first_paint)
         # ショートカットキーを登録
         if self.config_data.hotkey != "":
-            keyboard.add_hotkey(self.config_data.hotkey, self.show_window)
+            import keyboard
+
+            keyboard.add_hotkey(self.config_data.hotkey, self.show_window)  # keyboardのスレッドから呼び出される
+        # 設定ファイルの監視を開始
+        self.config_watcher: Optional[ConfigWatcher] = None
+        if self.config_data.watch_config:
+            self.config_watcher = ConfigWatcher(self.config_paths, self.on_config_file_changed)
+            self.config_watcher.start()
+        # 他プロセスからのコマンドの受信を開始
+        if self.instance_server is not None:
+            self.instance_server.start(self.on_instance_command)
+        # 他のプロファイルは最初の描画の後に読み込む
+        if len(self.profiles) > 1:
+            self.after(self.PROFILE_LOAD_DELAY, self.start_load_profiles)
 
     # ====================#
     # 外部インタフェース #
     # ====================#
 
+    def activate_window(self) -> None:
+        """!
+        @brief ウィンドウを表示してアクティブにする
+        """
+        self.deiconify()
+        self.lift()
+        self.focus_force()
+        if sys.platform == "win32":
+            import win32con
+            import win32gui
+
+            hwnd = int(self.wm_frame(), 16)
+            win32gui.ShowWindow(hwnd, win32con.SW_NORMAL)
+            win32gui.SetForegroundWindow(hwnd)
+
+    def instance_command(self, command: str) -> None:
+        """!
+        @brief 他プロセスからのコマンドを実行する
+        @param[in] command コマンド。"show":ウィンドウの表示,"profile NAME":NAMEのプロファイルに切り替え
+        @detail "launch"はinstance_launch()で実行する。
+        """
+        name, _, arg = command.partition(" ")
+        if name == "show":
+            self.activate_window()
+        elif name == "profile":
+            index = next((i for i, profile in enumerate(self.profiles) if profile.name == arg), None)
+            if index is None:
+                messagebox.showerror("エラー", f"プロファイルが見つかりません。\nprofile={arg}")
+                return
+            self.switch_profile(index)
+
+    def instance_launch(self, config_path: str, key: str, reply: Callable[[str], None]) -> None:
+        """!
+        @brief 他プロセス(--launch)から依頼されたアプリケーションを起動する
+        @param[in] config_path 依頼元の設定ファイルの絶対パス
+        @param[in] key キー
+        @param[in] reply 応答の送信。"ok":成功,"error\nメッセージ":失敗,"other":設定ファイルが異なる
+        @detail 有効なプロファイルの設定ファイルが異なる場合は起動しない(依頼元で起動する)。
+        エラーはメッセージボックスではなく依頼元に応答する。
+        """
+        if os.path.normcase(os.path.abspath(self.config_path)) != os.path.normcase(config_path):
+            reply("other")
+            return
+        launch = self.config_data.launch_dict.get(key)
+        if launch is None:
+            reply(f"error\nキーが見つかりません。\nkey={key}")
+            return
+
+        def on_result(error: Optional[str]) -> None:
+            reply("ok" if error is None else f"error\n{error}")
+
+        self.launch_key = key
+        self.exec_program(launch, key, on_result)
+
     # ==========#
     # 内部処理 #
     # ==========#
 
     def config_read(self):
         config_path = self.config_path
+        start_time = time.perf_counter()  # 設定で有効になる場合もあるので常に取得する
         # 設定ファイルの読み込み
-        if os.path.isfile(config_path) == False:
-            messagebox.showerror("エラー", f"設定ファイルが見つかりません。\nconfig={config_path}")
+        try:
+            loaded = load_config_files(config_path, self.shard_cache)
+        except ConfigError as e:
+            messagebox.showerror("エラー", str(e))
             return 1
-        with open(config_path, mode="r", encoding="utf-8") as f:
-            try:
-                json_dic = json.load(f)
-            except Exception as e:
-                messagebox.showinfo("エラー", f"設定ファイルの読み込みに失敗しました。\nconfig:{config_path}\n詳細:{e}")
-                return 1
-        config = from_dict(data_class=Config, data=json_dic)
+        config = loaded.config
+        if config.stats:
+            self.metrics.enabled = True
+        if self.metrics.enabled:
+            self.metrics.add("config_read", start_time)
         self.config_data = config
+        self.config_file_data = loaded.main
+        self.config_paths = loaded.paths
+        self.config_writer.loaded(loaded.main)
+        self.launch_index = PrefixIndex(config.launch_dict.keys())
+        self.fuzzy_index = None
+        self.match_prefix = None
+        self.variables = VariableExpander(config.variable_list)
+        self.plans = LaunchPlanner(self.variables.expand, self.variables.variables)
+        self.start_validate_launches()
+
+    def make_config_writer(self, config_path: str) -> "ConfigWriter":
+        return ConfigWriter(
+            config_path,
+            on_error=lambda message: self.call_in_ui(messagebox.showerror, "エラー", message),
+            metrics=self.metrics,
+        )
 
-    def config_write(self):
+    def start_load_profiles(self) -> None:
+        """!
+        @brief 有効でないプロファイルをバックグラウンドで並列に読み込む
+        @detail 起動時間に影響しないように、有効なプロファイルの表示後(PROFILE_LOAD_DELAY)に開始する。
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        profiles = [  # 未読み込みのプロファイル。切り替え時に読み込んだプロファイルは除く
+            profile
+            for profile in self.profiles
+            if profile is not self.profile and len(profile.state) == 0 and profile.future is None
+        ]
+        if len(profiles) == 0:
+            return
+        self.profile_executor = ThreadPoolExecutor(max_workers=min(4, len(profiles)), thread_name_prefix="Profile")
+        for profile in profiles:
+            profile.future = self.profile_executor.submit(load_profile, profile.config_path)
+
+    def switch_profile(self, index: int) -> bool:
+        """!
+        @brief 有効なプロファイルを切り替える
+        @param[in] index プロファイルの番号(profilesの添字)
+        @retval True 切り替えた
+        @retval False 有効なプロファイル、または設定ファイルの読み込みに失敗した
+        @detail 読み込み済みの設定と索引をMainWindowの属性と入れ替えるだけで、設定ファイルは読み込まない。
+        バックグラウンドで読み込み中の場合は完了を待つ。
+        """
+        profile = self.profiles[index]
+        previous = self.profile
+        if profile is previous:
+            return False
+        start_time = time.perf_counter() if self.metrics.enabled else 0.0
+        if len(profile.state) == 0:  # 未読み込み
+            try:
+                if profile.future is not None:
+                    profile.state = profile.future.result()
+                else:
+                    profile.state = load_profile(profile.config_path)
+            except ConfigError as e:
+                profile.future = None  # 次の切り替えで読み込み直す
+                messagebox.showerror("エラー", str(e))
+                return False
+        state = profile.state
+        if "config_writer" not in state:  # 初めて有効にする
+            state["config_writer"] = self.make_config_writer(profile.config_path)
+            state["config_writer"].loaded(state["config_file_data"])
+            state["usage"] = UsageStore(profile.config_path + ".usage")
+            state["usage"].load_async()
+        previous.state = {name: getattr(self, name) for name in self.PROFILE_ATTRS}
+        for name in self.PROFILE_ATTRS:
+            setattr(self, name, state[name])
+        profile.state = {}
+        self.profile = profile
+        # 設定ファイルの監視。監視していない間の変更は次の確認で再読み込みする
+        paths = self.config_paths if self.config_data.watch_config else []
+        if self.config_watcher is not None:
+            previous.watch_signature = self.config_watcher.watch(paths, profile.watch_signature)
+        elif len(paths) > 0:
+            self.config_watcher = ConfigWatcher(paths, self.on_config_file_changed)
+            self.config_watcher.start()
+        # 一覧表
+        self.speculator.cancel()
+        self.key_label["text"] = ""
+        self.match_prefix = None
+        self.clear_launch_table()
+        self.refresh_matches()
+        self.validate_generation += 1  # 以前のプロファイルの検証の結果は使わない
+        if self.validate_pending != 0:  # 未検証、または検証の途中で切り替えた
+            self.start_validate_launches()
+        self.title(f"{self.config_path} - AltFN2")
+        if self.metrics.enabled:
+            self.metrics.add("profile", start_time)
+        return True
+
+    def close_profiles(self) -> None:
+        """!
+        @brief 有効でないプロファイルの設定ファイルの書き込みと起動履歴を終了する。終了時に呼び出す
+        """
+        if self.profile_executor is not None:
+            self.profile_executor.shutdown(wait=True, cancel_futures=True)
+        for profile in self.profiles:
+            if "config_writer" in profile.state:
+                profile.state["usage"].shutdown()
+                profile.state["config_writer"].shutdown()
+
+    def config_write(self) -> bool:
+        """!
+        @brief ウィンドウの位置とサイズを更新して設定ファイルに書き込む
+        @retval True 書き込みを予約した
+        @retval False 変更なし
+        @detail 書き込みはバックグラウンドで行う(ConfigWriter)。
+        """
         self.config_data.version = __version__
         # ウィンド位置の更新
         x = self.winfo_x()
         y = self.winfo_y()
         width = self.winfo_width()
         height = self.winfo_height()
-        self.config_data.main_window_geometry.width = width
-        self.config_data.main_window_geometry.height = height
-        self.config_data.main_window_geometry.x = x
-        self.config_data.main_window_geometry.y = y
-        # 設定ファイル更新
-        json_dic = dataclasses.asdict(self.config_data)
-        remove_none_keys(json_dic)  # Noneのキーを削除
-        json_data = json.dumps(json_dic, indent=4, sort_keys=True, ensure_ascii=False)
-        with open(self.config_path, mode="w", encoding="utf-8") as f:
-            f.write(json_data)
-
-    def exec_program(self, launch: Launch) -> bool:
-        cmd: list[str] = []
-        #
-        program_path = self.replace_variable(launch.program_path)
-        if os.path.isfile(program_path) == False:
-            messagebox.showerror("エラー", f"ファイルが見つかりません。\nprogram_path={program_path}")
-            return False
-        cmd.append(program_path)
-        if launch.args is not None:
-            for arg in launch.args:
-                cmd.append(self.replace_variable(arg))
-        #
-        if launch.work_dir is not None:
-            work_dir = self.replace_variable(launch.work_dir)
-            if os.path.isdir(work_dir) == False:
-                messagebox.showerror("エラー", f"ディレクトリが見つかりません。\nwork_dir={work_dir}")
+        self.config_data.main_window_geometry = WindowGeometry(width=width, height=height, x=x, y=y)
+        # 設定ファイル更新。includeのファイルの内容は書き込まない
+        self.config_file_data.version = self.config_data.version
+        self.config_file_data.main_window_geometry = self.config_data.main_window_geometry
+        return self.config_writer.write(self.config_file_data)
+
+    def call_in_ui(self, func: Callable[..., None], *args) -> None:
+        """!
+        @brief 関数をTkのスレッドで実行する
+        @detail 他のスレッドから呼び出してよい。キューに入れ、仮想イベント<<CallInUi>>でTkのスレッドを起こす。
+        仮想イベントは取り出し前に1回だけ送信する。
+        """
+        self.ui_queue.put((func, args))
+        if not self.ui_wakeup_pending:
+            self.ui_wakeup_pending = True
+            try:
+                self.event_generate("<<CallInUi>>", when="tail")
+            except (RuntimeError, tkinter.TclError):  # メインループの開始前・終了後。poll_ui_queue()で処理する
+                pass
+
+    def drain_ui_queue(self, e=None) -> None:
+        """!
+        @brief call_in_ui()のキューの関数を全て実行する
+        """
+        self.ui_wakeup_pending = False  # 取り出し中の追加は、もう一度仮想イベントを送信する
+        while True:
+            try:
+                func, args = self.ui_queue.get_nowait()
+            except queue.Empty:
+                return
+            func(*args)
+
+    def poll_ui_queue(self) -> None:
+        self.drain_ui_queue()
+        self.after(self.UI_QUEUE_POLL_INTERVAL, self.poll_ui_queue)
+
+    def exec_program(
+        self, launch: Launch, key: Optional[str] = None, on_result: Optional[Callable[[Optional[str]], None]] = None
+    ) -> bool:
+        """!
+        @brief アプリケーションを起動する
+        @param[in] launch アプリケーション情報
+        @param[in] key キー。Noneの場合はlaunch_key
+        @param[in] on_result 起動の結果の通知(エラーメッセージ(成功時はNone))。指定した場合はエラーをメッセージボックスに表示しない
+        @retval True 起動を受け付けた
+        @retval False 同じキーのアプリケーションを起動中、またはグループのメンバーの指定の誤り
+        @detail 検証・変数展開・起動はワーカースレッドで行い、結果はon_launch_done()で処理する。
+        グループは全てのメンバーの起動後にon_launch_done()を1回だけ呼び出す。
+        """
+        if key is None:
+            key = self.launch_key
+        key_text = self.key_label["text"]
+
+        def on_done(key: str, error: Optional[str]) -> None:
+            self.on_launch_done(key, error, key_text, on_result)
+
+        if launch.group is not None:
+            try:
+                members = resolve_launch_group(self.config_data.launch_dict, key)
+            except LaunchError as e:
+                if on_result is not None:
+                    on_result(str(e))
+                else:
+                    messagebox.showerror("エラー", str(e))
                 return False
-            cwd = work_dir
+            accepted = self.launcher.submit_group(
+                key, members, launch.group_parallel, self.plans.expand, on_done, self.plans, self.config_path
+            )
         else:
-            cwd = os.path.dirname(program_path)
-        #
-        if launch.shell is not None and launch.shell == True:
-            bShell = True
+            accepted = self.launcher.submit(key, launch, self.plans.expand, on_done, self.plans, self.config_path)
+        if not accepted and on_result is not None:
+            on_result(f"起動中です。\nkey={key}")
+        return accepted
+
+    def on_launch_done(
+        self,
+        key: str,
+        error: Optional[str],
+        key_text: str,
+        on_result: Optional[Callable[[Optional[str]], None]] = None,
+    ) -> None:
+        """!
+        @brief アプリケーションの起動後の処理
+        @param[in] key キー
+        @param[in] error エラーメッセージ。Noneの場合は成功
+        @param[in] key_text 起動時のキー入力
+        @param[in] on_result 起動の結果の通知。Noneの場合はエラーをメッセージボックスに表示する
+        """
+        if on_result is not None:
+            on_result(error)
+        if error is not None:
+            if on_result is None:
+                messagebox.showerror("エラー", error)
         else:
-            bShell = False
-        try:
-            # rc = subprocess.call(cmd, shell=True)
-            _process = subprocess.Popen(cmd, cwd=cwd, shell=bShell)
-        # except NotADirectoryError as e: # 実行パスが間違っている
-        #    messagebox.showerror("エラー", f"パスが無効\nprogram_path={program_path}")
-        except Exception as e:
-            messagebox.showerror("エラー", f"その他エラー。\n詳細:{e}")
-            return False
-        # 画面クリア
-        self.launch_key = ""
-        self.key_label["text"] = ""
-        self.title_label["text"] = ""
-        self.update_launch_table()
-        # アプリケーションの起動後
-        if self.config_data.actions_after_launch is None or self.config_data.actions_after_launch == "minimize":
-            self.iconify()  # 最小化
-        elif self.config_data.actions_after_launch == "none":
-            pass
-        elif self.config_data.actions_after_launch == "exit":
+            self.usage.record(key)
+            self.match_prefix = None  # 順位が変わる
+            # 画面クリア。起動中にキー入力した場合はクリアしない
+            if self.key_label["text"] == key_text:
+                self.launch_key = ""
+                self.key_label["text"] = ""
+                self.title_label["text"] = ""
+                self.update_launch_table()
+            # アプリケーションの起動後
+            if self.config_data.actions_after_launch is None or self.config_data.actions_after_launch == "minimize":
+                self.iconify()  # 最小化
+            elif self.config_data.actions_after_launch == "none":
+                pass
+            elif self.config_data.actions_after_launch == "exit":
+                self.exit_after_launch = True
+        if self.exit_after_launch and len(self.launcher.pending) == 0:  # 起動中のアプリケーションが無くなってから終了
             self.destroy()
-        return True
 
     def replace_variable(self, s: str) -> str:
         """!
@@ -182,32 +2043,179 @@ class MainWindow(tkinter.Tk):
         @return 置換後文字列
         @detail 置換対象は%ENV%形式。環境変数が存在しない場合は置換しない。
         """
-        matches = re.findall(r"%([^%]+)%", s)
-        for match in matches:
-            value = next((x.value for x in self.config_data.variable_list if x.name == match), None)
-            if value is None:# 環境変数なし?
-                value = os.environ.get(match)  # 環境変数
-            if value is not None:
-                s = s.replace(f"%{match}%", value)
-        return s
+        return self.variables.expand(s)
 
     def show_window(self):
-        check_duplicate_process()
+        """!
+        @brief ウィンドウを表示する。ホットキーの処理
+        @detail ホットキー(keyboard)のスレッドから呼び出されるため、Tkのスレッドで表示する。
+        入力から表示までの時間をhotkey_latencyに記録する。
+        """
+        self.call_in_ui(self.on_hotkey, time.perf_counter())
+
+    def on_hotkey(self, hotkey_time: float) -> None:
+        self.activate_window()
+        if self.hotkey_time is None:
+            self.hotkey_time = hotkey_time
+            self.after_idle(self.on_hotkey_shown)  # 再描画などのアイドル処理の後
+
+    def on_hotkey_shown(self) -> None:
+        self.hotkey_latency.add((time.perf_counter() - self.hotkey_time) * 1000)
+        if self.metrics.enabled:
+            self.metrics.add("hotkey", self.hotkey_time)
+        self.hotkey_time = None
+
+    def apply_config(
+        self, new: Config, main: Optional[Config] = None, config_path: Optional[str] = None
+    ) -> Optional[ConfigDiff]:
+        """!
+        @brief 再読み込みした設定の差分だけを反映する
+        @param[in] new 再読み込みした設定。includeを統合済み
+        @param[in] main 再読み込みした設定ファイル自身の設定。Noneの場合はnewと同じ
+        @param[in] config_path 読み込んだ設定ファイル。Noneの場合は有効なプロファイルの設定ファイル
+        @return 差分。読み込み後にプロファイルを切り替えた(config_pathが異なる)場合は反映せずにNone
+        @detail launch_dict,インデックス,一覧表は変更されたキーだけを更新する。
+        ウィンドウの位置とサイズは反映しない。フォントとホットキーは再起動後に反映する。
+        """
+        if config_path is not None and config_path != self.config_path:
+            return None
+        config = self.config_data
+        diff = diff_config(config, new)
+        dirty = diff.variables_changed or len(diff.added) + len(diff.removed) + len(diff.changed) > 0
+        for f in dataclasses.fields(Config):
+            if f.name not in ("launch_dict", "variable_list", "main_window_geometry"):
+                dirty = dirty or getattr(config, f.name) != getattr(new, f.name)
+                setattr(config, f.name, getattr(new, f.name))
+        if dirty:  # 自身の書き込みによる再読み込みは除く
+            self.config_writer.mark_dirty()
+        # 設定ファイル自身の設定。ウィンドウの位置とサイズは反映しない
+        if main is None or main is new:  # includeなし
+            self.config_file_data = config
+        else:
+            main.main_window_geometry = config.main_window_geometry
+            self.config_file_data = main
+        # launch_dictとインデックス
+        if len(diff.added) + len(diff.removed) > len(config.launch_dict) // 4:  # 大量の変更は作り直す
+            config.launch_dict = new.launch_dict
+            self.launch_index = PrefixIndex(config.launch_dict.keys())
+        else:
+            for key in diff.removed:
+                del config.launch_dict[key]
+                self.launch_index.remove(key)
+            for key in diff.added:
+                config.launch_dict[key] = new.launch_dict[key]
+                self.launch_index.add(key)
+            for key in diff.changed:
+                config.launch_dict[key] = new.launch_dict[key]
+        # 一覧表
+        for key in diff.removed:
+            if key in self.launch_table_items:
+                self.launch_table.delete(key)
+                self.launch_table_items.discard(key)
+            self.broken_keys.discard(key)
+            self.plans.discard(key)
+        for key in diff.changed:
+            if key in self.launch_table_items:
+                self.launch_table.item(key, values=(key, config.launch_dict[key].title))
+        # 変数とパスの検証
+        if diff.variables_changed:
+            config.variable_list = new.variable_list
+            self.variables = VariableExpander(config.variable_list)
+            self.plans = LaunchPlanner(self.variables.expand, self.variables.variables)
+            self.start_validate_launches()
+        elif len(diff.added) + len(diff.changed) > 0:
+            self.start_validate_launches(diff.added + diff.changed)
+        if diff.added or diff.removed or diff.changed:
+            self.fuzzy_index = None
+            self.match_prefix = None
+            self.refresh_matches()
+        return diff
+
+    def on_config_file_changed(self) -> None:
+        # ConfigWatcherのスレッドから呼び出される。読み込み中にプロファイルを切り替えた場合はapply_config()で破棄する
+        config_path = self.config_path
+        try:
+            loaded = load_config_files(config_path, self.shard_cache)
+        except Exception:  # 編集途中など。次の更新で再読み込みする
+            return
+        if config_path != self.config_path:
+            return
+        if loaded.paths != self.config_watcher.paths:  # includeのファイルの追加・削除
+            self.config_watcher.set_paths(loaded.paths)
+        self.call_in_ui(self.apply_config, loaded.config, loaded.main, config_path)
+
+    def start_validate_launches(self, keys: Optional[list[str]] = None) -> None:
+        """!
+        @brief アプリケーション情報のパスをバックグラウンドで検証する
+        @param[in] keys 検証するキー。Noneの場合は全て
+        @detail 結果はon_validate_launches_done()で一覧表に反映する。
+        """
+        if keys is None:
+            self.validate_generation += 1
+            self.validate_pending = 0  # 以前の検証の結果は使わない
+            launch_dict = self.config_data.launch_dict
+        else:
+            launch_dict = {key: self.config_data.launch_dict[key] for key in keys}
+        self.validate_pending += 1
+        generation = self.validate_generation
+        planner = self.plans
+
+        def run():  # 検証と同時に起動の計画を作成する
+            broken_keys = validate_launches(launch_dict, planner.expand, self.stat_cache, planner)
+            self.call_in_ui(self.on_validate_launches_done, generation, broken_keys, keys)
+
+        threading.Thread(target=run, name="validate_launches", daemon=True).start()
+
+    def on_validate_launches_done(self, generation: int, broken_keys: set[str], keys: Optional[list[str]]) -> None:
+        if generation != self.validate_generation:  # 設定ファイルを再読み込みした、またはプロファイルを切り替えた
+            return
+        self.validate_pending -= 1
+        if keys is not None:  # 一部のキーの検証結果
+            broken_keys = (self.broken_keys - set(keys)) | broken_keys
+        changed_keys = (broken_keys ^ self.broken_keys) & self.launch_table_items
+        self.broken_keys = broken_keys
+        for key in changed_keys:
+            self.launch_table.item(key, tags=("broken",) if key in broken_keys else ())
+
+    def clear_launch_table(self):
+        """!
+        @brief 一覧表の行を全て削除する
+        @detail 設定ファイルの再読み込みなどで行の内容が変わる場合に呼び出す。
+        """
+        self.launch_table.delete(*self.launch_table_items)
+        self.launch_table_items.clear()
 
     def update_launch_table(self, matching_keys: Optional[list[str]] = None):
-        self.launch_table.delete(*self.launch_table.get_children())  # 全削除
+        """!
+        @brief 一覧表を更新する
+        @param[in] matching_keys 表示するキーの一覧。Noneの場合は全表示
+        @detail 作成済みの行は再利用し、差分だけを挿入・切り離す。表示件数はlaunch_table_limitまで。
+        """
         if matching_keys is None:  # 全表示
-            matching_keys = self.config_data.launch_dict.keys()
-        elif len(matching_keys) == 0:
-            return
+            matching_keys = self.usage.rank(list(self.config_data.launch_dict.keys()))
+        total = len(matching_keys)
+        limit = self.config_data.launch_table_limit
+        if limit > 0 and total > limit:  # 表示件数の上限
+            matching_keys = matching_keys[:limit]
         for key in matching_keys:
-            launch = self.config_data.launch_dict[key]
-            self.launch_table.insert(parent="", index="end", values=(key, launch.title))
+            if key not in self.launch_table_items:  # 未作成の行
+                launch = self.config_data.launch_dict[key]
+                tags = ("broken",) if key in self.broken_keys else ()
+                self.launch_table.insert(parent="", index="end", iid=key, values=(key, launch.title), tags=tags)
+                self.launch_table_items.add(key)
+        # 表示する行だけを順番どおりに付け替える。それ以外の行は切り離される(detach)
+        self.launch_table.set_children("", *matching_keys)
+        if len(matching_keys) < total:
+            self.launch_table.heading("key", text=f"key ({len(matching_keys)}/{total})")
+        else:
+            self.launch_table.heading("key", text="key")
 
     # ===================#
     # GUIイベント,Window #
     # ===================#
     def MainWindow_load(self):
+        from tkinter import ttk
+
         # self.title("(無題) - AltFN2")
         self.title(f"{self.config_path} - AltFN2")
         if self.config_data.main_window_geometry.width == 0 and self.config_data.main_window_geometry.height == 0:
@@ -237,7 +2245,17 @@ class MainWindow(tkinter.Tk):
         menu_tool.add_command(label="設定ファイルの再読み込み", command=self.on_menu_tool_reload_config_click)
         menu.add_cascade(label="ツール", menu=menu_tool)
 
+        if len(self.profiles) > 1:
+            menu_profile = tkinter.Menu(menu, tearoff=0)
+            for index, profile in enumerate(self.profiles):
+                menu_profile.add_command(label=profile.name, command=functools.partial(self.switch_profile, index))
+            menu_profile.add_separator()
+            menu_profile.add_command(label="次のプロファイル", accelerator="Ctrl+Tab", command=self.on_next_profile)
+            menu.add_cascade(label="プロファイル", menu=menu_profile)
+            self.bind("<Control-Tab>", self.on_next_profile)
+
         menu_help = tkinter.Menu(menu, tearoff=0)
+        menu_help.add_command(label="統計...", command=self.on_menu_help_stats_click)
         menu_help.add_command(label="バージョン情報...", command=self.on_menu_help_about_click)
         menu.add_cascade(label="ヘルプ", menu=menu_help)
 
@@ -276,6 +2294,7 @@ class MainWindow(tkinter.Tk):
         self.launch_table.heading("#0", text="")
         self.launch_table.heading("key", text="key", anchor=tkinter.CENTER)
         self.launch_table.heading("title", text="title", anchor=tkinter.CENTER)
+        self.launch_table.tag_configure("broken", foreground="gray")  # プログラムまたは作業ディレクトリが見つからない
         # スクロールバー
         self.scrollbar_launch_table = ttk.Scrollbar(frame2, orient=tkinter.VERTICAL, command=self.launch_table.yview)
         self.launch_table.configure(yscroll=self.scrollbar_launch_table.set)
@@ -286,9 +2305,6 @@ class MainWindow(tkinter.Tk):
         # 初期描画
         self.update_launch_table()
         self.bind("<KeyRelease>", self.key_event)
-        # self.bind("<KeyRelease>", self.key_event_debug)
-        # self.bind("<KeyPress>", self.key_event_debug)
-        # self.bind("<Key>", self.key_event_debug)
 
     # ===================#
     # GUIイベント(menu) #
@@ -299,6 +2315,14 @@ class MainWindow(tkinter.Tk):
     def on_menu_help_about_click(self) -> None:
         messagebox.showinfo("バージョン情報", f"AltFN2 {__version__}")
 
+    def on_menu_help_stats_click(self) -> None:
+        if not self.metrics.enabled:
+            messagebox.showinfo("統計", "統計は無効です。\n--statsオプションまたは設定ファイルのstatsで有効にします。")
+            return
+        self.clipboard_clear()
+        self.clipboard_append(json.dumps(self.metrics.to_dict(), ensure_ascii=False))
+        messagebox.showinfo("統計", self.metrics.format() + "\n\n(JSON形式の統計をクリップボードにコピーしました)")
+
     def on_menu_tool_clipboard_json_click(self) -> None:
         s = self.clipboard_get()
         escaped_string = json.dumps(s, ensure_ascii=False)
@@ -312,39 +2336,65 @@ class MainWindow(tkinter.Tk):
         self.clipboard_append(slashed_string)
 
     def on_menu_tool_open_config_click(self) -> None:
+        import subprocess
+
         subprocess.Popen(["notepad", self.config_path])
 
     def on_menu_tool_reload_config_click(self) -> None:
+        self.stat_cache.invalidate()
         self.config_read()
+        self.clear_launch_table()
         self.update_launch_table()
 
     def on_menu_tool_save_windows_click(self) -> None:
         self.config_write()
 
+    def on_next_profile(self, e=None) -> str:
+        self.switch_profile((self.profiles.index(self.profile) + 1) % len(self.profiles))
+        return "break"
+
     # ==========================#
     # GUIイベント,ウィジェット #
     # ==========================#
     def on_launch_table_double_click(self, e) -> None:
-        print(e)
         record_id = self.launch_table.focus()
         record_values = self.launch_table.item(record_id, "values")
         #
         self.launch_key = record_values[0]
         launch = self.config_data.launch_dict[self.launch_key]
-        self.exec_program(launch)
+        self.exec_program(launch, self.launch_key)
+
+    def on_startup_first_paint(self) -> None:
+        self.startup_profile.mark("first_paint")
+        self.startup_profile.write(g_args.startup_profile)
+
+    def on_instance_command(self, command: str) -> Optional[str]:
+        # InstanceServerのスレッドから呼び出される。launchは起動の結果を待って応答する
+        name, _, arg = command.partition(" ")
+        if name != "launch":
+            self.call_in_ui(self.instance_command, command)
+            return None
+        config_path, _, key = arg.partition("\n")
+        replies: queue.SimpleQueue = queue.SimpleQueue()
+        self.call_in_ui(self.instance_launch, config_path, key, replies.put)
+        try:
+            return replies.get(timeout=self.INSTANCE_LAUNCH_TIMEOUT)
+        except queue.Empty:
+            return f"error\n起動の結果を確認できません。\nkey={key}"
 
     def on_visibility(self, e) -> None:
         if e.widget == self: # メインウィンド?
             self.visiblility_time: datetime = datetime.now()
 
-    def key_event_debug(self, e) -> None:
-        with open("debug.log", mode="a", encoding="utf-8") as f:
-            f.write(f"keysym={e.keysym},char={e.char},delta={e.delta},time={e.time}")
-            # f.write(str(e))
-            f.write("\n")
-        # self.key_event(e)
-
     def key_event(self, e) -> None:
+        if self.metrics.enabled:
+            start_time = time.perf_counter()
+            self.key_event_input(e)
+            self.metrics.add("key_event", start_time)
+        else:
+            self.key_event_input(e)
+
+    def key_event_input(self, e) -> None:
         keysym = e.keysym
         # ショートカットキーの入力による誤入力を防ぐ
         # ウィンドウが表示されてから一定時間が経過していない場合は無視
@@ -357,6 +2407,7 @@ class MainWindow(tkinter.Tk):
             # elif e.keysym in ["Escape", "Alt_L", "Control_L", "Shift_L"]: # ショートカットキーの場合にクリアする
             self.key_label["text"] = ""
         elif keysym == "Return":
+            self.flush_refresh()  # 予約済みの更新を反映してから起動する
             if self.launch_key != "":
                 launch = self.config_data.launch_dict[self.launch_key]
                 self.exec_program(launch)
@@ -364,28 +2415,88 @@ class MainWindow(tkinter.Tk):
                 pass
             else: # キーが無い場合。
                 self.iconify()  # 最小化
-        elif e.char != "":  # 文字キーの入力
+        elif e.char != "" and e.char.isprintable():  # 文字キーの入力(Ctrl+Tab等の制御文字は除く)
             self.key_label["text"] += e.char
         else:  # 文字キー以外の入力は無視
             return
-        #
+        self.schedule_refresh()
+
+    def schedule_refresh(self) -> None:
+        """!
+        @brief 一覧表の更新を予約する
+        @detail 連続したキー入力(高速な入力や貼り付け)はまとめて、アイドル時に1回だけ更新する。
+        """
+        if not self.refresh_scheduled:
+            self.refresh_scheduled = True
+            self.after_idle(self.flush_refresh)
+
+    def flush_refresh(self) -> None:
+        """!
+        @brief 予約済みの一覧表の更新を実行する
+        """
+        if self.refresh_scheduled:
+            self.refresh_scheduled = False
+            if self.metrics.enabled:
+                start_time = time.perf_counter()
+                self.refresh_matches()
+                self.metrics.add("refresh", start_time)
+            else:
+                self.refresh_matches()
+
+    def find_prefix_matches(self, prefix: str) -> list[str]:
+        """!
+        @brief 前方一致するキーの一覧
+        @param[in] prefix 前方一致文字列
+        @return キーの一覧。順位順
+        @detail 前回の入力に文字を追加しただけの場合は、前回の結果を絞り込む(順位の並べ替えが不要)。
+        絞り込みは前回の件数、索引による検索は今回の件数に比例するので、速い方を使う。
+        """
+        index = self.launch_index
+        if self.match_prefix and prefix.startswith(self.match_prefix):  # 全件(空文字列)からは絞り込まない
+            lo, hi = index.range(prefix)
+            if len(self.match_keys) <= 2 * (hi - lo):
+                matched = set(index.sorted_keys[lo:hi])
+                matching_keys = list(filter(matched.__contains__, self.match_keys))
+                self.match_prefix, self.match_keys = prefix, matching_keys
+                return matching_keys
+        matching_keys = self.usage.rank(index.keys_with_prefix(prefix))
+        self.match_prefix, self.match_keys = prefix, matching_keys
+        return matching_keys
+
+    def refresh_matches(self) -> None:
+        """!
+        @brief 入力したキーに一致するアプリケーションを一覧表に表示する
+        @detail 完全一致または前方一致が1件の場合は起動するアプリケーション(launch_key)に設定する。
+        """
         self.title_label["text"] = ""
         self.launch_key = ""
         prefix = self.key_label["text"]
         self.key_label.config(foreground="black")
         #
-        matching_keys = [key for key in self.config_data.launch_dict.keys() if key.startswith(prefix)]
+        if self.config_data.fuzzy_match and prefix != "":  # あいまい検索
+            if self.fuzzy_index is None:
+                self.fuzzy_index = FuzzyIndex(self.config_data.launch_dict)
+                threading.Thread(target=self.fuzzy_index.warm_up, name="FuzzyIndex", daemon=True).start()
+            matching_keys = self.fuzzy_index.search(prefix, self.config_data.launch_table_limit or 1000)
+            self.match_prefix = None
+        else:
+            matching_keys = self.find_prefix_matches(prefix)
         self.update_launch_table(matching_keys)
-        if prefix in self.config_data.launch_dict:  # 完全一致
+        unique_key = self.launch_index.unique_key(prefix)
+        if prefix in self.launch_index:  # 完全一致
             self.launch_key = prefix
-        elif len(matching_keys) == 1:  # 完全前方一致
-            self.launch_key = matching_keys[0]
+        elif unique_key is not None:  # 完全前方一致
+            self.launch_key = unique_key
         else:
             self.key_label.config(foreground="red")
         #
         if self.launch_key != "":
             launch = self.config_data.launch_dict[self.launch_key]
             self.title_label["text"] = launch.title
+            if self.config_data.speculative_launch and launch.group is None:  # Returnの前に起動を準備する
+                self.speculator.speculate(self.launch_key, launch, self.variables.expand)
+        else:
+            self.speculator.cancel()
 
 
 def analyze_option(argv: List[str]) -> argparse.Namespace:
@@ -408,15 +2519,71 @@ def analyze_option(argv: List[str]) -> argparse.Namespace:
     )
     parser.add_argument(
         "--config",
-        action="store",
+        action="append",
         type=str,
-        default="config.json",
-        help=r"設定ファイル",
+        default=None,
+        help="設定ファイル(省略時はconfig.json)。\n複数指定した場合はプロファイルとして切り替える(最初のファイルが有効)",
+    )
+    parser.add_argument(
+        "--profile_dir",
+        "--profile-dir",
+        action="store",
+        default=None,
+        metavar="DIR",
+        help="DIRの設定ファイル(*.json)をファイル名順にプロファイルとして読み込む",
+    )
+    parser.add_argument(
+        "--startup_profile",
+        "--startup-profile",
+        action="store",
+        nargs="?",
+        const="-",
+        default=None,
+        help="起動時間の計測結果(JSON)の出力先。省略時は標準出力",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store",
+        nargs="?",
+        const="-",
+        default=None,
+        help="処理時間の統計を記録し、終了時にJSON形式で出力する。出力先の省略時は標準出力",
+    )
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "--launch",
+        action="store",
+        default=None,
+        metavar="KEY",
+        help="ウィンドウを表示せずにKEYのアプリケーションを起動する。\n起動済みのプロセスがあれば、そのプロセスで起動する",
+    )
+    group.add_argument(
+        "--list",
+        action="store_true",
+        help="ウィンドウを表示せずにキーとタイトルの一覧を出力する",
+    )
+    group.add_argument(
+        "--match",
+        action="store",
+        default=None,
+        metavar="PREFIX",
+        help="ウィンドウを表示せずにPREFIXに前方一致するキーとタイトルの一覧を出力する",
+    )
+    parser.add_argument(
+        "--no_forward",
+        "--no-forward",
+        action="store_true",
+        help="--launchを起動済みのプロセスに転送しない",
     )
     # if len(argv) == 1: # オプション無し実行
     #    parser.print_help()
     #    sys.exit(1)
     args = parser.parse_args(argv[1:])
+    config_list = list(args.config or [])
+    if args.profile_dir is not None:
+        config_list.extend(sorted(glob.glob(os.path.join(args.profile_dir, "*.json"))))
+    args.config_list = list(dict.fromkeys(config_list)) or ["config.json"]  # プロファイルの設定ファイル
+    args.config = args.config_list[0]  # 有効なプロファイル
     return args
 
 
@@ -439,6 +2606,655 @@ def remove_none_keys(d: Union[dict, list[dict]]):
     return d
 
 
+def flatten_launch_options(d: dict) -> dict:
+    """!
+    @brief dataclasses.asdict()したLaunchのoptionsを、設定ファイルと同じくLaunchの階層に移す
+    @param[in] d Launchの辞書。グループのメンバーのLaunchも移す
+    """
+    options = d.pop("options", None)
+    if options is not None:
+        d.update(options)
+        for member in options["group"] or []:
+            if isinstance(member, dict) and member["launch"] is not None:
+                flatten_launch_options(member["launch"])
+    return d
+
+
+class DecodeError(Exception):
+    """!
+    @brief 復号エラー。dataclass_decoder()の内部で使用する
+    @detail config_from_dict()でdaciteの例外に変換する。
+    """
+
+    def __init__(self, field_path: Optional[str] = None):
+        super().__init__()
+        self.field_path = field_path
+
+    def update_path(self, parent_field_path: str) -> None:
+        if self.field_path:
+            self.field_path = f"{parent_field_path}.{self.field_path}"
+        else:
+            self.field_path = parent_field_path
+
+
+class DecodeMissingError(DecodeError):
+    """!
+    @brief 必須フィールドなし。dacite.MissingValueErrorに相当
+    """
+
+
+class DecodeTypeError(DecodeError):
+    """!
+    @brief 型の不一致。dacite.WrongTypeErrorに相当
+    @detail field_pathがNoneの場合は、フィールド単位で型と値を設定し直す。
+    """
+
+    def __init__(self, field_type: Any = None, value: Any = None, field_path: Optional[str] = None):
+        super().__init__(field_path)
+        self.field_type = field_type
+        self.value = value
+
+
+class DecodeUnionError(DecodeTypeError):
+    """!
+    @brief Unionのどの型にも一致しない。dacite.UnionMatchErrorに相当
+    @detail Optional(型とNoneのUnion)以外のUnionで送出する。field_typeはUnion,valueは一致しなかった値。
+    """
+
+
+@functools.cache
+def value_decoder(tp: Any) -> Callable[[Any], Any]:
+    """!
+    @brief 型に応じた値の復号関数を生成する
+    @param[in] tp 型
+    @return 復号関数。型が一致しない場合はDecodeTypeErrorを送出する
+    """
+    if dataclasses.is_dataclass(tp):
+        if tp in g_decoders_building:  # 再帰的な定義(Launch→GroupMember→Launch)。生成後の復号関数を使う
+            return lambda value: dataclass_decoder(tp)(value)
+        return dataclass_decoder(tp)
+    origin = get_origin(tp)
+    args = get_args(tp)
+    if origin is Union or origin is types.UnionType:
+        optional = type(None) in args
+        decoders = [value_decoder(arg) for arg in args if arg is not type(None)]
+        if optional and len(decoders) == 1:  # Optional。要素のエラーはそのまま送出する
+            decoder = decoders[0]
+
+            def decode_optional(value: Any) -> Any:
+                return None if value is None else decoder(value)
+
+            return decode_optional
+
+        def decode_union(value: Any) -> Any:
+            if value is None and optional:
+                return None
+            for decoder in decoders:
+                try:
+                    return decoder(value)
+                except DecodeError:
+                    pass
+            raise DecodeUnionError(tp, value)
+
+        return decode_union
+    if origin is list:
+        item_decoder = value_decoder(args[0])
+
+        def decode_list(value: Any) -> Any:
+            if not isinstance(value, list):
+                raise DecodeTypeError()
+            return [item_decoder(item) for item in value]
+
+        return decode_list
+    if origin is dict:
+        key_decoder = value_decoder(args[0])
+        item_decoder = value_decoder(args[1])
+
+        def decode_dict(value: Any) -> Any:
+            if not isinstance(value, dict):
+                raise DecodeTypeError()
+            return {key_decoder(k): item_decoder(v) for k, v in value.items()}
+
+        return decode_dict
+
+    def decode_value(value: Any) -> Any:
+        if not isinstance(value, tp):
+            raise DecodeTypeError()
+        return value
+
+    return decode_value
+
+
+g_decoders_building: set[type] = set()  # 復号関数を生成中のdataclass
+g_decode_local = threading.local()  # スレッドごとの復号の状態。strings:読み込み中の設定ファイルの共有する文字列
+
+
+@functools.cache
+def dataclass_decoder(cls: type) -> Callable[[Any], Any]:
+    """!
+    @brief dataclassの復号関数をフィールド定義から生成する
+    @param[in] cls dataclass
+    @return 復号関数。型が一致しない場合はDecodeTypeErrorを送出する
+    @detail フィールドはdacite.from_dict()と同じ型検査を行い、DecodeMissingError,DecodeTypeErrorを送出する。
+    省略されたフィールドは既定値、既定値の無いOptionalのフィールドはNoneとする。
+    FLATTENのフィールドは同じ階層の辞書から復号し、そのdataclassのフィールドが1つも無い場合は既定値とする。
+    INTERNのフィールドの文字列は、g_decode_local.stringsがあれば同じ値の文字列を共有する。
+    """
+    hints = get_type_hints(cls)
+    specs = []  # (フィールド名, 型, 単純型の場合は型のタプル, 復号関数, 必須, Optional, 文字列を共有する)
+    flattened = []  # FLATTENのフィールド。(フィールド名, 復号関数, dataclassのフィールド名の集合)
+    g_decoders_building.add(cls)
+    try:
+        for f in dataclasses.fields(cls):
+            if not f.init:
+                continue
+            tp = hints[f.name]
+            args = get_args(tp)
+            if f.metadata.get("flatten", False):
+                inner = next(arg for arg in args if arg is not type(None)) if args else tp
+                flattened.append((f.name, dataclass_decoder(inner), {g.name for g in dataclasses.fields(inner)}))
+                continue
+            is_union = get_origin(tp) is Union or get_origin(tp) is types.UnionType
+            optional = is_union and type(None) in args
+            simple_types = None  # isinstance()だけで検査できる型
+            if isinstance(tp, type) and not dataclasses.is_dataclass(tp):
+                simple_types = (tp,)
+            elif is_union and all(isinstance(arg, type) and not dataclasses.is_dataclass(arg) for arg in args):
+                simple_types = args
+            required = f.default is dataclasses.MISSING and f.default_factory is dataclasses.MISSING
+            specs.append(
+                (f.name, tp, simple_types, value_decoder(tp), required, optional, f.metadata.get("intern", False))
+            )
+    finally:
+        g_decoders_building.discard(cls)
+    has_intern = any(spec[6] for spec in specs)
+
+    def decode_dataclass(data: Any) -> Any:
+        if not isinstance(data, dict):
+            raise DecodeTypeError()
+        kwargs = {}
+        strings = getattr(g_decode_local, "strings", None) if has_intern else None
+        for name, tp, simple_types, decoder, required, optional, intern in specs:
+            if name not in data:
+                if not required:  # 既定値
+                    continue
+                if not optional:
+                    raise DecodeMissingError(name)
+                kwargs[name] = None
+                continue
+            value = data[name]
+            if simple_types is not None:
+                if not isinstance(value, simple_types):
+                    raise DecodeTypeError(tp, value, name)
+                if intern and strings is not None and type(value) is str:
+                    value = strings.setdefault(value, value)
+                kwargs[name] = value
+                continue
+            try:
+                value = decoder(value)
+            except DecodeError as e:
+                if type(e) is DecodeTypeError and e.field_path is None:  # 要素の型の不一致
+                    raise DecodeTypeError(tp, value, name) from None
+                e.update_path(name)
+                raise
+            if intern and strings is not None and type(value) is list:
+                value = [strings.setdefault(item, item) if type(item) is str else item for item in value]
+            kwargs[name] = value
+        for name, decoder, names in flattened:
+            if not names.isdisjoint(data):
+                kwargs[name] = decoder(data)
+        return cls(**kwargs)
+
+    return decode_dataclass
+
+
+def config_from_dict(data: dict) -> Config:
+    """!
+    @brief 辞書から設定を生成する
+    @param[in] data 設定ファイルを解析した辞書
+    @return 設定
+    @detail dacite.from_dict(data_class=Config, data=data)と同等。同じ例外(MissingValueError,WrongTypeError)を送出する。
+    ただし、FLATTENのフィールド(Launch.options)は同じ階層に書いたフィールドから復号する。
+    """
+    g_decode_local.strings = {}  # この設定ファイルの中だけで文字列を共有する。sys.intern()の表は解放されない
+    try:
+        config = dataclass_decoder(Config)(data)
+    except DecodeMissingError as e:
+        from dacite import MissingValueError
+
+        raise MissingValueError(e.field_path) from None
+    except DecodeUnionError as e:
+        from dacite import UnionMatchError
+
+        raise UnionMatchError(field_type=e.field_type, value=e.value, field_path=e.field_path) from None
+    except DecodeTypeError as e:
+        from dacite import WrongTypeError
+
+        if e.field_path is None:
+            raise WrongTypeError(field_type=Config, value=data) from None
+        raise WrongTypeError(field_type=e.field_type, value=e.value, field_path=e.field_path) from None
+    finally:
+        g_decode_local.strings = None
+    check_launch_dict(config.launch_dict)
+    return config
+
+
+def check_launch_dict(launch_dict: dict[str, Launch]) -> None:
+    """!
+    @brief アプリケーション情報のprogram_pathとgroupの指定を検査する
+    @param[in] launch_dict アプリケーション情報
+    @exception dacite.MissingValueError program_pathとgroupのどちらも無い
+    @exception dacite.UnexpectedDataError program_pathとgroupの両方がある
+    @detail program_pathはグループの場合だけ省略できるので、型の検査の後で検査する。
+    dacite.from_dict()で復号した設定にも使う。
+    """
+    for key, launch in launch_dict.items():
+        if launch.group is None and launch.program_path == "":
+            from dacite import MissingValueError
+
+            raise MissingValueError(f"launch_dict.{key}.program_path")
+        if launch.group is not None and launch.program_path != "":
+            from dacite import UnexpectedDataError
+
+            raise UnexpectedDataError({f"launch_dict.{key}.program_path"})
+
+
+class ConfigError(Exception):
+    """!
+    @brief 設定ファイルの読み込みの失敗
+    @detail メッセージはそのままエラーダイアログに表示する。
+    """
+
+
+@dataclass
+class LoadedConfig:
+    config: Config  # includeを統合した設定
+    main: Config  # 設定ファイル自身の設定。config_write()はこの設定だけを書き込む
+    paths: list[str]  # 更新を監視するパス。設定ファイル,includeのファイル,globパターンのディレクトリ
+
+
+def load_config(config_path: str) -> Config:
+    """!
+    @brief 設定ファイルを読み込む
+    @param[in] config_path 設定ファイルのパス
+    @return 設定。includeのファイルを統合済み
+    @exception ConfigError 設定ファイルが無い、またはJSONとして解析できない
+    """
+    return load_config_files(config_path).config
+
+
+def load_config_files(config_path: str, shard_cache: Optional[dict] = None) -> LoadedConfig:
+    """!
+    @brief 設定ファイルとincludeのファイルを読み込んで統合する
+    @param[in] config_path 設定ファイルのパス
+    @param[in] shard_cache includeのファイルのキャッシュ。パス:(更新時刻, サイズ, 設定)。Noneの場合は使わない
+    @return 読み込み結果
+    @exception ConfigError 設定ファイルまたはincludeのファイルが無い、またはJSONとして解析できない
+    @detail includeのファイルは並列に読み込み、更新時刻とサイズが変わっていないファイルはshard_cacheを使う。
+    includeのファイルはlaunch_dictとvariable_listだけを使う(includeの入れ子は無視)。
+    優先順位は設定ファイル,includeの後のファイル,前のファイルの順。globパターンはファイル名順。
+    """
+    main = load_config_file(config_path)
+    paths = [config_path]
+    if not main.include:
+        return LoadedConfig(config=main, main=main, paths=paths)
+    base_dir = os.path.dirname(config_path)
+    shard_paths: list[str] = []
+    for pattern in main.include:
+        pattern = os.path.join(base_dir, os.path.expandvars(pattern))
+        if any(c in pattern for c in "*?["):  # globパターン
+            shard_paths.extend(sorted(glob.glob(pattern)))
+            paths.append(os.path.dirname(pattern))  # ファイルの追加・削除の監視
+        else:
+            shard_paths.append(pattern)
+    shard_paths = list(dict.fromkeys(path for path in shard_paths if path != config_path))  # 重複を除く
+    paths.extend(shard_paths)
+    if len(shard_paths) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=min(8, len(shard_paths))) as executor:
+            shards = list(executor.map(lambda path: load_config_shard(path, shard_cache), shard_paths))
+    else:
+        shards = [load_config_shard(path, shard_cache) for path in shard_paths]
+    # 統合。キーの順番は設定ファイル,includeの順。値は優先順位の高いもの
+    launch_dict = dict(main.launch_dict)
+    variables = {variable.name: variable for variable in main.variable_list}
+    for shard in shards:
+        for key, launch in shard.launch_dict.items():
+            if key not in main.launch_dict:
+                launch_dict[key] = launch
+    variable_dict: dict[str, Variable] = {}
+    for shard in shards:
+        for variable in shard.variable_list:
+            if variable.name not in variables:
+                variable_dict[variable.name] = variable
+    variable_list = list(variables.values()) + list(variable_dict.values())
+    config = dataclasses.replace(main, launch_dict=launch_dict, variable_list=variable_list)
+    return LoadedConfig(config=config, main=main, paths=paths)
+
+
+@dataclass(kw_only=True, eq=False)
+class Profile:
+    """!
+    @brief 設定ファイルのプロファイル
+    @detail 有効なプロファイルの設定と索引はMainWindowの属性が持ち、有効でない間はstateに退避する。
+    """
+
+    name: str  # 名前。設定ファイル名の拡張子を除いた部分
+    config_path: str  # 設定ファイルのパス
+    state: dict[str, Any] = field(default_factory=dict)  # 退避したMainWindowの属性。有効または未読み込みの場合は空
+    future: Optional[Any] = None  # バックグラウンドでの読み込み(concurrent.futures.Future)。結果はload_profile()の値
+    watch_signature: Optional[tuple] = None  # 退避した時点の監視中のファイルの更新時刻とサイズ
+
+
+def load_profile(config_path: str) -> dict[str, Any]:
+    """!
+    @brief プロファイルの設定ファイルを読み込み、検索用の索引を作成する
+    @param[in] config_path 設定ファイルのパス
+    @return MainWindowの属性名:値(Profile.state)。設定ファイルの書き込みと起動履歴は含まない
+    @exception ConfigError 設定ファイルが無い、またはJSONとして解析できない
+    @detail 他のスレッドから呼び出してよい。
+    """
+    shard_cache: dict = {}
+    loaded = load_config_files(config_path, shard_cache)
+    variables = VariableExpander(loaded.config.variable_list)
+    return {
+        "config_path": config_path,
+        "config_data": loaded.config,
+        "config_file_data": loaded.main,
+        "config_paths": loaded.paths,
+        "shard_cache": shard_cache,
+        "launch_index": PrefixIndex(loaded.config.launch_dict.keys()),
+        "fuzzy_index": None,
+        "variables": variables,
+        "plans": LaunchPlanner(variables.expand, variables.variables),
+        "broken_keys": set(),
+        "validate_pending": 1,  # 未検証
+    }
+
+
+def load_config_shard(path: str, shard_cache: Optional[dict]) -> Config:
+    """!
+    @brief includeのファイルを読み込む
+    @param[in] path パス
+    @param[in] shard_cache キャッシュ。Noneの場合は使わない
+    @return 設定
+    @exception ConfigError ファイルが無い、またはJSONとして解析できない
+    """
+    if shard_cache is None:
+        return load_config_file(path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return load_config_file(path)  # ファイルなしのエラー
+    cached = shard_cache.get(path)
+    if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+    config = load_config_file(path)
+    shard_cache[path] = (st.st_mtime_ns, st.st_size, config)
+    return config
+
+
+def load_config_file(config_path: str) -> Config:
+    """!
+    @brief 1つの設定ファイルを読み込む
+    @param[in] config_path 設定ファイルのパス
+    @return 設定。includeは統合しない
+    @exception ConfigError 設定ファイルが無い、JSONとして解析できない、または設定の形式の誤り(daciteの例外)
+    @detail スナップショットが有効な場合は解析を省略する。
+    """
+    if os.path.isfile(config_path) == False:
+        raise ConfigError(f"設定ファイルが見つかりません。\nconfig={config_path}")
+    with open(config_path, mode="rb") as f:
+        data = f.read()
+        cache_key = config_cache_key(config_path, os.fstat(f.fileno()), data)
+    config = config_cache_read(config_path, cache_key)  # スナップショットがあれば解析を省略
+    if config is None:
+        try:
+            json_dic = json.loads(data.decode("utf-8"))
+        except Exception as e:
+            raise ConfigError(f"設定ファイルの読み込みに失敗しました。\nconfig:{config_path}\n詳細:{e}") from e
+        from dacite import DaciteError
+
+        try:
+            config = config_from_dict(json_dic)
+        except DaciteError as e:
+            raise ConfigError(f"設定ファイルの形式が正しくありません。\nconfig:{config_path}\n詳細:{e}") from e
+        config_cache_write(config_path, cache_key, config)
+    return config
+
+
+def config_cache_key(config_path: str, stat: os.stat_result, data: bytes) -> dict:
+    """!
+    @brief 設定ファイルのスナップショットのキー
+    @param[in] config_path 設定ファイルのパス
+    @param[in] stat 設定ファイルのstat
+    @param[in] data 設定ファイルの内容
+    @return キー。バージョン,パス,更新時刻,サイズ,内容のハッシュ値,設定のdataclassのフィールド名
+    """
+    return {
+        "version": __version__,
+        "path": os.path.abspath(config_path),
+        "mtime": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "hash": hashlib.blake2b(data).hexdigest(),
+        "schema": [
+            [f.name for f in dataclasses.fields(cls)]
+            for cls in (Config, WindowGeometry, Variable, Launch, LaunchOptions)
+        ],
+    }
+
+
+def config_cache_path(config_path: str) -> str:
+    """!
+    @brief 設定ファイルのスナップショットのパス
+    @param[in] config_path 設定ファイルのパス
+    @return ユーザごとのキャッシュディレクトリの"設定ファイルの絶対パスのハッシュ値.cache"
+    @detail スナップショットはpickleで復元するので、他のユーザが書き込めるディレクトリ(設定ファイルや
+    includeのファイルの共有ディレクトリ)には置かない。
+    """
+    name = hashlib.blake2b(os.path.abspath(config_path).encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(user_cache_dir(), f"{name}.cache")
+
+
+def user_cache_dir() -> str:
+    """!
+    @brief ユーザごとのキャッシュディレクトリ
+    @return Windowsは%LOCALAPPDATA%/AltFN2、それ以外は$XDG_CACHE_HOME/AltFN2(省略時は~/.cache/AltFN2)
+    @detail 作成する場合は所有者だけが読み書きできるようにする(mode=0o700)。
+    """
+    if sys.platform == "win32":
+        base_dir = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base_dir = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base_dir, "AltFN2")
+
+
+def config_cache_read(config_path: str, key: dict) -> Optional[Config]:
+    """!
+    @brief 設定ファイルのスナップショットを読み込む
+    @param[in] config_path 設定ファイルのパス
+    @param[in] key スナップショットのキー
+    @return 設定。スナップショットが無い、またはキーが一致しない場合はNone
+    @detail スナップショットはconfig_cache_path()。キーを先に読み込み、一致した場合だけ設定を復元する。
+    Windows以外は自分の所有するファイルだけを使う。
+    """
+    try:
+        with open(config_cache_path(config_path), mode="rb") as f:
+            if sys.platform != "win32" and os.fstat(f.fileno()).st_uid != os.getuid():
+                return None
+            if pickle.load(f) != key:  # 古い形式または設定ファイルの更新
+                return None
+            config = pickle.load(f)
+    except Exception:  # ファイルなし、破損、クラス定義の変更など
+        return None
+    if not isinstance(config, Config):
+        return None
+    return config
+
+
+def config_cache_write(config_path: str, key: dict, config: Config):
+    """!
+    @brief 設定ファイルのスナップショットを書き込む
+    @param[in] config_path 設定ファイルのパス
+    @param[in] key スナップショットのキー
+    @param[in] config 設定
+    @detail 書き込みに失敗しても無視する。一時ファイルは一意な名前にする(CLIとGUIの同時書き込み)。
+    """
+    import tempfile
+
+    cache_path = config_cache_path(config_path)
+    tmp_path = None
+    try:
+        os.makedirs(os.path.dirname(cache_path), mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(cache_path))
+        with os.fdopen(fd, mode="wb") as f:
+            pickle.dump(key, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(config, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except Exception:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+class ConfigWriter:
+    """!
+    @brief 設定ファイルの書き込み
+    @detail 前回の書き込み(または読み込み)から変更がある場合だけ、専用のスレッドで書き込む。
+    一時ファイルに書き込んでから置き換えるので、書き込み途中で終了しても設定ファイルは壊れない。
+    シンボリックリンクはリンク先のファイルを置き換え、元のファイルの許可属性を引き継ぐ。
+    ウィンドウの位置とサイズだけの変更は、前回作成したJSON文字列のmain_window_geometryだけを置き換える。
+    """
+
+    GEOMETRY_MARKER = "\0main_window_geometry\0"  # JSON文字列のmain_window_geometryの位置の目印
+
+    def __init__(self, path: str, on_error: Optional[Callable[[str], None]] = None, metrics: Optional[Metrics] = None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.path = path  # 設定ファイル
+        self.on_error = on_error  # on_error(message) 書き込みの失敗。書き込み用のスレッドから呼び出される
+        self.metrics = metrics if metrics is not None else Metrics()  # 書き込みの処理時間
+        self.generation = 0  # 設定(ウィンドウの位置とサイズ以外)の世代。変更ごとに増やす
+        self.written: Optional[tuple] = None  # 設定ファイルの内容の状態。state()の値
+        self.text_parts: Optional[tuple] = None  # ((世代, version), main_window_geometryより前のJSON文字列, 後)
+        self.pending: Optional[tuple[Config, int]] = None  # 書き込み待ちの(設定, 世代)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ConfigWriter")
+        self.write_count = 0  # 書き込んだ回数
+        self.full_count = 0  # JSON文字列を全て作成した回数
+
+    def state(self, config: Config) -> tuple:
+        geometry = config.main_window_geometry
+        return (self.generation, config.version, geometry.width, geometry.height, geometry.x, geometry.y)
+
+    def loaded(self, config: Config) -> None:
+        """!
+        @brief 設定ファイルを読み込んだ。読み込んだ設定は書き込み不要
+        """
+        self.generation += 1
+        self.written = self.state(config)
+
+    def mark_dirty(self) -> None:
+        """!
+        @brief ウィンドウの位置とサイズ以外の設定を変更した
+        """
+        self.generation += 1
+
+    def write(self, config: Config) -> bool:
+        """!
+        @brief 設定ファイルに書き込む
+        @param[in] config 設定
+        @retval True 書き込みを予約した
+        @retval False 変更なし
+        @detail launch_dict等のコンテナだけを呼び出し元のスレッドで複製するので、以降の設定の変更は書き込みに影響しない。
+        書き込み待ちの設定がある場合は新しい設定に置き換える。
+        """
+        state = self.state(config)
+        with self.lock:
+            if state == self.written:
+                return False
+            self.written = state
+        snapshot = dataclasses.replace(
+            config,
+            main_window_geometry=dataclasses.replace(config.main_window_geometry),
+            variable_list=list(config.variable_list),
+            launch_dict=dict(config.launch_dict),
+        )
+        with self.lock:
+            submit = self.pending is None
+            self.pending = (snapshot, self.generation)
+        if submit:
+            self.executor.submit(self.run)
+        return True
+
+    def run(self) -> None:
+        import shutil
+
+        with self.lock:
+            config, generation = self.pending
+            self.pending = None
+        start_time = time.perf_counter() if self.metrics.enabled else 0.0
+        try:
+            json_data = self.dumps(config, generation)
+            path = os.path.realpath(self.path)  # シンボリックリンクを通常のファイルに置き換えない
+            with open(path + ".tmp", mode="w", encoding="utf-8") as f:
+                f.write(json_data)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(path):
+                shutil.copymode(path, path + ".tmp")  # 元のファイルの許可属性
+            os.replace(path + ".tmp", path)
+            self.write_count += 1
+            if self.metrics.enabled:
+                self.metrics.add("config_write", start_time)
+        except Exception as e:
+            with self.lock:
+                self.written = None  # 次回は必ず書き込む
+            if self.on_error is not None:
+                self.on_error(f"設定ファイルの書き込みに失敗しました。\npath={self.path}\n詳細:{e}")
+
+    def dumps(self, config: Config, generation: int) -> str:
+        """!
+        @brief 設定をJSON文字列に変換する
+        @param[in] config 設定
+        @param[in] generation 設定の世代
+        @return JSON文字列。Noneのキーは出力しない
+        """
+        geometry = json.dumps(dataclasses.asdict(config.main_window_geometry), indent=4, sort_keys=True)
+        geometry = geometry.replace("\n", "\n    ")  # 1階層下のインデント
+        text_key = (generation, config.version)
+        if self.text_parts is None or self.text_parts[0] != text_key:
+            json_dic = dataclasses.asdict(config)
+            for launch in json_dic["launch_dict"].values():
+                flatten_launch_options(launch)
+            remove_none_keys(json_dic)  # Noneのキーを削除
+            json_dic["main_window_geometry"] = self.GEOMETRY_MARKER
+            json_data = json.dumps(json_dic, indent=4, sort_keys=True, ensure_ascii=False)
+            self.full_count += 1
+            parts = json_data.split(json.dumps(self.GEOMETRY_MARKER))
+            if len(parts) != 2:  # 設定の文字列に目印と同じ文字列がある
+                self.text_parts = None
+                json_dic["main_window_geometry"] = dataclasses.asdict(config.main_window_geometry)
+                return json.dumps(json_dic, indent=4, sort_keys=True, ensure_ascii=False)
+            self.text_parts = (text_key, parts[0], parts[1])
+        return self.text_parts[1] + geometry + self.text_parts[2]
+
+    def flush(self) -> None:
+        """!
+        @brief 書き込み待ちの設定の書き込みを待つ
+        """
+        self.executor.submit(lambda: None).result()
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+
+g_env_variables = VariableExpander()  # 環境変数の展開。replace_env()用
+
+
 def replace_env(s: str) -> str:
     """!
     @brief 環境変数を置換する
@@ -446,85 +3262,296 @@ def replace_env(s: str) -> str:
     @return 置換後文字列
     @detail 置換対象は%ENV%形式。環境変数が存在しない場合は置換しない。
     """
-    matches = re.findall(r"%([^%]+)%", s)
-    for match in matches:
-        value = os.environ.get(match)
-        if value is not None:
-            s = s.replace(f"%{match}%", value)
-    return s
+    return g_env_variables.expand(s)
+
+
+def instance_address() -> str:
+    """!
+    @brief 2重起動防止用のプロセス間通信のアドレス
+    @return アドレス。Windowsは名前付きパイプ、それ以外はunixドメインソケットのパス
+    @detail ユーザごとに1つ。unixドメインソケットは他のユーザが書き込めないディレクトリ($XDG_RUNTIME_DIR、
+    省略時はuser_cache_dir())に置く。名前付きパイプは全てのユーザで共通の名前空間なので、
+    名前に認証キーのハッシュ値を含めて他のユーザが先に同じ名前で待ち受けられないようにする。
+    """
+    if sys.platform == "win32":
+        name = hashlib.blake2b(instance_authkey(), digest_size=8).hexdigest()
+        return rf"\\.\pipe\AltFN2-{os.environ.get('USERNAME', '')}-{name}"
+    return os.path.join(os.environ.get("XDG_RUNTIME_DIR") or user_cache_dir(), "AltFN2.sock")
+
+
+def instance_authkey() -> bytes:
+    """!
+    @brief 2重起動防止用のプロセス間通信の認証キー
+    @return 認証キー。user_cache_dir()の"instance.key"(所有者だけが読み書きできる)。無い場合は作成する
+    @detail 認証キーを読めない他のユーザのプロセスとは通信しない(コマンドを送信・受信しない)。
+    作成できない場合は、このプロセスだけの認証キー(他のプロセスと通信しない)を返す。
+    """
+    import secrets
+
+    path = os.path.join(user_cache_dir(), "instance.key")
+    for _ in range(10):
+        try:
+            with open(path, mode="rb") as f:
+                st = os.fstat(f.fileno())
+                key = f.read()
+            if len(key) == 32 and (sys.platform == "win32" or (st.st_uid == os.getuid() and st.st_mode & 0o077 == 0)):
+                return key
+            if len(key) < 32 and time.time() - st.st_mtime < 1:  # 他のプロセスが書き込み中
+                time.sleep(0.01)
+                continue
+            os.remove(path)  # 不正なファイル
+        except FileNotFoundError:
+            pass
+        except OSError:
+            break
+        key = secrets.token_bytes(32)
+        try:
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o600)
+        except FileExistsError:  # 他のプロセスが同時に作成した
+            continue
+        except OSError:
+            break
+        with os.fdopen(fd, mode="wb") as f:
+            f.write(key)
+        return key
+    return secrets.token_bytes(32)
+
+
+def request_instance(command: str, address: Optional[str] = None) -> Optional[str]:
+    """!
+    @brief 起動済みのプロセスにコマンドを送信し、応答を受信する
+    @param[in] command コマンド
+    @param[in] address アドレス。Noneの場合はinstance_address()
+    @return 応答。起動済みのプロセスなし、または認証の失敗(他のユーザのプロセス)の場合はNone
+    """
+    from multiprocessing import AuthenticationError
+    from multiprocessing.connection import Client
 
+    if address is None:
+        address = instance_address()
+    try:
+        with Client(address, authkey=instance_authkey()) as conn:
+            conn.send_bytes(command.encode("utf-8"))
+            return conn.recv_bytes(4096).decode("utf-8")
+    except (OSError, EOFError, UnicodeDecodeError, AuthenticationError):
+        return None
 
 
-find_hwnd: int = 0
+def send_instance_command(command: str, address: Optional[str] = None) -> bool:
+    """!
+    @brief 起動済みのプロセスにコマンドを送信する
+    @param[in] command コマンド
+    @param[in] address アドレス。Noneの場合はinstance_address()
+    @retval True 送信成功
+    @retval False 起動済みのプロセスなし
+    """
+    return request_instance(command, address) == "ok"
 
 
-def callback_EnumWindows_window_text_suffix(hwnd, title_suffix) -> bool:
+class InstanceServer:
     """!
-    @brief ウィンドハンドルを探す。テキストのサフィックス
-    @detail win32gui.EnumWindows()のコールバック関数。一致したhwndをfind_hwndにセット。
-    @param hwnd コマンドラインオプション
-    @param title_suffix 検索対象のサフィックス
-    @retval True 継続
-    @retval False 中断
+    @brief 2重起動防止用のプロセス間通信のサーバ
+    @detail 受信したコマンドを別スレッドからhandlerに渡し、handlerの戻り値(Noneの場合は"ok")を応答する。
+    instance_authkey()で認証できない接続は無視する。
     """
-    global find_hwnd
-    if find_hwnd != 0:
-        return True  # 中断したいが落ちるので継続
-    name = win32gui.GetWindowText(hwnd)
-    if name.endswith(title_suffix):
-        # print(f"{hwnd}:{name}")
-        find_hwnd = hwnd
-        # return False # 列挙終了。なんか落ちる
-    return True  #  継続
+
+    def __init__(self, address: Optional[str] = None):
+        self.address = instance_address() if address is None else address
+        self.listener = None  # multiprocessing.connection.Listener
+        self.thread: Optional[threading.Thread] = None
+        self.handler: Optional[Callable[[str], Optional[str]]] = None
+        self.closed = False
+
+    def listen(self) -> bool:
+        """!
+        @brief 待ち受けを開始する
+        @retval True 成功
+        @retval False 既に他のプロセスが待ち受けている
+        """
+        from multiprocessing.connection import Listener
+
+        authkey = instance_authkey()
+        try:
+            if sys.platform != "win32":
+                os.makedirs(os.path.dirname(self.address), mode=0o700, exist_ok=True)
+            self.listener = Listener(self.address, authkey=authkey)
+        except OSError:
+            if sys.platform == "win32" or not self.is_stale():
+                return False
+            # 異常終了したプロセスのソケットファイルが残っている
+            try:
+                os.remove(self.address)
+                self.listener = Listener(self.address, authkey=authkey)
+            except OSError:  # 削除できない(他のユーザのファイル)
+                return False
+        return True
+
+    def is_stale(self) -> bool:
+        """!
+        @brief 待ち受けているプロセスが無いソケットファイルか
+        @detail 認証の成否に関係なく、接続できる場合は待ち受けているプロセスがある。
+        """
+        import socket
+
+        with socket.socket(socket.AF_UNIX) as sock:
+            try:
+                sock.connect(self.address)
+            except ConnectionRefusedError:
+                return True
+            except OSError:
+                return False
+        return False
+
+    def start(self, handler: Callable[[str], Optional[str]]) -> None:
+        """!
+        @brief コマンドの受信を開始する
+        @param[in] handler コマンドの処理。受信用のスレッドから呼び出される。戻り値は応答(Noneの場合は"ok")
+        """
+        if self.listener is None and not self.listen():
+            return
+        self.handler = handler
+        self.thread = threading.Thread(target=self.run, name="InstanceServer", daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        from multiprocessing import AuthenticationError
+
+        while not self.closed:
+            try:
+                conn = self.listener.accept()
+            except (AuthenticationError, EOFError, OSError):  # 認証の失敗(他のユーザのプロセス)、接続の切断
+                if self.closed:  # close()で待ち受けを終了した
+                    break
+                continue
+            with conn:
+                try:
+                    command = conn.recv_bytes(4096).decode("utf-8")
+                    reply = None
+                    if command != "ping" and not self.closed and self.handler is not None:
+                        reply = self.handler(command)
+                    conn.send_bytes(("ok" if reply is None else reply).encode("utf-8"))
+                except (OSError, EOFError, UnicodeDecodeError):
+                    continue
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        if self.listener is not None:
+            if self.thread is not None:
+                send_instance_command("ping", self.address)  # accept()の待ちを解除
+                self.thread.join(timeout=1)
+            self.listener.close()
 
 
-def check_duplicate_process() -> int:
+def check_duplicate_process(address: Optional[str] = None) -> int:
     """!
     @brief 2重起動防止
+    @param[in] address アドレス。Noneの場合はinstance_address()
     @retval 0 2重起動していない
-    @retval 1 既に起動している
-    """
-    # キャッシュファイルから探す
-    exec_dir = os.path.dirname(os.path.abspath(__file__))
-    hwnd_path = os.path.join(exec_dir, "AltFN2.hwnd")
-    if os.path.isfile(hwnd_path):
-        with open(hwnd_path, mode="r", encoding="utf-8") as f:
-            hwnd = int(f.read())
-        window_title = win32gui.GetWindowText(hwnd)
-        if window_title.endswith(" - AltFN2"):
-            win32gui.ShowWindow(hwnd, win32con.SW_NORMAL)
-            win32gui.SetForegroundWindow(hwnd)
-            return 1
-    # ウィンドウを探す
-    win32gui.EnumWindows(callback_EnumWindows_window_text_suffix, " - AltFN2")
-    if find_hwnd != 0:
-        # キャッシュファイルに保存
-        with open(hwnd_path, mode="w", encoding="utf-8") as f:
-            f.write(str(find_hwnd))
-        # ウィンドウをアクティブにする
-        win32gui.ShowWindow(find_hwnd, win32con.SW_NORMAL)
-        win32gui.SetForegroundWindow(find_hwnd)
+    @retval 1 既に起動している。起動済みのウィンドウを表示する
+    """
+    if send_instance_command("show", address):
         return 1
     return 0
 
 
-def main(argv: List[str]) -> int:
+def run_cli(args: argparse.Namespace) -> int:
+    """!
+    @brief ウィンドウを表示しない実行(--launch,--list,--match)
+    @param[in] args コマンドラインオプション解析結果
+    @retval 0 成功
+    @retval 1 失敗
+    @detail エラーはメッセージボックスではなく標準エラー出力に出力する。
+    """
+    try:
+        config = load_config(args.config)
+    except ConfigError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if args.launch is not None:
+        key = args.launch
+        if key not in config.launch_dict:
+            print(f"キーが見つかりません。\nkey={key}", file=sys.stderr)
+            return 1
+        if not args.no_forward:  # 同じ設定ファイルの起動済みのプロセスで起動する
+            reply = request_instance(f"launch {os.path.abspath(args.config)}\n{key}")
+            if reply == "ok":
+                return 0
+            if reply is not None and reply.startswith("error\n"):
+                print(reply[len("error\n") :], file=sys.stderr)
+                return 1
+            # 起動済みのプロセスなし、または別の設定ファイル
+        try:
+            launch_by_key(config, key)
+        except LaunchError as e:
+            print(e, file=sys.stderr)
+            return 1
+        usage = UsageStore(args.config + ".usage")
+        usage.append(key, time.time())
+        usage.shutdown()
+        return 0
+    # --list,--match
+    usage = UsageStore(args.config + ".usage")
+    usage.load()
+    usage.shutdown()
+    if args.list:
+        keys = list(config.launch_dict.keys())
+    else:
+        keys = PrefixIndex(config.launch_dict.keys()).keys_with_prefix(args.match)
+    for key in usage.rank(keys):
+        print(f"{key}\t{config.launch_dict[key].title}")
+    return 0 if args.list or len(keys) > 0 else 1  # --matchは一致なしを失敗とする
+
+
+def main(argv: List[str], startup_time: Optional[float] = None) -> int:
     """!
     @brief 主入口点
     @param argv コマンドラインオプション
+    @param startup_time 起動時刻(time.perf_counter())。起動時間の計測用
     @retval 0 成功
     @retval 1 失敗
     """
-    # 2重起動防止
-    if len(argv) >= 2 and argv[1] != "--disable_duplicate_process_check":
-        rc = check_duplicate_process()
-        if rc != 0:
-            return 0
+    startup_profile = StartupProfile(startup_time)
+    startup_profile.mark("imports")
     # オプション解析
     args = analyze_option(argv)
     global g_args
     g_args = args
+    startup_profile.mark("analyze_option")
+    # ウィンドウを表示しない実行
+    if args.launch is not None or args.list or args.match is not None:
+        return run_cli(args)
+    # 2重起動防止
+    if not args.disable_duplicate_process_check:
+        rc = check_duplicate_process()
+        if rc != 0:
+            return 0
     # ウィンドの表示
-    win = MainWindow(config_path=args.config)
+    instance_server = InstanceServer()
+    if not instance_server.listen():  # 他のプロセスが待ち受けている(同時に起動した)
+        if not args.disable_duplicate_process_check and send_instance_command("show"):
+            return 0
+        instance_server = None
+    win = MainWindow(
+        config_path=args.config,
+        profile_paths=args.config_list,
+        startup_profile=startup_profile if args.startup_profile else None,
+        instance_server=instance_server,
+        metrics=Metrics(enabled=args.stats is not None),
+    )
     win.mainloop()
+    win.launcher.shutdown()
+    win.speculator.shutdown()
+    win.processes.stop()
+    win.close_profiles()
+    win.usage.shutdown()
+    win.config_writer.shutdown()  # 書き込み待ちの設定を書き込む
+    if args.stats is not None:
+        win.metrics.write(args.stats)
+    if win.config_watcher is not None:
+        win.config_watcher.stop()
+    if instance_server is not None:
+        instance_server.close()
     return 0
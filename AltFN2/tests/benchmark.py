@@ -0,0 +1,618 @@
+"""!
+@file benchmark.py
+@brief 性能測定
+@detail AltFN2ディレクトリで python -m tests.benchmark を実行する。
+画面の無い環境でも動くように、tkinter,win32,keyboardは代替モジュール(tests/headless.py)を使用する。
+結果はJSONで保存でき、保存済みの結果と比較して一定以上遅くなった項目があれば失敗(終了コード1)にする。
+"""
+
+import argparse
+import dataclasses
+import gc
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Callable, List, Optional
+
+from tests import headless
+
+headless.install()  # src.mainより先に登録する
+
+import dacite
+
+from src.main import (
+    Config,
+    FuzzyIndex,
+    Launch,
+    LaunchPlanner,
+    MainWindow,
+    StatCache,
+    UsageStore,
+    Variable,
+    VariableExpander,
+    check_launch_plan,
+    config_cache_path,
+    config_from_dict,
+    load_config,
+    load_config_files,
+    remove_none_keys,
+    replace_env,
+    spawn_launch,
+)
+
+g_results: dict[str, float] = {}  # 測定項目名→1回あたりの実行時間[秒]
+g_memory_results: dict[str, int] = {}  # 測定項目名→メモリ量[バイト]
+
+
+def replace_variable_old(variable_list: list[Variable], s: str) -> str:
+    """従来のMainWindow.replace_variable()"""
+    matches = re.findall(r"%([^%]+)%", s)
+    for match in matches:
+        value = next((x.value for x in variable_list if x.name == match), None)
+        if value is None:
+            value = os.environ.get(match)
+        if value is not None:
+            s = s.replace(f"%{match}%", value)
+    return s
+
+
+def replace_env_old(s: str) -> str:
+    """従来のreplace_env()"""
+    matches = re.findall(r"%([^%]+)%", s)
+    for match in matches:
+        value = os.environ.get(match)
+        if value is not None:
+            s = s.replace(f"%{match}%", value)
+    return s
+
+
+@dataclass(kw_only=True)
+class WindowGeometryOld:
+    """従来のWindowGeometry(__slots__なし)"""
+
+    width: int = 0
+    height: int = 0
+    x: int = 0
+    y: int = 0
+
+
+@dataclass(kw_only=True)
+class LaunchOld:
+    """従来のLaunch(__slots__なし、文字列の共有なし)"""
+
+    title: str = ""
+    program_path: str
+    args: Optional[list[str]]
+    work_dir: Optional[str]
+    shell: Optional[bool]
+
+
+@dataclass(kw_only=True)
+class VariableOld:
+    name: str = ""
+    value: str = ""
+
+
+@dataclass(kw_only=True)
+class ConfigOld:
+    version: str = ""
+    main_window_geometry: WindowGeometryOld = field(default_factory=WindowGeometryOld)
+    actions_after_launch: Optional[str] = None
+    active_key_interval: int = 300
+    font_name: str = "ＭＳ ゴシック"
+    font_size: int = 12
+    hotkey: str = ""
+    variable_list: list[VariableOld] = field(default_factory=list)
+    launch_dict: dict[str, LaunchOld] = field(default_factory=dict)
+
+
+def make_config_dic(n_launches: int, n_variables: int = 10) -> dict:
+    """!
+    @brief 合成した設定ファイルの辞書
+    @param[in] n_launches launch_dictの件数
+    @param[in] n_variables variable_listの件数
+    """
+    launch_dict = {}
+    for i in range(n_launches):
+        launch = {"title": f"アプリケーション{i}", "program_path": f"%VAR{i % n_variables}%/app{i}/app{i}.exe"}
+        if i % 2 == 0:
+            launch["args"] = [f"--option{i}", "%LOCALAPPDATA%/file.txt"]
+        if i % 3 == 0:
+            launch["work_dir"] = f"C:/work{i % 100}"
+        if i % 5 == 0:
+            launch["shell"] = False
+        launch_dict[f"k{i:06d}"] = launch
+    return {
+        "version": "0.5.0",
+        "hotkey": "ctrl+alt+q",
+        "main_window_geometry": {"width": 512, "height": 512, "x": 0, "y": 0},
+        "variable_list": [{"name": f"VAR{i}", "value": f"C:/value{i}"} for i in range(n_variables)],
+        "launch_dict": launch_dict,
+    }
+
+
+def measure(func: Callable[[], object], number: int = 100, repeat: int = 5) -> float:
+    """!
+    @brief 1回あたりの実行時間[秒]。repeat回測定した最小値
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def record(name: str, elapsed: float) -> None:
+    """!
+    @brief 測定結果を記録して表示する
+    @param[in] name 測定項目名
+    @param[in] elapsed 1回あたりの実行時間[秒]
+    """
+    g_results[name] = elapsed
+    print(f"{name:<40}     {elapsed * 1e6:10.2f}us")
+
+
+def report(name: str, old: float, new: float) -> None:
+    """!
+    @brief 従来の実装との比較結果を記録して表示する
+    """
+    g_results[name] = new
+    print(f"{name:<40} old={old * 1e6:10.2f}us new={new * 1e6:10.2f}us ratio={old / new:8.1f}")
+
+
+def bench_replace_variable() -> None:
+    os.environ.setdefault("BENCH_ENV", "C:/bench")
+    for n_variables, n_args in [(10, 10), (100, 50), (1000, 100)]:
+        variable_list = [Variable(name=f"VAR{i}", value=f"C:/value{i}") for i in range(n_variables)]
+        # program_path,args,work_dirを想定した文字列。最後の変数ほど線形探索が遅い
+        strings = [f"%VAR{n_variables - 1 - i % n_variables}%/%BENCH_ENV%/arg{i}" for i in range(n_args + 2)]
+        variables = VariableExpander(variable_list)
+        assert [variables.expand(s) for s in strings] == [replace_variable_old(variable_list, s) for s in strings]
+        old = measure(lambda: [replace_variable_old(variable_list, s) for s in strings])
+        new = measure(lambda: [variables.expand(s) for s in strings])
+        report(f"replace_variable vars={n_variables} args={n_args}", old, new)
+    s = "%BENCH_ENV%/%NOENV%/bin/%BENCH_ENV%"
+    report("replace_env", measure(lambda: replace_env_old(s), 10000), measure(lambda: replace_env(s), 10000))
+
+
+def bench_config_decode() -> None:
+    for n_launches in [1000, 10000, 100000]:
+        text = json.dumps(make_config_dic(n_launches))
+        json_dic = json.loads(text)
+        assert config_from_dict(json_dic) == dacite.from_dict(data_class=Config, data=json_dic)
+        number = max(1, 10000 // n_launches)
+        parse = measure(lambda: json.loads(text), number, 3)
+        old = measure(lambda: dacite.from_dict(data_class=Config, data=json_dic), number, 3)
+        new = measure(lambda: config_from_dict(json_dic), number, 3)
+        report(f"config decode launches={n_launches}", old, new)
+        record(f"json.loads launches={n_launches}", parse)
+
+
+def traced_memory(func: Callable[[], object]) -> tuple[object, int]:
+    """!
+    @brief 関数が生成して保持しているメモリ量
+    @return (戻り値, メモリ量[バイト])
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def bench_memory() -> None:
+    for n_launches in [10000, 100000]:
+        text = json.dumps(make_config_dic(n_launches))
+        old, old_size = traced_memory(lambda: dacite.from_dict(data_class=ConfigOld, data=json.loads(text)))
+        new, new_size = traced_memory(lambda: config_from_dict(json.loads(text)))
+        # 従来のLaunchにあるフィールドだけを比較する(Launchに追加したフィールドは省略値)
+        names = [f.name for f in dataclasses.fields(LaunchOld)]
+        for key, launch in old.launch_dict.items():
+            assert [getattr(launch, name) for name in names] == [getattr(new.launch_dict[key], name) for name in names]
+        del old, new
+        g_memory_results[f"memory launches={n_launches}"] = new_size
+        print(
+            f"{'memory launches=' + str(n_launches):<40} old={old_size / 2**20:8.2f}MiB new={new_size / 2**20:8.2f}MiB"
+            f" ratio={old_size / new_size:8.2f}"
+        )
+
+
+def bench_fuzzy_search() -> None:
+    config = config_from_dict(make_config_dic(50000))
+    start = timeit.default_timer()
+    index = FuzzyIndex(config.launch_dict)
+    index.warm_up()
+    record("fuzzy index build launches=50000", timeit.default_timer() - start)
+    for query in ["k0123", "アプリ", "option", "app12", "k9x"]:
+        elapsed = measure(lambda: index.search(query, 100), 10, 3)
+        record(f"fuzzy search {query}", elapsed)
+
+
+def bench_usage_store() -> None:
+    n_launches = 1000000
+    keys = [f"k{i:06d}" for i in range(10000)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "config.json.usage")
+        with open(path, mode="w", encoding="utf-8") as f:
+            for i in range(n_launches):  # 集約されていない履歴
+                f.write(f"{1700000000 + i * 60}\t{keys[(i * 7919) % len(keys)] if i % 3 else keys[i % 10]}\n")
+        usage = UsageStore(path)
+        start = timeit.default_timer()
+        usage.load()
+        record("usage load launches=1000000", timeit.default_timer() - start)
+        start = timeit.default_timer()
+        usage.compact()
+        record("usage compact", timeit.default_timer() - start)
+        usage = UsageStore(path)
+        start = timeit.default_timer()
+        usage.load()
+        record("usage load (compacted)", timeit.default_timer() - start)
+        elapsed = measure(lambda: usage.rank(keys), 10, 3)
+        record("usage rank keys=10000", elapsed)
+        usage.shutdown()
+
+
+def bench_config_shards() -> None:
+    n_shards = 10
+    n_launches = 10000  # 1ファイルあたり
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i in range(n_shards):
+            config_dic = make_config_dic(n_launches)
+            config_dic["launch_dict"] = {f"s{i}_{key}": launch for key, launch in config_dic["launch_dict"].items()}
+            with open(os.path.join(tmp_dir, f"shard{i:02d}.json"), mode="w", encoding="utf-8") as f:
+                json.dump(config_dic, f, ensure_ascii=False)
+        config_path = os.path.join(tmp_dir, "config.json")
+        with open(config_path, mode="w", encoding="utf-8") as f:
+            json.dump({"include": ["shard*.json"]}, f)
+        shard_cache: dict = {}
+        start = timeit.default_timer()
+        loaded = load_config_files(config_path, shard_cache)
+        record(f"config shards load x{n_shards} (no cache)", timeit.default_timer() - start)
+        assert len(loaded.config.launch_dict) == n_shards * n_launches
+        record(f"config shards reload x{n_shards}", measure(lambda: load_config_files(config_path, shard_cache), 3, 3))
+        record(f"config shards load x{n_shards} (snapshot)", measure(lambda: load_config_files(config_path), 1, 3))
+        shard_path = os.path.join(tmp_dir, "shard00.json")
+
+        def reload_one():
+            os.utime(shard_path, ns=(0, time.time_ns()))  # 1ファイルだけ更新
+            load_config_files(config_path, shard_cache)
+
+        record(f"config shards reload x{n_shards} (1 changed)", measure(reload_one, 3, 3))
+
+
+def spawn_old(launch: Launch, expand: Callable[[str], str]) -> subprocess.Popen:
+    """従来のprepare_launch()とspawn_launch()。起動のたびに変数を展開してパスを検証する"""
+    cmd = [expand(launch.program_path)]
+    if not os.path.isfile(cmd[0]):
+        raise FileNotFoundError(cmd[0])
+    if launch.args is not None:
+        cmd.extend(expand(arg) for arg in launch.args)
+    if launch.work_dir is not None:
+        cwd = expand(launch.work_dir)
+        if not os.path.isdir(cwd):
+            raise FileNotFoundError(cwd)
+    else:
+        cwd = os.path.dirname(cmd[0])
+    return subprocess.Popen(cmd, cwd=cwd, shell=launch.shell == True)
+
+
+def bench_spawn() -> None:
+    """!
+    @brief 実際のプロセスの起動(/bin/true)。POSIXのみ
+    @detail 従来は起動のたびに変数の展開とパスの検証を行う。新しい実装は作成済みの起動の計画を使う。
+    終了したプロセスの回収は測定に含めない。
+    """
+    if sys.platform == "win32" or not os.path.isfile("/bin/true"):
+        return
+    variable_list = [Variable(name=f"VAR{i}", value=f"/value{i}") for i in range(100)]
+    variables = VariableExpander(variable_list + [Variable(name="BIN", value="/bin")])
+    args = [f"--arg{i}=%VAR{i}%" for i in range(20)]
+    launch = Launch(program_path="%BIN%/true", args=args, work_dir="%BIN%", shell=None)
+    planner = LaunchPlanner(variables.expand, variables.variables)
+    stat_cache = StatCache()
+
+    def spawn_new() -> subprocess.Popen:
+        plan = planner.get("true", launch)
+        check_launch_plan(plan, stat_cache)
+        return spawn_launch(plan)
+
+    def measure_spawn(spawn: Callable[[], subprocess.Popen], number: int = 20, repeat: int = 20) -> float:
+        elapsed = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            processes = [spawn() for _ in range(number)]
+            elapsed.append(time.perf_counter() - start)
+            for process in processes:
+                process.wait()
+        return min(elapsed) / number
+
+    old = measure_spawn(lambda: spawn_old(launch, variables.expand))
+    report("spawn /bin/true", old, measure_spawn(spawn_new))
+    # Popenを除いた準備(変数の展開とパスの検証)
+    popen = subprocess.Popen
+    subprocess.Popen = FakePopen
+    try:
+        old = measure(lambda: spawn_old(launch, variables.expand), 1000)
+        report("spawn prepare", old, measure(spawn_new, 1000))
+    finally:
+        subprocess.Popen = popen
+
+
+class FakePopen:
+    """subprocess.Popenの代替。プロセスは起動しない。"""
+
+    def __init__(self, cmd: list[str], cwd: str, shell: bool, **options):
+        self.args = cmd
+        self.pid = 0
+
+    def poll(self) -> int:
+        return 0  # 終了済み
+
+
+def bench_main_window(n_launches: int) -> None:
+    """!
+    @brief MainWindowの処理を測定する
+    @param[in] n_launches launch_dictの件数
+    @detail 設定ファイルの読み書き、キー入力から一覧表の更新まで、アプリケーションの起動(Popenは代替)。
+    """
+    number = max(1, 10000 // n_launches)
+    config_dic = make_config_dic(n_launches)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 起動できるアプリケーション
+        config_dic["launch_dict"]["run"] = {"title": "run", "program_path": sys.executable, "work_dir": tmp_dir}
+        config_path = os.path.join(tmp_dir, "config.json")
+        with open(config_path, mode="w", encoding="utf-8") as f:
+            json.dump(config_dic, f, ensure_ascii=False)
+        start = timeit.default_timer()
+        win = MainWindow(config_path=config_path)
+        record(f"MainWindow() launches={n_launches}", timeit.default_timer() - start)
+        win.visiblility_time = datetime(2000, 1, 1)  # キー入力を無視する時間を過ぎている
+        win.update()
+        #
+        record(f"config_read launches={n_launches}", measure(win.config_read, number, 3))
+        win.update()
+
+        def load_config_no_cache():
+            os.remove(config_cache_path(config_path))
+            load_config(config_path)
+
+        record(f"config_read (no cache) launches={n_launches}", measure(load_config_no_cache, number, 3))
+        # 設定ファイルの書き込み。UIのスレッドの時間と、書き込みの完了までの時間
+        writer = win.config_writer
+        x = iter(range(10**9))
+        win.winfo_x = lambda: next(x)  # ウィンドウの移動
+
+        def config_write(dirty: bool, wait: bool):
+            if dirty:
+                writer.mark_dirty()
+            win.config_write()
+            if wait:
+                writer.flush()
+
+        record(f"config_write launches={n_launches}", measure(lambda: config_write(True, True), number, 3))
+        record(f"config_write (geometry) launches={n_launches}", measure(lambda: config_write(False, True), number, 3))
+        record(f"config_write (UI thread) launches={n_launches}", measure(lambda: config_write(True, False), number, 3))
+        writer.flush()
+        json_dic = dataclasses.asdict(win.config_data)
+        remove_none_keys(json_dic)  # 2回目以降は削除するキーが無い。走査の時間
+        record(f"remove_none_keys launches={n_launches}", measure(lambda: remove_none_keys(json_dic), number, 3))
+        launches = list(win.config_data.launch_dict.values())[:1000]
+        record(
+            f"replace_variable x1000 launches={n_launches}",
+            measure(lambda: [win.replace_variable(launch.program_path) for launch in launches], 10, 3),
+        )
+        # キー入力→検索→一覧表の更新。1キーあたりの時間
+        events = [SimpleNamespace(keysym=c, char=c) for c in "k0001"] + [SimpleNamespace(keysym="Escape", char="")]
+
+        def type_keys(burst: bool):
+            for e in events:
+                win.key_event(e)
+                if not burst:
+                    win.update()  # 1キーごとに更新
+            win.update()
+
+        elapsed = measure(lambda: type_keys(False), number, 3)
+        record(f"key_event launches={n_launches}", elapsed / len(events))
+        elapsed = measure(lambda: type_keys(True), number, 3)  # 高速な入力・貼り付け。更新はまとめて1回
+        record(f"key_event (burst) launches={n_launches}", elapsed / len(events))
+        win.metrics.enabled = True  # 統計の記録による増加分
+        elapsed = measure(lambda: type_keys(False), number, 3)
+        win.metrics.enabled = False
+        record(f"key_event (stats) launches={n_launches}", elapsed / len(events))
+        record(f"update_launch_table launches={n_launches}", measure(win.update_launch_table, number, 3))
+
+        def update_launch_table_cold():
+            win.clear_launch_table()
+            win.update_launch_table()
+
+        record(f"update_launch_table (cold) launches={n_launches}", measure(update_launch_table_cold, number, 3))
+        # アプリケーションの起動。受け付けから完了通知の処理まで
+        launch = win.config_data.launch_dict["run"]
+        popen = subprocess.Popen
+        subprocess.Popen = FakePopen
+        try:
+
+            def exec_program():
+                win.exec_program(launch, "run")
+                win.wait_until(lambda: len(win.launcher.pending) == 0)
+
+            record(f"exec_program launches={n_launches}", measure(exec_program, number, 3))
+            # 一意に一致した時点で準備済み(speculative_launch)の場合
+            elapsed = []
+            for _ in range(min(number, 20)):
+                ready = win.speculator.stats()["ready"]
+                win.speculator.speculate("run", launch, win.variables.expand)
+                while win.speculator.stats()["ready"] == ready:
+                    time.sleep(0.001)
+                start = time.perf_counter()
+                exec_program()
+                elapsed.append(time.perf_counter() - start)
+            record(f"exec_program (speculated) launches={n_launches}", min(elapsed))
+        finally:
+            subprocess.Popen = popen
+        # ホットキーの入力(keyboardのスレッド)からウィンドウの表示まで
+        for _ in range(20):
+            count = win.hotkey_latency.count
+            threading.Thread(target=win.show_window).start()
+            win.wait_until(lambda: win.hotkey_latency.count > count)
+        record(f"hotkey latency (p50) launches={n_launches}", win.hotkey_latency.to_dict()["p50"] / 1000)
+        assert headless.messagebox.messages == [], headless.messagebox.messages
+        win.launcher.shutdown()
+        win.usage.shutdown()
+        win.config_writer.shutdown()
+        win.update()
+
+
+def bench_profiles() -> None:
+    """!
+    @brief 複数のプロファイルの起動時間と切り替え
+    @detail 1ファイルの起動(従来)と5プロファイルの起動を、MainWindow()から最初の描画(update())までで比較する。
+    有効でないプロファイルの読み込みは表示後にバックグラウンドで行うので、開始から完了までの時間は別に記録する。
+    """
+    n_profiles = 5
+    n_launches = 10000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for i in range(n_profiles):
+            config_dic = make_config_dic(n_launches)
+            config_dic["launch_dict"] = {f"p{i}_{key}": launch for key, launch in config_dic["launch_dict"].items()}
+            paths.append(os.path.join(tmp_dir, f"profile{i}.json"))
+            with open(paths[-1], mode="w", encoding="utf-8") as f:
+                json.dump(config_dic, f, ensure_ascii=False)
+
+        def start(profile_paths: list[str]) -> tuple[MainWindow, float]:
+            gc.collect()  # 前回の測定のごみの回収を含めない
+            start_time = timeit.default_timer()
+            win = MainWindow(config_path=profile_paths[0], profile_paths=profile_paths)
+            win.update()  # 最初の描画
+            return win, timeit.default_timer() - start_time
+
+        def close(win: MainWindow) -> None:
+            win.close_profiles()
+            win.launcher.shutdown()
+            win.usage.shutdown()
+            win.config_writer.shutdown()
+            win.update()
+            time.sleep(0.5)  # パスの検証のスレッドの終了待ち
+
+        for profile_paths in [paths[:1], paths]:  # スナップショットを作成する
+            close(start(profile_paths)[0])
+        old_elapsed, new_elapsed, loaded = [], [], []
+        for i in range(5):  # 交互に測定する
+            win, t = start(paths[:1])
+            old_elapsed.append(t)
+            close(win)
+            win, t = start(paths)
+            new_elapsed.append(t)
+            win.wait_until(lambda: all(profile.future is not None for profile in win.profiles[1:]))
+            start_time = timeit.default_timer()
+            for profile in win.profiles[1:]:
+                profile.future.result()
+            loaded.append(timeit.default_timer() - start_time)
+            if i < 4:
+                close(win)
+        report(f"startup profiles={n_profiles} launches={n_launches}", min(old_elapsed), min(new_elapsed))
+        record(f"profiles load (background) x{n_profiles - 1}", min(loaded))
+        win.visiblility_time = datetime(2000, 1, 1)
+        for i in range(n_profiles):  # 初回の切り替え(書き込みと起動履歴の作成、パスの検証)
+            win.switch_profile((i + 1) % n_profiles)
+            win.wait_until(lambda: win.validate_pending == 0)
+        index = iter(range(10**9))
+        record(f"switch_profile launches={n_launches}", measure(lambda: win.switch_profile(next(index) % 2), 20, 3))
+        assert headless.messagebox.messages == [], headless.messagebox.messages
+        close(win)
+
+
+def compare_results(
+    baseline: dict[str, float],
+    current: dict[str, float],
+    threshold: float,
+    unit: tuple[str, float, float] = ("us", 1e6, 1e-6),
+) -> list[str]:
+    """!
+    @brief 保存済みの結果と比較する
+    @param[in] baseline 保存済みの結果
+    @param[in] current 今回の結果
+    @param[in] threshold 許容する増加率。0.2の場合は20%まで
+    @param[in] unit (表示の単位, 表示の倍率, 測定誤差として扱う差)。既定値は実行時間[秒]をus単位で表示し、1us未満の差は無視する
+    @return 許容範囲を超えて増加した測定項目名
+    """
+    unit_name, scale, tolerance = unit
+    regressions = []
+    for name, value in current.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<40} {'':>12}   {value * scale:10.2f}{unit_name} (new)")
+            continue
+        ratio = value / base if base > 0 else float("inf")
+        regression = ratio > 1 + threshold and value - base >= tolerance
+        if regression:
+            regressions.append(name)
+        mark = " REGRESSION" if regression else ""
+        print(f"{name:<40} {base * scale:10.2f}{unit_name} → {value * scale:10.2f}{unit_name} {ratio:6.2f}x{mark}")
+    return regressions
+
+
+def analyze_option(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m tests.benchmark", description="AltFN2の性能測定")
+    parser.add_argument("--sizes", default="100,1000,10000,100000", help="MainWindowの測定に使うlaunch_dictの件数")
+    parser.add_argument(
+        "--only",
+        default=None,
+        help="測定する処理。カンマ区切り(replace_variable,config_decode,config_shards,memory,fuzzy,usage,spawn,profiles,window)",
+    )
+    parser.add_argument("--output", default=None, help="結果を保存するJSONファイル")
+    parser.add_argument("--compare", default=None, help="比較する保存済みのJSONファイル")
+    parser.add_argument("--threshold", type=float, default=0.2, help="許容する増加率(既定値 0.2 = 20%%)")
+    return parser.parse_args(argv[1:])
+
+
+def main(argv: List[str]) -> int:
+    args = analyze_option(argv)
+    only: Optional[set[str]] = None if args.only is None else set(args.only.split(","))
+    benches: list[tuple[str, Callable[[], None]]] = [
+        ("replace_variable", bench_replace_variable),
+        ("config_decode", bench_config_decode),
+        ("config_shards", bench_config_shards),
+        ("memory", bench_memory),
+        ("fuzzy", bench_fuzzy_search),
+        ("usage", bench_usage_store),
+        ("spawn", bench_spawn),
+        ("profiles", bench_profiles),
+    ]
+    for n_launches in [int(x) for x in args.sizes.split(",")]:
+        benches.append(("window", lambda n_launches=n_launches: bench_main_window(n_launches)))
+    with tempfile.TemporaryDirectory() as cache_dir:  # 設定ファイルのスナップショットをユーザのキャッシュに残さない
+        os.environ["XDG_CACHE_HOME"] = os.environ["LOCALAPPDATA"] = cache_dir
+        for name, bench in benches:
+            if only is None or name in only:
+                bench()
+    if args.output is not None:
+        result = {"python": sys.version, "platform": sys.platform, "results": g_results, "memory": g_memory_results}
+        with open(args.output, mode="w", encoding="utf-8") as f:
+            json.dump(result, f, indent=4, ensure_ascii=False)
+    if args.compare is not None:
+        with open(args.compare, mode="r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print()
+        regressions = compare_results(baseline["results"], g_results, args.threshold)
+        # メモリ量はMiB単位で表示し、1KiB未満の差は無視する
+        regressions += compare_results(
+            baseline.get("memory", {}), g_memory_results, args.threshold, ("MiB", 2**-20, 1024)
+        )
+        if len(regressions) > 0:
+            print(f"{len(regressions)}件の測定項目が{args.threshold:.0%}を超えて悪化しました: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
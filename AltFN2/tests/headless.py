@@ -0,0 +1,304 @@
+"""!
+@file headless.py
+@brief 画面の無い環境でMainWindowを動かすための代替モジュール
+@detail tkinter,tkinter.ttk,tkinter.messagebox,win32gui,win32con,keyboardの代替をsys.modulesに登録する。
+src.mainより先にinstall()を呼び出すこと。描画は行わず、ウィジェットの状態とイベントの予約だけを記録する。
+"""
+
+import collections
+import heapq
+import sys
+import threading
+import time
+import types
+from typing import Any, Callable, Optional
+
+
+class FakeWidget:
+    """tkinterのウィジェットの代替。オプションを記録するだけ。"""
+
+    def __init__(self, master: Any = None, **options):
+        self.master = master
+        self.options: dict[str, Any] = dict(options)
+        self.bindings: dict[str, Callable] = {}
+
+    def __getitem__(self, key: str) -> Any:
+        return self.options.get(key, "")
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.options[key] = value
+
+    def config(self, **options) -> None:
+        self.options.update(options)
+
+    configure = config
+
+    def bind(self, sequence: str, func: Callable) -> None:
+        self.bindings[sequence] = func
+
+    def grid(self, **options) -> None:
+        pass
+
+    def pack(self, **options) -> None:
+        pass
+
+
+class FakeMenu(FakeWidget):
+    def add_command(self, **options) -> None:
+        pass
+
+    def add_cascade(self, **options) -> None:
+        pass
+
+    def add_separator(self) -> None:
+        pass
+
+
+class FakeTreeview(FakeWidget):
+    """ttk.Treeviewの代替。行の値とタグ、表示順を記録する。"""
+
+    def __init__(self, master: Any = None, **options):
+        super().__init__(master, **options)
+        self.items: dict[str, tuple] = {}
+        self.tags: dict[str, tuple] = {}
+        self.children: list[str] = []
+        self.headings: dict[str, str] = {}
+        self.focus_item = ""
+
+    def column(self, column: str, **options) -> None:
+        pass
+
+    def heading(self, column: str, text: str = "", **options) -> None:
+        self.headings[column] = text
+
+    def tag_configure(self, tagname: str, **options) -> None:
+        pass
+
+    def yview(self, *args) -> None:
+        pass
+
+    def insert(self, parent: str, index: str, iid: str, values: tuple = (), tags: tuple = ()) -> str:
+        self.items[iid] = values
+        self.tags[iid] = tags
+        self.children.append(iid)
+        return iid
+
+    def set_children(self, item: str, *newchildren: str) -> None:
+        self.children = list(newchildren)
+
+    def delete(self, *items: str) -> None:
+        for iid in items:
+            del self.items[iid]
+            del self.tags[iid]
+        self.children = [iid for iid in self.children if iid in self.items]
+
+    def item(
+        self, iid: str, option: Optional[str] = None, values: Optional[tuple] = None, tags: Optional[tuple] = None
+    ):
+        if option == "values":
+            return self.items[iid]
+        if values is not None:
+            self.items[iid] = values
+        if tags is not None:
+            self.tags[iid] = tags
+
+    def focus(self) -> str:
+        return self.focus_item
+
+
+class FakeScrollbar(FakeWidget):
+    def set(self, *args) -> None:
+        pass
+
+
+class FakeTk(FakeWidget):
+    """!
+    @brief tkinter.Tkの代替
+    @detail after()等で予約した関数はupdate()で実行する。after()は他のスレッドから呼び出してよい。
+    時間を指定したafter()は、その時間が経過した後のupdate()で実行する。
+    """
+
+    def __init__(self):
+        super().__init__(None)
+        self.events: collections.deque = collections.deque()  # 予約した関数と引数
+        self.timers: list[tuple[float, int, Callable, tuple]] = []  # (実行時刻, 番号, 関数, 引数)のヒープ
+        self.timer_count = 0
+        self.event_ready = threading.Condition()
+        self.state = "normal"
+        self.destroyed = False
+        self.geometry_text = ""
+        self.clipboard = ""
+
+    def after(self, ms: int, func: Callable, *args) -> str:
+        with self.event_ready:
+            if ms > 0:
+                self.timer_count += 1
+                heapq.heappush(self.timers, (time.perf_counter() + ms / 1000, self.timer_count, func, args))
+            else:
+                self.events.append((func, args))
+            self.event_ready.notify()
+        return "after"
+
+    def after_idle(self, func: Callable, *args) -> str:
+        return self.after(0, func, *args)
+
+    def event_generate(self, sequence: str, when: str = "now") -> None:
+        handler = self.bindings.get(sequence)
+        if handler is not None:
+            self.after(0, handler, None)
+
+    def update(self) -> int:
+        """!
+        @brief 予約済みの関数を全て実行する
+        @return 実行した件数
+        """
+        count = 0
+        while True:
+            with self.event_ready:
+                now = time.perf_counter()
+                while len(self.timers) > 0 and self.timers[0][0] <= now:
+                    _, _, func, args = heapq.heappop(self.timers)
+                    self.events.append((func, args))
+                if len(self.events) == 0:
+                    return count
+                func, args = self.events.popleft()
+            func(*args)
+            count += 1
+
+    def wait_until(self, predicate: Callable[[], bool], timeout: float = 10.0) -> bool:
+        """!
+        @brief 条件が成立するまで予約された関数を実行する
+        @param[in] predicate 条件
+        @param[in] timeout タイムアウト[秒]
+        @retval True 条件が成立した
+        @retval False タイムアウト
+        """
+        end_time = time.perf_counter() + timeout
+        while True:
+            self.update()
+            if predicate():
+                return True
+            with self.event_ready:
+                now = time.perf_counter()
+                if now >= end_time:
+                    return False
+                if len(self.events) == 0:
+                    next_timer = self.timers[0][0] if len(self.timers) > 0 else end_time
+                    self.event_ready.wait(min(next_timer, end_time) - now)
+
+    def mainloop(self) -> None:
+        while not self.destroyed:
+            self.wait_until(lambda: self.destroyed)
+
+    def destroy(self) -> None:
+        self.destroyed = True
+
+    def title(self, text: str) -> None:
+        self.options["title"] = text
+
+    def geometry(self, text: str) -> None:
+        self.geometry_text = text
+
+    def winfo_x(self) -> int:
+        return 10
+
+    def winfo_y(self) -> int:
+        return 20
+
+    def winfo_width(self) -> int:
+        return 512
+
+    def winfo_height(self) -> int:
+        return 512
+
+    def wm_frame(self) -> str:
+        return "0x0"
+
+    def iconify(self) -> None:
+        self.state = "iconic"
+
+    def deiconify(self) -> None:
+        self.state = "normal"
+
+    def lift(self) -> None:
+        pass
+
+    def focus_force(self) -> None:
+        pass
+
+    def clipboard_get(self) -> str:
+        return self.clipboard
+
+    def clipboard_clear(self) -> None:
+        self.clipboard = ""
+
+    def clipboard_append(self, text: str) -> None:
+        self.clipboard += text
+
+
+class FakeMessagebox:
+    """tkinter.messageboxの代替。表示したメッセージを記録する。"""
+
+    def __init__(self):
+        self.messages: list[tuple[str, str, str]] = []  # (種類, タイトル, メッセージ)
+
+    def showerror(self, title: str, message: str) -> str:
+        self.messages.append(("error", title, message))
+        return "ok"
+
+    def showinfo(self, title: str, message: str) -> str:
+        self.messages.append(("info", title, message))
+        return "ok"
+
+
+messagebox = FakeMessagebox()
+hotkeys: dict[str, Callable] = {}  # keyboard.add_hotkey()で登録したホットキー
+
+
+def make_modules() -> dict[str, types.ModuleType]:
+    """!
+    @brief 代替モジュールを作成する
+    @return モジュール名→モジュール
+    """
+    tkinter = types.ModuleType("tkinter")
+    tkinter.__path__ = []  # パッケージとして扱う
+    tkinter.Tk = FakeTk
+    tkinter.Menu = FakeMenu
+    for name in ["E", "W", "N", "S", "X", "Y", "BOTH", "LEFT", "RIGHT", "CENTER", "VERTICAL", "NSEW"]:
+        setattr(tkinter, name, name.lower())
+    ttk = types.ModuleType("tkinter.ttk")
+    ttk.Frame = FakeWidget
+    ttk.Label = FakeWidget
+    ttk.Treeview = FakeTreeview
+    ttk.Scrollbar = FakeScrollbar
+    tkinter_messagebox = types.ModuleType("tkinter.messagebox")
+    tkinter_messagebox.showerror = messagebox.showerror
+    tkinter_messagebox.showinfo = messagebox.showinfo
+    tkinter.ttk = ttk
+    tkinter.messagebox = tkinter_messagebox
+    #
+    win32gui = types.ModuleType("win32gui")
+    win32gui.ShowWindow = lambda hwnd, cmd: None
+    win32gui.SetForegroundWindow = lambda hwnd: None
+    win32con = types.ModuleType("win32con")
+    win32con.SW_NORMAL = 1
+    keyboard = types.ModuleType("keyboard")
+    keyboard.add_hotkey = hotkeys.__setitem__
+    return {
+        "tkinter": tkinter,
+        "tkinter.ttk": ttk,
+        "tkinter.messagebox": tkinter_messagebox,
+        "win32gui": win32gui,
+        "win32con": win32con,
+        "keyboard": keyboard,
+    }
+
+
+def install() -> None:
+    """!
+    @brief 代替モジュールをsys.modulesに登録する
+    @exception RuntimeError src.mainをimport済み
+    """
+    if "src.main" in sys.modules or "main" in sys.modules:
+        raise RuntimeError("src.mainより先にinstall()を呼び出してください")
+    sys.modules.update(make_modules())
@@ -1,11 +1,75 @@
 import configparser
+import copy
 import dataclasses
 import json
 import os
+import pickle
+import queue
+import random
+import socket
+import stat
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Optional
 
+import dacite
 import pytest
 
-from src.main import Config, Launch, remove_none_keys, replace_env
+import src.main
+from src.main import (
+    Config,
+    ConfigError,
+    ConfigWatcher,
+    ConfigWriter,
+    FuzzyIndex,
+    GroupMember,
+    InstanceServer,
+    LatencyStats,
+    Launch,
+    Launcher,
+    LaunchError,
+    LaunchOptions,
+    LaunchPlanner,
+    LaunchSpeculator,
+    MainWindow,
+    Metrics,
+    PrefixIndex,
+    ProcessRegistry,
+    Profile,
+    StartupProfile,
+    StatCache,
+    UsageStore,
+    Variable,
+    VariableExpander,
+    WindowGeometry,
+    analyze_option,
+    check_duplicate_process,
+    check_launch_dict,
+    compile_launch,
+    config_cache_key,
+    config_cache_path,
+    config_cache_read,
+    config_cache_write,
+    config_from_dict,
+    diff_config,
+    instance_address,
+    instance_authkey,
+    load_config_files,
+    load_profile,
+    remove_none_keys,
+    replace_env,
+    request_instance,
+    resolve_launch_group,
+    run_cli,
+    send_instance_command,
+    spawn_launch,
+    validate_launches,
+    warm_up_file,
+)
 
 
 def split_string_quotes(s: str) -> list[str]:
@@ -96,3 +160,1734 @@ def test_sreplace_env_0201B(monkeypatch):
     monkeypatch.setenv('LOCALAPPDATA', 'kondou')
     result = replace_env("ab")
     assert result == "ab"
+
+
+PREFIX_INDEX_KEYS = ["mw", "a5m2", "me", "mf", "calc", "mp2", "mp", "m", "b"]
+
+
+@pytest.mark.parametrize("prefix", ["", "m", "mp", "mp2", "mp3", "a", "c", "z", "\U0010ffff"])
+def test_PrefixIndex_keys_with_prefix_0101N(prefix: str):
+    index = PrefixIndex(PREFIX_INDEX_KEYS)
+    expected = [key for key in PREFIX_INDEX_KEYS if key.startswith(prefix)]
+    assert index.keys_with_prefix(prefix) == expected
+    assert index.count(prefix) == len(expected)
+
+
+@pytest.mark.parametrize(
+    "test_id, prefix, expected",
+    [
+        ("0101N", "a", "a5m2"),
+        ("0102N", "mp2", "mp2"),
+        ("0103A", "m", None),  # 複数件
+        ("0104A", "z", None),  # 0件
+    ],
+)
+def test_PrefixIndex_unique_key_0001X(test_id: str, prefix: str, expected: Optional[str]):
+    index = PrefixIndex(PREFIX_INDEX_KEYS)
+    assert index.unique_key(prefix) == expected
+
+
+def test_PrefixIndex_contains_0101N():
+    index = PrefixIndex(PREFIX_INDEX_KEYS)
+    assert "mp" in index
+    assert "mp3" not in index
+    assert len(index) == len(PREFIX_INDEX_KEYS)
+
+
+class FakeTreeview:
+    """ttk.Treeviewの代替。行の作成と表示順だけを記録する。"""
+
+    def __init__(self):
+        self.items: dict[str, tuple] = {}
+        self.children: list[str] = []
+        self.insert_count = 0
+        self.headings: dict[str, str] = {}
+        self.tags: dict[str, tuple] = {}
+
+    def insert(self, parent: str, index: str, iid: str, values: tuple, tags: tuple = ()):
+        self.items[iid] = values
+        self.tags[iid] = tags
+        self.children.append(iid)
+        self.insert_count += 1
+
+    def set_children(self, item: str, *newchildren: str):
+        self.children = list(newchildren)
+
+    def delete(self, *items: str):
+        for iid in items:
+            del self.items[iid]
+        self.children = [iid for iid in self.children if iid in self.items]
+
+    def heading(self, column: str, text: str):
+        self.headings[column] = text
+
+    def item(self, iid: str, values: Optional[tuple] = None, tags: Optional[tuple] = None):
+        if values is not None:
+            self.items[iid] = values
+        if tags is not None:
+            self.tags[iid] = tags
+
+
+def make_launch_table_window(keys: list[str], limit: int = 1000) -> SimpleNamespace:
+    config = Config(launch_table_limit=limit)
+    for key in keys:
+        config.launch_dict[key] = Launch(title=f"title_{key}", program_path="", args=None, work_dir=None, shell=None)
+    return SimpleNamespace(
+        config_data=config,
+        config_file_data=config,
+        launch_table=FakeTreeview(),
+        launch_table_items=set(),
+        broken_keys=set(),
+        usage=UsageStore(os.devnull),
+        config_writer=ConfigWriter(os.devnull),
+        metrics=Metrics(),
+    )
+
+
+def test_update_launch_table_0101N():
+    win = make_launch_table_window(["a", "ab", "b"])
+    MainWindow.update_launch_table(win)
+    assert win.launch_table.children == ["a", "ab", "b"]
+    MainWindow.update_launch_table(win, ["a", "ab"])
+    assert win.launch_table.children == ["a", "ab"]
+    MainWindow.update_launch_table(win, ["ab", "b"])
+    assert win.launch_table.children == ["ab", "b"]
+    assert win.launch_table.items["ab"] == ("ab", "title_ab")
+    assert win.launch_table.insert_count == 3  # 行は再利用される
+
+
+def test_update_launch_table_0201B():
+    win = make_launch_table_window([f"k{i}" for i in range(10)], limit=3)
+    MainWindow.update_launch_table(win)
+    assert win.launch_table.children == ["k0", "k1", "k2"]
+    assert win.launch_table.insert_count == 3
+    assert win.launch_table.headings["key"] == "key (3/10)"
+    MainWindow.update_launch_table(win, ["k5"])
+    assert win.launch_table.children == ["k5"]
+    assert win.launch_table.headings["key"] == "key"
+
+
+def test_clear_launch_table_0101N():
+    win = make_launch_table_window(["a", "b"])
+    MainWindow.update_launch_table(win)
+    MainWindow.clear_launch_table(win)
+    assert win.launch_table.items == {}
+    assert win.launch_table_items == set()
+
+
+def test_VariableExpander_expand_0101N(monkeypatch):
+    monkeypatch.setenv("LOCALAPPDATA", "env")
+    variables = VariableExpander([Variable(name="A", value="a"), Variable(name="A", value="x")])
+    assert variables.expand("%A%/%LOCALAPPDATA%/%NOENV%") == "a/env/%NOENV%"
+
+
+def test_VariableExpander_expand_0102N(monkeypatch):
+    monkeypatch.setenv("LOCALAPPDATA", "env")
+    variables = VariableExpander([Variable(name="LOCALAPPDATA", value="var")])
+    assert variables.expand("%LOCALAPPDATA%") == "var"  # 設定変数を優先
+
+
+def test_VariableExpander_expand_0103N(monkeypatch):
+    monkeypatch.setenv("LOCALAPPDATA", "env1")
+    variables = VariableExpander()
+    assert variables.expand("%LOCALAPPDATA%/%NOENV%") == "env1/%NOENV%"
+    monkeypatch.setenv("LOCALAPPDATA", "env2")  # 環境変数の変更
+    assert variables.expand("%LOCALAPPDATA%/%NOENV%") == "env2/%NOENV%"
+    monkeypatch.setenv("NOENV", "new")  # 環境変数の追加
+    assert variables.expand("%LOCALAPPDATA%/%NOENV%") == "env2/new"
+
+
+def test_VariableExpander_expand_0201B():
+    variables = VariableExpander([Variable(name="A", value="a")], cache_limit=2)
+    for _ in range(2):
+        assert [variables.expand(s) for s in ["", "%", "%A", "%A%%A%", "100%A%%"]] == ["", "%", "%A", "aa", "100a%"]
+    assert len(variables.result_cache) <= 2
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path_factory, monkeypatch):
+    # スナップショットはユーザのキャッシュディレクトリに書き込むので、テスト用のディレクトリに置き換える
+    cache_home = tmp_path_factory.mktemp("cache")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(cache_home))
+    monkeypatch.setenv("LOCALAPPDATA", str(cache_home))
+    return cache_home
+
+
+def write_config_file(path, config_dic: dict) -> tuple[str, dict]:
+    data = json.dumps(config_dic).encode("utf-8")
+    path.write_bytes(data)
+    config_path = str(path)
+    return config_path, config_cache_key(config_path, os.stat(config_path), data)
+
+
+def test_config_cache_read_0101N(tmp_path):
+    config_path, key = write_config_file(tmp_path / "config.json", {"launch_dict": {"a": {"program_path": "a.exe"}}})
+    assert config_cache_read(config_path, key) is None  # スナップショットなし
+    config = Config(launch_dict={"a": Launch(program_path="a.exe", args=None, work_dir=None, shell=None)})
+    config_cache_write(config_path, key, config)
+    assert config_cache_read(config_path, key) == config
+
+
+def test_config_cache_read_0102A(tmp_path):
+    config_path, key = write_config_file(tmp_path / "config.json", {"font_size": 10})
+    config_cache_write(config_path, key, Config(font_size=10))
+    _, key2 = write_config_file(tmp_path / "config.json", {"font_size": 11})  # 設定ファイルの更新
+    assert key2 != key
+    assert config_cache_read(config_path, key2) is None
+
+
+def test_config_cache_read_0103A(tmp_path, monkeypatch):
+    config_path, key = write_config_file(tmp_path / "config.json", {"font_size": 10})
+    config_cache_write(config_path, key, Config(font_size=10))
+    monkeypatch.setattr(src.main, "__version__", "999.0.0")  # バージョンアップ
+    data = (tmp_path / "config.json").read_bytes()
+    assert config_cache_read(config_path, config_cache_key(config_path, os.stat(config_path), data)) is None
+
+
+def test_config_cache_read_0104A(tmp_path):
+    config_path, key = write_config_file(tmp_path / "config.json", {"font_size": 10})
+    config_cache_write(config_path, key, Config(font_size=10))
+    with open(config_cache_path(config_path), mode="wb") as f:
+        f.write(b"broken")
+    assert config_cache_read(config_path, key) is None
+
+
+def test_config_cache_path_0101N(tmp_path, cache_home):
+    config_path, key = write_config_file(tmp_path / "config.json", {"font_size": 10})
+    config_cache_write(config_path, key, Config(font_size=10))
+    assert os.listdir(tmp_path) == ["config.json"]  # 設定ファイルのディレクトリには書き込まない
+    assert os.listdir(cache_home / "AltFN2") == [os.path.basename(config_cache_path(config_path))]  # 一時ファイルなし
+    assert config_cache_path(str(tmp_path / "other" / "config.json")) != config_cache_path(config_path)
+
+
+CONFIG_DECODE_CASES = [
+    {},
+    {"version": "0.5.0", "font_size": 10, "hotkey": "ctrl+alt+q", "key_interval": 80},  # 未定義のフィールド
+    {"font_size": True, "actions_after_launch": None},
+    {"main_window_geometry": {"width": 1, "height": 2, "x": 3, "y": 4}},
+    {"variable_list": [{"name": "A", "value": "a"}, {}]},
+    {"launch_dict": {"a": {"program_path": "p"}, "b": {"program_path": "p", "args": ["x"], "work_dir": "w"}}},
+    {"launch_dict": {"a": {"program_path": "p", "args": None, "shell": True, "title": "t"}}},
+    {"launch_dict": {"a": {}}},  # 必須フィールドなし
+    {"launch_dict": {"a": {"title": "t"}, "g": {"group": ["a"]}}},  # グループ以外はprogram_pathが必須
+    {"launch_dict": {"g": {"program_path": "p", "group": ["a"]}}},  # program_pathとgroupの両方
+    {"launch_dict": {"a": {"program_path": 1}}},
+    {"launch_dict": {"a": {"program_path": "p", "args": ["a", 1]}}},
+    {"launch_dict": {"a": {"program_path": "p", "shell": 1}}},
+    {"launch_dict": {"a": None}},
+    {"launch_dict": []},
+    {"variable_list": {}},
+    {"variable_list": [{"name": 1}]},
+    {"main_window_geometry": {"x": "1"}},
+    {"main_window_geometry": None},
+    {"font_size": "x"},
+    {"hotkey": None},
+    {"launch_dict": {"g": {"group": ["a", {"key": "b", "delay": 100}, {"launch": {"program_path": "p"}}]}}},
+    {"launch_dict": {"g": {"group": [{"launch": {"program_path": "p", "group": []}}], "group_parallel": 2}}},
+    {"launch_dict": {"g": {"group": [1]}}},
+    {"launch_dict": {"g": {"group": [{"launch": {"program_path": 1}}]}}},
+    {"launch_dict": {"g": {"group": [{"launch": 1}]}}},
+]
+
+
+def nest_launch_options(data: Any) -> Any:
+    """設定ファイルでLaunchと同じ階層に書いたLaunchOptionsのフィールドを、dacite用にoptionsに移す"""
+    if not isinstance(data, dict) or not isinstance(data.get("launch_dict"), dict):
+        return data
+    names = [f.name for f in dataclasses.fields(LaunchOptions)]
+
+    def nest(launch: Any) -> None:
+        if not isinstance(launch, dict) or not any(name in launch for name in names):
+            return
+        launch["options"] = {name: launch.pop(name) for name in names if name in launch}
+        for member in launch["options"].get("group") or []:
+            if isinstance(member, dict):
+                nest(member.get("launch"))
+
+    for launch in data["launch_dict"].values():
+        nest(launch)
+    return data
+
+
+@pytest.mark.parametrize("data", CONFIG_DECODE_CASES)
+def test_config_from_dict_0101N(data: dict):
+    try:
+        expected = dacite.from_dict(data_class=Config, data=nest_launch_options(copy.deepcopy(data)))
+        check_launch_dict(expected.launch_dict)
+    except dacite.DaciteError as e:
+        with pytest.raises(type(e)) as exc_info:
+            config_from_dict(copy.deepcopy(data))
+        field_path = getattr(e, "field_path", None)
+        if field_path is not None:
+            field_path = field_path.replace(".options.", ".")
+        assert getattr(exc_info.value, "field_path", None) == field_path
+        assert str(exc_info.value) == str(e).replace(".options.", ".")
+    else:
+        assert config_from_dict(copy.deepcopy(data)) == expected
+
+
+@pytest.mark.parametrize(
+    "test_id, launch_dict, expected_error, expected_message",
+    [
+        (
+            "0101A",
+            {"a": {"title": "t"}},
+            dacite.MissingValueError,
+            'missing value for field "launch_dict.a.program_path"',
+        ),
+        (
+            "0102A",
+            {"g": {"program_path": "p", "group": ["a"]}},
+            dacite.UnexpectedDataError,
+            'can not match "launch_dict.g.program_path" to any data class field',
+        ),
+    ],
+)
+def test_config_from_dict_0002X(test_id: str, launch_dict: dict, expected_error: type, expected_message: str):
+    with pytest.raises(expected_error) as exc_info:
+        config_from_dict({"launch_dict": launch_dict})
+    assert str(exc_info.value) == expected_message
+
+
+def test_config_from_dict_0201N():
+    launch = {"program_path": "C:/bin/app.exe", "args": ["--open", "C:/data/file.txt"], "work_dir": "C:/work"}
+    text = json.dumps({"launch_dict": {"a": launch, "b": launch}})
+    config = config_from_dict(json.loads(text))
+    a, b = config.launch_dict["a"], config.launch_dict["b"]
+    assert a.program_path is b.program_path  # 繰り返し現れる文字列は共有する
+    assert a.work_dir is b.work_dir
+    assert a.args[1] is b.args[1]
+    assert not hasattr(a, "__dict__")  # __slots__
+    assert a.options is None  # 使用頻度の低い設定が無い場合は持たない
+    assert pickle.loads(pickle.dumps(config)) == config
+    # 共有する文字列は読み込み中の設定ファイルの中だけ
+    other = config_from_dict(json.loads(text))
+    assert other.launch_dict["a"].program_path is not a.program_path
+
+
+def test_import_0101N():
+    # 起動時に不要なモジュールを読み込まないこと。また、一定時間内に読み込めること
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import src.main\n"
+        "elapsed = time.perf_counter() - start\n"
+        "modules = ('keyboard', 'win32gui', 'win32con', 'dacite', 'subprocess', 'tkinter.ttk')\n"
+        "heavy = [m for m in modules if m in sys.modules]\n"
+        "print(elapsed, heavy)\n"
+    )
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", code], cwd=root_dir, capture_output=True, text=True, check=True)
+    elapsed, heavy = result.stdout.split(" ", 1)
+    assert heavy.strip() == "[]"
+    assert float(elapsed) < 0.5
+
+
+def test_StartupProfile_0101N(tmp_path):
+    profile = StartupProfile()
+    profile.mark("imports")
+    profile.mark("analyze_option")
+    path = tmp_path / "profile.json"
+    profile.write(str(path))
+    result = json.loads(path.read_text(encoding="utf-8"))
+    assert list(result["phases"]) == ["imports", "analyze_option"]
+    assert result["total"] == pytest.approx(sum(result["phases"].values()))
+
+
+@pytest.mark.parametrize(
+    "test_id, argv, expected",
+    [
+        ("0101N", ["AltFN2.py"], None),
+        ("0102N", ["AltFN2.py", "--startup-profile"], "-"),
+        ("0103N", ["AltFN2.py", "--startup_profile", "profile.json"], "profile.json"),
+    ],
+)
+def test_analyze_option_0001X(test_id: str, argv: list[str], expected: Optional[str]):
+    args = analyze_option(argv)
+    assert args.startup_profile == expected
+
+
+@pytest.mark.parametrize(
+    "test_id, argv, expected",
+    [
+        ("0201N", ["AltFN2.py"], None),
+        ("0202N", ["AltFN2.py", "--stats"], "-"),
+        ("0203N", ["AltFN2.py", "--stats", "stats.json"], "stats.json"),
+    ],
+)
+def test_analyze_option_0002X(test_id: str, argv: list[str], expected: Optional[str]):
+    args = analyze_option(argv)
+    assert args.stats == expected
+
+
+def test_analyze_option_0301N(tmp_path):
+    for name in ["work.json", "home.json", "home.json.cache"]:
+        (tmp_path / name).write_text("{}", encoding="utf-8")
+    assert analyze_option(["AltFN2.py"]).config_list == ["config.json"]
+    args = analyze_option(["AltFN2.py", "--config", "a.json", "--config", "b.json", "--config", "a.json"])
+    assert (args.config, args.config_list) == ("a.json", ["a.json", "b.json"])
+    args = analyze_option(["AltFN2.py", "--config", "a.json", "--profile-dir", str(tmp_path)])
+    assert args.config_list == ["a.json", str(tmp_path / "home.json"), str(tmp_path / "work.json")]
+    args = analyze_option(["AltFN2.py", "--profile_dir", str(tmp_path)])
+    assert args.config == str(tmp_path / "home.json")
+
+
+@pytest.fixture
+def instance_server(tmp_path):
+    commands = []
+    received = threading.Event()
+
+    def handler(command: str):
+        commands.append(command)
+        received.set()
+        return server.reply
+
+    server = InstanceServer(str(tmp_path / "AltFN2.sock"))
+    server.start(handler)
+    server.commands = commands
+    server.received = received
+    server.reply = None  # 応答。Noneの場合は"ok"
+    yield server
+    server.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="unixドメインソケット")
+def test_InstanceServer_0101N(instance_server):
+    for command in ["show", "launch calc"]:
+        instance_server.received.clear()
+        assert send_instance_command(command, instance_server.address) is True
+        assert instance_server.received.wait(timeout=1)
+    assert instance_server.commands == ["show", "launch calc"]
+    assert check_duplicate_process(instance_server.address) == 1
+    instance_server.reply = "other"
+    assert request_instance("launch calc", instance_server.address) == "other"
+    assert send_instance_command("show", instance_server.address) is False
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="unixドメインソケット")
+def test_InstanceServer_0102A(instance_server):
+    server2 = InstanceServer(instance_server.address)
+    assert server2.listen() is False  # 既に起動している
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="unixドメインソケット")
+def test_InstanceServer_0103A(tmp_path):
+    address = str(tmp_path / "AltFN2.sock")
+    assert send_instance_command("show", address) is False  # 起動していない
+    assert check_duplicate_process(address) == 0
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.bind(address)  # 異常終了したプロセスのソケットファイル
+    server = InstanceServer(address)
+    assert server.listen() is True
+    server.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="unixドメインソケット")
+def test_InstanceServer_0104A(tmp_path, monkeypatch):
+    # 認証キーが異なるプロセス(他のユーザ)とは通信しない
+    address = str(tmp_path / "AltFN2.sock")
+    commands = []
+    monkeypatch.setattr(src.main, "instance_authkey", lambda: b"x" * 32)
+    server = InstanceServer(address)
+    server.start(commands.append)
+    monkeypatch.setattr(src.main, "instance_authkey", lambda: b"y" * 32)
+    assert request_instance("show", address) is None
+    assert server.listen() is False  # 待ち受けているプロセスのソケットファイルは削除しない
+    monkeypatch.setattr(src.main, "instance_authkey", lambda: b"x" * 32)
+    assert request_instance("show", address) == "ok"  # 認証の失敗後も受信を続ける
+    assert commands == ["show"]
+    server.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="unixドメインソケット")
+def test_InstanceServer_0105A(tmp_path, monkeypatch):
+    # 削除できないソケットファイル(他のユーザのファイル)は起動を妨げない
+    address = str(tmp_path / "AltFN2.sock")
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.bind(address)
+
+    def remove(path):
+        raise PermissionError(path)
+
+    monkeypatch.setattr(os, "remove", remove)
+    assert InstanceServer(address).listen() is False
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="unixドメインソケット")
+def test_instance_address_0101N(cache_home, monkeypatch):
+    # 他のユーザが書き込めないディレクトリに置く
+    monkeypatch.setenv("XDG_RUNTIME_DIR", "/run/user/1000")
+    assert instance_address() == "/run/user/1000/AltFN2.sock"
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    assert instance_address() == str(cache_home / "AltFN2" / "AltFN2.sock")
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="許可属性")
+def test_instance_authkey_0101N(cache_home):
+    key = instance_authkey()
+    path = cache_home / "AltFN2" / "instance.key"
+    assert len(key) == 32 and path.read_bytes() == key
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
+    assert stat.S_IMODE(path.parent.stat().st_mode) == 0o700
+    assert instance_authkey() == key  # 作成済み
+    path.chmod(0o644)  # 他のユーザが読める
+    assert instance_authkey() != key
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="unixドメインソケット")
+def test_main_0101N(instance_server, monkeypatch):
+    monkeypatch.setattr(src.main, "instance_address", lambda: instance_server.address)
+    monkeypatch.setattr(src.main, "MainWindow", None)  # ウィンドウを表示しない
+    assert src.main.main(["AltFN2.py"]) == 0  # オプションなしでも2重起動を防止する
+    assert instance_server.received.wait(timeout=1)
+    assert instance_server.commands == ["show"]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="unixドメインソケット")
+def test_main_0102A(instance_server, monkeypatch):
+    monkeypatch.setattr(src.main, "instance_address", lambda: instance_server.address)
+    monkeypatch.setattr(src.main, "MainWindow", None)  # ウィンドウを表示しない
+    monkeypatch.setattr(src.main, "check_duplicate_process", lambda: 0)  # 同時に起動した
+    assert src.main.main(["AltFN2.py"]) == 0  # 待ち受けに失敗した場合も起動済みのウィンドウを表示する
+    assert instance_server.received.wait(timeout=1)
+    assert instance_server.commands == ["show"]
+
+
+@pytest.mark.parametrize(
+    "test_id, command, expected",
+    [
+        ("0101N", "show", [("activate_window",)]),
+        ("0102N", "launch a", []),  # instance_launch()で実行する
+        ("0103A", "unknown", []),
+    ],
+)
+def test_MainWindow_instance_command_0001X(test_id: str, command: str, expected: list[tuple]):
+    calls = []
+    launch = Launch(program_path="a.exe", args=None, work_dir=None, shell=None)
+    win = SimpleNamespace(
+        config_data=Config(launch_dict={"a": launch}),
+        launch_key="",
+        activate_window=lambda: calls.append(("activate_window",)),
+        exec_program=lambda launch, key: calls.append(("exec_program", key)),
+    )
+    MainWindow.instance_command(win, command)
+    assert calls == expected
+
+
+@pytest.mark.parametrize(
+    "test_id, config_path, key, error, expected_reply, expected_calls",
+    [
+        ("0101N", "config.json", "a", None, ["ok"], ["a"]),
+        ("0102A", "config.json", "a", "起動に失敗しました。", ["error\n起動に失敗しました。"], ["a"]),
+        ("0103A", "config.json", "b", None, ["error\nキーが見つかりません。\nkey=b"], []),
+        ("0104A", "other.json", "a", None, ["other"], []),  # 設定ファイルが異なる
+    ],
+)
+def test_MainWindow_instance_launch_0001X(
+    test_id: str,
+    config_path: str,
+    key: str,
+    error: Optional[str],
+    expected_reply: list[str],
+    expected_calls: list[str],
+    tmp_path,
+):
+    calls = []
+    launch = Launch(program_path="a.exe", args=None, work_dir=None, shell=None)
+
+    def exec_program(launch, key, on_result):
+        calls.append(key)
+        on_result(error)
+        return True
+
+    win = SimpleNamespace(
+        config_path=str(tmp_path / "config.json"),
+        config_data=Config(launch_dict={"a": launch}),
+        launch_key="",
+        exec_program=exec_program,
+    )
+    replies = []
+    MainWindow.instance_launch(win, str(tmp_path / config_path), key, replies.append)
+    assert replies == expected_reply
+    assert calls == expected_calls
+
+
+class FakeLabel(dict):
+    """ttk.Labelの代替"""
+
+    def config(self, **options):
+        self.update(options)
+
+
+def make_key_event_window(keys: list[str]) -> SimpleNamespace:
+    win = make_launch_table_window(keys)
+    win.launch_index = PrefixIndex(keys)
+    win.fuzzy_index = None
+    win.key_label = FakeLabel(text="")
+    win.title_label = FakeLabel(text="")
+    win.launch_key = ""
+    win.visiblility_time = datetime(2000, 1, 1)
+    win.refresh_scheduled = False
+    win.match_prefix = None
+    win.match_keys = []
+    win.idle = []  # after_idle()で予約した関数
+    win.after_idle = lambda func, *args: win.idle.append((func, args))
+    win.speculator = LaunchSpeculator()
+    win.variables = VariableExpander()
+    win.refresh_count = 0
+    win.launched = []
+
+    def refresh_matches():
+        win.refresh_count += 1
+        MainWindow.refresh_matches(win)
+
+    win.refresh_matches = refresh_matches
+    win.key_event_input = lambda e: MainWindow.key_event_input(win, e)
+    win.schedule_refresh = lambda: MainWindow.schedule_refresh(win)
+    win.find_prefix_matches = lambda prefix: MainWindow.find_prefix_matches(win, prefix)
+    win.flush_refresh = lambda: MainWindow.flush_refresh(win)
+    win.update_launch_table = lambda matching_keys=None: MainWindow.update_launch_table(win, matching_keys)
+    win.exec_program = lambda launch: win.launched.append(win.launch_key)
+    return win
+
+
+def type_keys(win: SimpleNamespace, text: str) -> None:
+    for c in text:
+        MainWindow.key_event(win, SimpleNamespace(keysym=c, char=c))
+
+
+def run_idle(win: SimpleNamespace) -> None:
+    while win.idle:
+        func, args = win.idle.pop(0)
+        func(*args)
+
+
+def test_MainWindow_key_event_0101N():
+    win = make_key_event_window([f"k{i:04d}" for i in range(1000)])
+    type_keys(win, "k012")  # 高速な入力
+    assert win.refresh_count == 0
+    assert len(win.idle) == 1  # 更新の予約は1回だけ
+    run_idle(win)
+    assert win.refresh_count == 1
+    assert win.launch_table.children == [f"k{i:04d}" for i in range(120, 130)]
+
+
+def test_MainWindow_key_event_0102N():
+    win = make_key_event_window(["calc", "cmd", "code"])
+    type_keys(win, "ca")
+    MainWindow.key_event(win, SimpleNamespace(keysym="Return", char="\r"))  # 更新の前にReturn
+    assert win.launched == ["calc"]
+    run_idle(win)
+    assert win.refresh_count == 2
+
+
+def test_MainWindow_refresh_matches_0101N():
+    keys = ["calc", "cmd", "code", "copy", "dir"]
+    win = make_key_event_window(keys)
+    for t, key in enumerate(["copy", "code", "copy"]):
+        win.usage.add(key, DAY + t)
+    type_keys(win, "c")
+    run_idle(win)
+    assert win.launch_table.children == ["copy", "code", "calc", "cmd"]
+    win.launch_index.keys_with_prefix = lambda prefix: pytest.fail("索引を使わずに前回の結果を絞り込む")
+    type_keys(win, "o")
+    run_idle(win)
+    assert win.launch_table.children == ["copy", "code"]
+    assert win.match_prefix == "co"
+
+
+def test_MainWindow_refresh_matches_0201N():
+    # speculative_launchの場合は一意に一致したアプリケーションの起動を準備する
+    win = make_key_event_window(["calc", "cmd"])
+    win.speculator.executor.submit = lambda *args: None  # 準備は実行しない
+    type_keys(win, "ca")
+    run_idle(win)
+    assert win.speculator.key is None  # 無効
+    win.config_data.speculative_launch = True
+    type_keys(win, "l")
+    run_idle(win)
+    assert win.speculator.key == "calc"
+    MainWindow.key_event(win, SimpleNamespace(keysym="BackSpace", char=""))
+    MainWindow.key_event(win, SimpleNamespace(keysym="BackSpace", char=""))
+    run_idle(win)
+    assert win.speculator.key is None  # 一致が変わったので中止
+    assert win.speculator.stats()["wasted"] == 1
+
+
+class FakePopen:
+    """subprocess.Popenの代替。起動したコマンドを記録する。"""
+
+    calls: list[tuple] = []
+
+    def __init__(self, cmd: list[str], cwd: str, shell: bool, **options):
+        FakePopen.calls.append((cmd, cwd, shell))
+        self.options = options
+        self.pid = len(FakePopen.calls)
+        self.returncode: Optional[int] = None  # Noneは実行中
+
+    def poll(self) -> Optional[int]:
+        return self.returncode
+
+
+@pytest.fixture
+def slow_launcher(monkeypatch):
+    # 遅いファイルシステム(ネットワークドライブなど)を想定
+    def slow_isfile(path: str) -> bool:
+        time.sleep(0.2)
+        return path != "missing.exe"
+
+    monkeypatch.setattr(os.path, "isfile", slow_isfile)
+    monkeypatch.setattr(subprocess, "Popen", FakePopen)
+    FakePopen.calls = []
+    ui_queue = queue.Queue()  # UIのスレッドで実行する関数
+    launcher = Launcher(lambda func, *args: ui_queue.put((func, args)))
+    launcher.ui_queue = ui_queue
+    yield launcher
+    launcher.shutdown()
+
+
+def run_ui_queue(launcher: Launcher, count: int):
+    for _ in range(count):
+        func, args = launcher.ui_queue.get(timeout=2)
+        func(*args)
+
+
+def test_Launcher_submit_0101N(slow_launcher):
+    results = []
+    launch = Launch(program_path="%A%.exe", args=["%A%"], work_dir=None, shell=None)
+    start = time.perf_counter()
+    expand = VariableExpander([Variable(name="A", value="a")]).expand
+    assert slow_launcher.submit("a", launch, expand, lambda *r: results.append(r))
+    assert time.perf_counter() - start < 0.1  # UIのスレッドは待たない
+    assert results == []
+    run_ui_queue(slow_launcher, 1)
+    assert results == [("a", None)]
+    assert FakePopen.calls == [(["a.exe", "a"], "", False)]
+    assert slow_launcher.pending == set()
+
+
+def test_Launcher_submit_0102N(slow_launcher):
+    # 起動中の同じキーは受け付けない。別のキーは並行して起動する
+    results = []
+    launch = Launch(program_path="a.exe", args=None, work_dir=None, shell=None)
+    expand = VariableExpander().expand
+    assert slow_launcher.submit("a", launch, expand, lambda *r: results.append(r)) is True
+    assert slow_launcher.submit("a", launch, expand, lambda *r: results.append(r)) is False
+    assert slow_launcher.submit("b", launch, expand, lambda *r: results.append(r)) is True
+    run_ui_queue(slow_launcher, 2)
+    assert sorted(results) == [("a", None), ("b", None)]
+    assert slow_launcher.submit("a", launch, expand, lambda *r: results.append(r)) is True
+    run_ui_queue(slow_launcher, 1)
+
+
+def test_Launcher_submit_0103A(slow_launcher):
+    results = []
+    launch = Launch(program_path="missing.exe", args=None, work_dir=None, shell=None)
+    slow_launcher.submit("a", launch, VariableExpander().expand, lambda *r: results.append(r))
+    run_ui_queue(slow_launcher, 1)
+    assert results == [("a", "ファイルが見つかりません。\nprogram_path=missing.exe")]
+    assert FakePopen.calls == []
+
+
+def test_Launcher_submit_0201N(slow_launcher):
+    # single_instanceは実行中のプロセスがある間は起動しない
+    slow_launcher.registry = ProcessRegistry()
+    results = []
+    options = LaunchOptions(single_instance=True)
+    launch = Launch(program_path="a.exe", args=None, work_dir=None, shell=None, options=options)
+    expand = VariableExpander().expand
+    for _ in range(2):
+        slow_launcher.submit("a", launch, expand, lambda *r: results.append(r))
+        run_ui_queue(slow_launcher, 1)
+    assert results == [("a", None), ("a", None)]
+    assert len(FakePopen.calls) == 1
+    record = slow_launcher.registry.alive(("", "a"))
+    assert record.pid == 1
+    record.process.returncode = 0  # 終了
+    slow_launcher.submit("a", launch, expand, lambda *r: results.append(r))
+    run_ui_queue(slow_launcher, 1)
+    assert len(FakePopen.calls) == 2
+    assert [r.returncode for r in slow_launcher.registry.exited] == [0]
+    # single_instanceでない場合は毎回起動する
+    launch.options = None
+    slow_launcher.submit("a", launch, expand, lambda *r: results.append(r))
+    run_ui_queue(slow_launcher, 1)
+    assert len(FakePopen.calls) == 3
+    assert len(slow_launcher.registry.running[("", "a")]) == 2
+    slow_launcher.registry.stop()
+
+
+def test_Launcher_submit_0202N(slow_launcher):
+    # 起動中のキーとsingle_instanceの実行中のプロセスはプロファイル(設定ファイル)ごとに区別する
+    slow_launcher.registry = ProcessRegistry()
+    results = []
+    options = LaunchOptions(single_instance=True)
+    launch = Launch(program_path="a.exe", args=None, work_dir=None, shell=None, options=options)
+    expand = VariableExpander().expand
+    assert slow_launcher.submit("x", launch, expand, lambda *r: results.append(r), None, "work.json")
+    assert slow_launcher.submit("x", launch, expand, lambda *r: results.append(r), None, "home.json")
+    run_ui_queue(slow_launcher, 2)
+    assert len(FakePopen.calls) == 2
+    assert sorted(slow_launcher.registry.running) == [("home.json", "x"), ("work.json", "x")]
+    slow_launcher.submit("x", launch, expand, lambda *r: results.append(r), None, "home.json")
+    run_ui_queue(slow_launcher, 1)
+    assert len(FakePopen.calls) == 2  # 同じプロファイルの実行中のプロセス
+    assert slow_launcher.pending == set()
+    slow_launcher.registry.stop()
+
+
+def test_Launcher_submit_group_0101N(slow_launcher):
+    # 全てのメンバーを検証してから起動する。結果は1回だけ通知する
+    results = []
+    members = [
+        ("b", Launch(program_path="b.exe", args=None, work_dir=None, shell=None), 300),
+        ("a", Launch(program_path="a.exe", args=None, work_dir=None, shell=None), 0),
+        ("x", Launch(program_path="missing.exe", args=None, work_dir=None, shell=None), 0),
+    ]
+    start = time.perf_counter()
+    assert slow_launcher.submit_group("g", members, 2, VariableExpander().expand, lambda *r: results.append(r))
+    assert slow_launcher.submit_group("g", members, 2, VariableExpander().expand, lambda *r: None) is False
+    run_ui_queue(slow_launcher, 1)
+    assert time.perf_counter() - start >= 0.6 + 0.3  # 検証(0.2秒×3)の後、待ち時間
+    assert [call[0] for call in FakePopen.calls] == [["a.exe"], ["b.exe"]]  # 待ち時間の短い順
+    assert results == [
+        (
+            "g",
+            "グループの一部のアプリケーションを起動できませんでした。\nkey=g\n\n"
+            "○ b\n○ a\n× x: ファイルが見つかりません。 program_path=missing.exe",
+        )
+    ]
+    assert slow_launcher.pending == set()
+
+
+def test_Launcher_submit_group_0102N(slow_launcher):
+    results = []
+    launch = Launch(program_path="a.exe", args=None, work_dir=None, shell=None)
+    members = [(f"k{i}", launch, 0) for i in range(4)]
+    slow_launcher.submit_group("g", members, None, VariableExpander().expand, lambda *r: results.append(r))
+    run_ui_queue(slow_launcher, 1)
+    assert results == [("g", None)]  # 全て成功
+    assert len(FakePopen.calls) == 4
+
+
+def test_Launcher_submit_group_0103N(slow_launcher):
+    # 同じキーのメンバーの結果はそれぞれ表示する
+    results = []
+    launch = Launch(program_path="a.exe", args=None, work_dir=None, shell=None)
+    missing = Launch(program_path="missing.exe", args=None, work_dir=None, shell=None)
+    members = [("a", launch, 0), ("x", missing, 0), ("a", launch, 0)]
+    slow_launcher.submit_group("g", members, None, VariableExpander().expand, lambda *r: results.append(r))
+    run_ui_queue(slow_launcher, 1)
+    assert len(FakePopen.calls) == 2
+    assert results == [
+        (
+            "g",
+            "グループの一部のアプリケーションを起動できませんでした。\nkey=g\n\n"
+            "○ a\n× x: ファイルが見つかりません。 program_path=missing.exe\n○ a",
+        )
+    ]
+
+
+def test_resolve_launch_group_0101N():
+    def launch(group: Optional[list] = None, **kwargs) -> Launch:
+        options = None if group is None else LaunchOptions(group=group)
+        return Launch(args=None, work_dir=None, shell=None, options=options, **kwargs)
+
+    inline = launch(program_path="c.exe")
+    launch_dict = {
+        "a": launch(program_path="a.exe"),
+        "b": launch(program_path="b.exe"),
+        "g1": launch(group=["a", GroupMember(key="b", delay=100)]),
+        "g2": launch(group=[GroupMember(key="g1", delay=50), GroupMember(launch=inline, delay=10), "a"]),
+    }
+    assert resolve_launch_group(launch_dict, "g2") == [
+        ("a", launch_dict["a"], 50),
+        ("b", launch_dict["b"], 150),  # 待ち時間は加算する
+        ("g2[1]", inline, 10),
+        ("a", launch_dict["a"], 0),
+    ]
+
+
+@pytest.mark.parametrize(
+    "test_id, group, message",
+    [
+        ("0201A", ["missing"], "キーが見つかりません。\nkey=missing"),
+        ("0202A", ["g"], "グループが循環しています。\nkey=g→g"),
+        ("0203A", [GroupMember(delay=1)], "グループのメンバーにkeyまたはlaunchがありません。\nkey=g[0]"),
+    ],
+)
+def test_resolve_launch_group_0002X(test_id: str, group: list, message: str):
+    launch_dict = {"g": Launch(args=None, work_dir=None, shell=None, options=LaunchOptions(group=group))}
+    with pytest.raises(LaunchError) as exc_info:
+        resolve_launch_group(launch_dict, "g")
+    assert str(exc_info.value) == message
+
+
+def wait_speculation(speculator: LaunchSpeculator, count: int) -> None:
+    deadline = time.perf_counter() + 5
+    while speculator.stats()["ready"] + speculator.stats()["errors"] < count:
+        assert time.perf_counter() < deadline
+        time.sleep(0.01)
+
+
+def test_Launcher_submit_0301N(slow_launcher):
+    # 準備済みの場合はパスを検証せずに起動する
+    slow_launcher.speculator = LaunchSpeculator()
+    results = []
+    launch = Launch(program_path="%A%.exe", args=["%A%"], work_dir=None, shell=None)
+    expand = VariableExpander([Variable(name="A", value="a")]).expand
+    slow_launcher.speculator.speculate("a", launch, expand)
+    wait_speculation(slow_launcher.speculator, 1)
+    start = time.perf_counter()
+    slow_launcher.submit("a", launch, expand, lambda *r: results.append(r))
+    run_ui_queue(slow_launcher, 1)
+    assert time.perf_counter() - start < 0.15  # slow_isfile()を呼び出さない
+    assert results == [("a", None)]
+    assert FakePopen.calls == [(["a.exe", "a"], "", False)]
+    assert slow_launcher.speculator.stats()["hits"] == 1
+    slow_launcher.speculator.shutdown()
+
+
+def test_LaunchSpeculator_take_0101N(tmp_path):
+    (tmp_path / "a.exe").write_bytes(b"a" * 1000)
+    speculator = LaunchSpeculator()
+    launch = Launch(program_path=str(tmp_path / "a.exe"), args=None, work_dir=None, shell=None)
+    expand = VariableExpander().expand
+    speculator.speculate("a", launch, expand)
+    speculator.speculate("a", launch, expand)  # 準備中
+    wait_speculation(speculator, 1)
+    assert speculator.take("b", launch, expand) is None
+    assert speculator.take("a", dataclasses.replace(launch), expand) is None  # 設定の再読み込み
+    speculator.speculate("a", launch, expand)
+    wait_speculation(speculator, 2)
+    plan = speculator.take("a", launch, expand)
+    assert (plan.argv, plan.cwd, plan.shell) == ((str(tmp_path / "a.exe"),), str(tmp_path), False)
+    assert speculator.take("a", launch, expand) is None  # 使用済み
+    assert speculator.stats() == {
+        "started": 2,
+        "ready": 2,
+        "hits": 1,
+        "misses": 1,
+        "wasted": 0,
+        "errors": 0,
+        "bytes": 2000,
+    }
+    speculator.shutdown()
+
+
+def test_LaunchSpeculator_take_0102A(tmp_path):
+    speculator = LaunchSpeculator()
+    launch = Launch(program_path=str(tmp_path / "missing.exe"), args=None, work_dir=None, shell=None)
+    speculator.speculate("a", launch, VariableExpander().expand)
+    wait_speculation(speculator, 1)
+    assert speculator.take("a", launch, VariableExpander().expand) is None
+    assert speculator.stats()["errors"] == 1
+    speculator.shutdown()
+
+
+def test_warm_up_file_0101N(tmp_path, monkeypatch):
+    path = tmp_path / "a.exe"
+    path.write_bytes(b"a" * (3 * 1024 * 1024))
+    assert warm_up_file(str(path), 1024 * 1024) == 1024 * 1024  # 最大サイズまで
+    assert warm_up_file(str(tmp_path / "missing.exe"), 1024) == 0
+    # posix_fadviseが無い場合は読み込む。中止したら読み込まない
+    monkeypatch.delattr(os, "posix_fadvise", raising=False)
+    assert warm_up_file(str(path), 10 * 1024 * 1024) == 3 * 1024 * 1024
+    checks = []
+    assert warm_up_file(str(path), 10 * 1024 * 1024, lambda: checks.append(1) or len(checks) > 2) == 2 * 1024 * 1024
+
+
+def test_ProcessRegistry_0101N():
+    # 終了したプロセスは回収用のスレッドが回収する
+    registry = ProcessRegistry(interval=0.02)
+    start = time.time()
+    process = subprocess.Popen([sys.executable, "-c", "import sys; sys.exit(3)"])
+    record = registry.add(("config.json", "a"), process)
+    assert record.pid == process.pid
+    deadline = time.perf_counter() + 10
+    while len(registry.exited) == 0 and time.perf_counter() < deadline:
+        time.sleep(0.02)
+    assert list(registry.exited) == [record]
+    assert record.returncode == 3
+    assert start <= record.spawn_time <= record.exit_time
+    assert registry.running == {}
+    assert registry.alive(("config.json", "a")) is None
+    registry.stop()
+    assert not registry.thread.is_alive()
+
+
+def test_ProcessRegistry_alive_0101N():
+    registry = ProcessRegistry(interval=60)  # 回収用のスレッドは確認しない
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        record = registry.add(("config.json", "a"), process)
+        assert registry.alive(("config.json", "a")) is record
+        assert registry.alive(("config.json", "b")) is None
+        assert registry.alive(("other.json", "a")) is None  # 別のプロファイル
+    finally:
+        process.kill()
+        process.wait()
+    assert registry.alive(("config.json", "a")) is None  # 確認時に回収する
+    assert registry.exited[0].returncode == process.returncode
+    registry.stop()
+
+
+def test_StatCache_kind_0101N(tmp_path):
+    (tmp_path / "a.exe").write_bytes(b"")
+    stat_cache = StatCache()
+    assert stat_cache.kind(str(tmp_path / "a.exe")) == StatCache.KIND_FILE
+    assert stat_cache.isdir(str(tmp_path)) is True
+    assert stat_cache.isfile(str(tmp_path / "missing.exe")) is False
+    assert stat_cache.isfile(str(tmp_path / "a.exe")) is True
+    assert stat_cache.stats() == {"size": 3, "hits": 1, "misses": 3}
+
+
+def test_StatCache_kind_0102N(tmp_path):
+    now = [0.0]
+    stat_cache = StatCache(ttl=10, clock=lambda: now[0])
+    path = str(tmp_path / "a.exe")
+    assert stat_cache.isfile(path) is False
+    (tmp_path / "a.exe").write_bytes(b"")
+    assert stat_cache.isfile(path) is False  # 有効期間内
+    assert stat_cache.isfile(path, refresh_missing=True) is True  # 存在しないという結果は再取得
+    os.remove(path)
+    now[0] = 10.0
+    assert stat_cache.isfile(path) is False  # 有効期間切れ
+
+
+def test_StatCache_kind_0201B(tmp_path):
+    stat_cache = StatCache(max_size=2)
+    for name in ["a", "b", "a", "c"]:
+        stat_cache.kind(str(tmp_path / name))
+    assert list(stat_cache.entries) == [str(tmp_path / "a"), str(tmp_path / "c")]  # 最も古く参照した"b"を削除
+
+
+def test_validate_launches_0101N(tmp_path):
+    (tmp_path / "a.exe").write_bytes(b"")
+    launch_dict = {
+        "ok": Launch(program_path="%DIR%/a.exe", args=None, work_dir="%DIR%", shell=None),
+        "no_program": Launch(program_path="%DIR%/missing.exe", args=None, work_dir=None, shell=None),
+        "no_work_dir": Launch(program_path="%DIR%/a.exe", args=None, work_dir="%DIR%/missing", shell=None),
+    }
+    expand = VariableExpander([Variable(name="DIR", value=str(tmp_path))]).expand
+    assert validate_launches(launch_dict, expand, StatCache()) == {"no_program", "no_work_dir"}
+
+
+def test_validate_launches_0102N(tmp_path):
+    (tmp_path / "a.exe").write_bytes(b"")
+    launch_dict = {"ok": Launch(program_path="%DIR%/a.exe", args=["%DIR%"], work_dir=None, shell=None)}
+    planner = LaunchPlanner(VariableExpander([Variable(name="DIR", value=str(tmp_path))]).expand)
+    assert validate_launches(launch_dict, planner.expand, StatCache(), planner) == set()
+    assert planner.plans["ok"][1].argv == (str(tmp_path / "a.exe"), str(tmp_path))  # 検証と同時に作成
+
+
+def test_compile_launch_0101N():
+    expand = VariableExpander([Variable(name="DIR", value="/opt/a")]).expand
+    launch = Launch(program_path="%DIR%/a.exe", args=["-d", "%DIR%"], work_dir=None, shell=True)
+    plan = compile_launch(launch, expand)
+    assert (plan.argv, plan.cwd, plan.shell, plan.env) == (("/opt/a/a.exe", "-d", "/opt/a"), "/opt/a", True, None)
+    plan = compile_launch(dataclasses.replace(launch, options=LaunchOptions(env={"A_HOME": "%DIR%/home"})), expand)
+    assert plan.env == {"A_HOME": "/opt/a/home"}  # 指定した環境変数だけ。他の環境変数は起動時に統合する
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        plan.cwd = ""
+
+
+def test_LaunchPlanner_get_0101N():
+    launch = Launch(program_path="%DIR%/a.exe", args=None, work_dir=None, shell=None)
+    planner = LaunchPlanner(VariableExpander([Variable(name="DIR", value="/a")]).expand)
+    plan = planner.get("a", launch)
+    assert planner.get("a", launch) is plan  # 作成済み
+    changed = dataclasses.replace(launch, args=["x"])
+    assert planner.get("a", changed).argv == ("/a/a.exe", "x")  # 設定の再読み込み
+    planner = LaunchPlanner(VariableExpander([Variable(name="DIR", value="/b")]).expand)  # 変数の変更
+    assert planner.get("a", changed).argv == ("/b/a.exe", "x")
+
+
+def test_LaunchPlanner_get_0102N(monkeypatch):
+    # 参照する環境変数が変わった場合は作り直す
+    monkeypatch.setenv("ALTFN2_TEST_DIR", "/a")
+    monkeypatch.delenv("ALTFN2_TEST_NEW", raising=False)
+    launch = Launch(program_path="%ALTFN2_TEST_DIR%/x", args=["%ALTFN2_TEST_NEW%"], work_dir=None, shell=None)
+    planner = LaunchPlanner(VariableExpander().expand)
+    plan = planner.get("a", launch)
+    assert plan.argv == ("/a/x", "%ALTFN2_TEST_NEW%")
+    monkeypatch.setenv("ALTFN2_TEST_OTHER", "1")  # 参照しない環境変数
+    assert planner.get("a", launch) is plan
+    monkeypatch.setenv("ALTFN2_TEST_DIR", "/b")
+    assert planner.get("a", launch).argv == ("/b/x", "%ALTFN2_TEST_NEW%")
+    monkeypatch.setenv("ALTFN2_TEST_NEW", "n")  # 環境変数の追加
+    assert planner.get("a", launch).argv == ("/b/x", "n")
+    # 設定変数は環境変数の確認から除く
+    variables = VariableExpander([Variable(name="ALTFN2_TEST_DIR", value="/c")])
+    planner = LaunchPlanner(variables.expand, variables.variables)
+    assert planner.get("a", launch).argv == ("/c/x", "n")
+    assert planner.plans["a"][2] == (("ALTFN2_TEST_NEW", "n"),)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="POSIXのみ")
+def test_spawn_launch_0101N(tmp_path, monkeypatch):
+    monkeypatch.setenv("ALTFN2_TEST_INHERITED", "1")
+    code = "import os, sys; e = os.environ; "
+    code += "open(sys.argv[1], 'w').write(f'{os.getsid(0) == os.getpid()} {os.getcwd()} "
+    code += '{e["A"]} {e["ALTFN2_TEST_INHERITED"]}\')'
+    args = ["-c", code, str(tmp_path / "out.txt")]
+    options = LaunchOptions(env={"A": "b"})
+    launch = Launch(program_path=sys.executable, args=args, work_dir=str(tmp_path), shell=None, options=options)
+    process = spawn_launch(compile_launch(launch, VariableExpander().expand))
+    assert process.wait(timeout=10) == 0
+    assert (tmp_path / "out.txt").read_text() == f"True {tmp_path} b 1"  # 新しいセッション、作業ディレクトリ、環境変数
+
+
+def test_PrefixIndex_add_0101N():
+    keys = list(PREFIX_INDEX_KEYS)
+    index = PrefixIndex(keys)
+    for key in ["mp", "a5m2", "zz"]:  # "zz"は未登録
+        index.remove(key)
+    keys.remove("mp")
+    keys.remove("a5m2")
+    for key in ["mp", "mq", "mw"]:  # "mw"は登録済み
+        index.add(key)
+    keys += ["mp", "mq"]
+    for prefix in ["", "m", "mp", "a", "z"]:
+        assert index.keys_with_prefix(prefix) == [key for key in keys if key.startswith(prefix)]
+
+
+def make_launch(program_path: str, title: str = "") -> Launch:
+    return Launch(title=title, program_path=program_path, args=None, work_dir=None, shell=None)
+
+
+def test_diff_config_0101N():
+    old = Config(launch_dict={"a": make_launch("a.exe"), "b": make_launch("b.exe"), "c": make_launch("c.exe")})
+    new = Config(
+        launch_dict={"a": make_launch("a.exe"), "b": make_launch("b2.exe"), "d": make_launch("d.exe")},
+        variable_list=[Variable(name="A", value="a")],
+    )
+    diff = diff_config(old, new)
+    assert (diff.added, diff.removed, diff.changed, diff.variables_changed) == (["d"], ["c"], ["b"], True)
+    assert diff_config(new, new) == diff_config(Config(), Config())
+
+
+def test_MainWindow_apply_config_0101N():
+    keys = [f"k{i}" for i in range(10)]
+    win = make_launch_table_window(keys)
+    win.launch_index = PrefixIndex(keys)
+    win.variables = VariableExpander()
+    win.plans = LaunchPlanner(win.variables.expand)
+    win.plans.get("k0", win.config_data.launch_dict["k0"])
+    win.validated = []
+    win.start_validate_launches = lambda keys=None: win.validated.append(keys)
+    win.refresh_matches = lambda: None
+    MainWindow.update_launch_table(win)
+    new = copy.deepcopy(win.config_data)
+    del new.launch_dict["k0"]
+    new.launch_dict["k1"] = make_launch("k1.exe", "changed")
+    new.launch_dict["n0"] = make_launch("n0.exe")
+    new.font_size = 20
+    MainWindow.apply_config(win, new)
+    assert win.config_data.launch_dict == new.launch_dict
+    assert win.config_data.font_size == 20
+    assert win.launch_index.keys_with_prefix("") == list(new.launch_dict)
+    assert "k0" not in win.launch_table.items
+    assert "k0" not in win.plans.plans
+    assert win.launch_table.items["k1"] == ("k1", "changed")
+    assert win.validated == [["n0", "k1"]]  # 追加・変更されたキーだけを検証
+    assert win.config_writer.generation == 1
+    MainWindow.apply_config(win, copy.deepcopy(new))  # 変更なし(自身の書き込みによる再読み込み)
+    assert win.config_writer.generation == 1
+    # 読み込み後にプロファイルを切り替えた場合は反映しない
+    win.config_path = "home.json"
+    other = Config(launch_dict={"o0": make_launch("o0.exe")})
+    assert MainWindow.apply_config(win, other, None, "work.json") is None
+    assert win.config_data.launch_dict == new.launch_dict
+    assert MainWindow.apply_config(win, copy.deepcopy(new), None, "home.json") is not None
+
+
+def make_profile_window(tmp_path) -> SimpleNamespace:
+    paths = []
+    for name, keys in [("work", ["calc", "cmd"]), ("home", ["game", "music"]), ("broken", [])]:
+        path = tmp_path / f"{name}.json"
+        launch_dict = {key: {"title": key, "program_path": f"{key}.exe"} for key in keys}
+        path.write_text(json.dumps({"launch_dict": launch_dict}) if keys else "{", encoding="utf-8")
+        paths.append(str(path))
+    win = make_key_event_window([])
+    for name, value in load_profile(paths[0]).items():
+        setattr(win, name, value)
+    win.PROFILE_ATTRS = MainWindow.PROFILE_ATTRS
+    win.profiles = [Profile(name=os.path.splitext(os.path.basename(path))[0], config_path=path) for path in paths]
+    win.profile = win.profiles[0]
+    win.profile_executor = None
+    win.config_watcher = None
+    win.make_config_writer = ConfigWriter
+    win.clear_launch_table = lambda: MainWindow.clear_launch_table(win)
+    win.validate_generation = 0
+    win.validated = []
+
+    def start_validate_launches():  # 検証が完了したことにする
+        win.validated.append(win.config_path)
+        win.validate_pending = 0
+
+    win.start_validate_launches = start_validate_launches
+    win.title = lambda text: setattr(win, "title_text", text)
+    win.switch_profile = lambda index: MainWindow.switch_profile(win, index)
+    return win
+
+
+def test_MainWindow_switch_profile_0101N(tmp_path, monkeypatch):
+    win = make_profile_window(tmp_path)
+    work = win.config_data
+    type_keys(win, "c")
+    run_idle(win)
+    assert MainWindow.switch_profile(win, 1)
+    assert (win.key_label["text"], win.launch_table.children) == ("", ["game", "music"])
+    assert win.title_text == f"{tmp_path / 'home.json'} - AltFN2"
+    assert win.validated == [str(tmp_path / "home.json")]
+    monkeypatch.setattr(src.main, "load_config_files", lambda *args: pytest.fail("設定ファイルを読み込まない"))
+    assert MainWindow.switch_profile(win, 0)
+    assert win.config_data is work
+    assert win.launch_table.children == ["calc", "cmd"]
+    assert not MainWindow.switch_profile(win, 0)  # 有効なプロファイル
+    assert MainWindow.on_next_profile(win) == "break"
+    assert win.profile.name == "home"
+    assert win.validated == [str(tmp_path / "home.json"), str(tmp_path / "work.json")]  # 検証済みは再検証しない
+    MainWindow.close_profiles(win)
+    win.usage.shutdown()
+    win.config_writer.shutdown()
+
+
+def test_MainWindow_switch_profile_0102A(tmp_path, monkeypatch):
+    errors = []
+    showerror = lambda title, message: errors.append(message)
+    monkeypatch.setattr(src.main, "messagebox", SimpleNamespace(showerror=showerror))
+    win = make_profile_window(tmp_path)
+    MainWindow.start_load_profiles(win)  # バックグラウンドで並列に読み込む
+    assert [profile.future is not None for profile in win.profiles] == [False, True, True]
+    assert not MainWindow.switch_profile(win, 2)
+    assert errors[0].startswith("設定ファイルの読み込みに失敗しました。")
+    assert win.profile.name == "work"
+    assert win.profiles[2].future is None  # 次の切り替えで読み込み直す
+    assert MainWindow.switch_profile(win, 1)
+    assert win.launch_index.keys_with_prefix("") == ["game", "music"]
+    MainWindow.close_profiles(win)
+    win.usage.shutdown()
+    win.config_writer.shutdown()
+
+
+def test_ConfigWatcher_0101N(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text("{}", encoding="utf-8")
+    changed = threading.Event()
+    watcher = ConfigWatcher([str(path)], changed.set, interval=0.01)
+    watcher.start()
+    try:
+        assert not changed.wait(timeout=0.1)
+        path.write_text('{"font_size": 10}', encoding="utf-8")
+        assert changed.wait(timeout=1)
+    finally:
+        watcher.stop()
+
+
+def test_ConfigWatcher_watch_0101N(tmp_path):
+    paths = [tmp_path / "a.json", tmp_path / "b.json"]
+    for path in paths:
+        path.write_text("{}", encoding="utf-8")
+    changed = threading.Event()
+    watcher = ConfigWatcher([str(paths[0])], changed.set, interval=0.01)
+    signature = watcher.watch([str(paths[1])])  # a.jsonを監視しない
+    paths[0].write_text('{"font_size": 10}', encoding="utf-8")
+    watcher.start()
+    try:
+        assert not changed.wait(timeout=0.1)
+        watcher.watch([str(paths[0])], signature)  # 監視していない間の変更
+        assert changed.wait(timeout=1)
+    finally:
+        watcher.stop()
+
+
+def fuzzy_search_reference(launch_dict: dict[str, Launch], query: str, limit: int) -> list[str]:
+    """FuzzyIndex.search()と同じ順位を全件の照合で求める"""
+
+    def is_subsequence(query: str, text: str) -> bool:
+        it = iter(text)
+        return all(c in it for c in query)
+
+    query = query.lower()
+    rules = [
+        lambda key, title: key.startswith(query),
+        lambda key, title: query in key,
+        lambda key, title: query in title,
+        lambda key, title: is_subsequence(query, key),
+        lambda key, title: is_subsequence(query, title),
+    ]
+    result = []
+    for rule in rules:
+        for key, launch in launch_dict.items():
+            if key not in result and rule(key.lower(), launch.title.lower()):
+                result.append(key)
+    return result[:limit]
+
+
+def test_FuzzyIndex_search_0101N():
+    launch_dict = {
+        "vsc": make_launch("", "Visual Studio Code"),
+        "me": make_launch("", "Microsoft Excel"),
+        "calc": make_launch("", "電卓"),
+        "notepad": make_launch("", "メモ帳"),
+        "ex": make_launch("", "Explorer"),
+    }
+    index = FuzzyIndex(launch_dict)
+    assert index.search("ex") == ["ex", "me"]  # キーの前方一致 > タイトルの部分一致
+    assert index.search("vs") == ["vsc"]
+    assert index.search("vscode") == ["vsc"]  # タイトルの部分列
+    assert index.search("メモ") == ["notepad"]
+    assert index.search("zz") == []
+    assert index.search("e", limit=2) == ["ex", "me"]
+
+
+def test_FuzzyIndex_search_0201B():
+    random.seed(0)
+    alphabet = "abcde メ"
+    launch_dict = {}
+    for i in range(300):
+        key = "".join(random.choices(alphabet, k=random.randint(1, 4))) + str(i)
+        launch_dict[key] = make_launch("", "".join(random.choices(alphabet, k=random.randint(0, 8))))
+    index = FuzzyIndex(launch_dict)
+    index.SCAN_THRESHOLD = 50  # 連結した文字列の検索も確認する
+    for query in ["a", "ab", "Ba", "abc", "e1", "メa", "edcba", "1", "z"]:
+        for limit in [5, 1000]:
+            assert index.search(query, limit) == fuzzy_search_reference(launch_dict, query, limit)
+
+
+DAY = 24 * 3600
+
+
+def test_UsageStore_rank_0101N(tmp_path):
+    usage = UsageStore(str(tmp_path / "config.json.usage"))
+    now = 1000 * DAY
+    for key, t in [("a", now - 60 * DAY), ("a", now - 60 * DAY), ("a", now - 60 * DAY), ("b", now), ("c", now - DAY)]:
+        usage.append(key, t)
+    # 古い3回より最近の1回を優先する。履歴の無いキーは元の順番
+    assert usage.rank(["x", "a", "y", "c", "b"]) == ["b", "c", "a", "x", "y"]
+    usage.append("c", now)
+    assert usage.rank(["a", "b", "c"]) == ["c", "b", "a"]  # 頻度
+    loaded = UsageStore(usage.path)
+    loaded.load()
+    assert loaded.rank(["x", "a", "b", "c"]) == ["c", "b", "a", "x"]
+    assert loaded.lines == 6
+
+
+def test_UsageStore_compact_0101N(tmp_path):
+    usage = UsageStore(str(tmp_path / "config.json.usage"), max_lines=10, max_keys=3)
+    for i in range(25):
+        usage.append(f"k{i % 5}", DAY + i)
+    assert usage.lines <= 10
+    assert len(usage.entries) <= 5
+    loaded = UsageStore(usage.path)
+    loaded.load()
+    assert loaded.rank(["k0", "k1", "k2", "k3", "k4"]) == usage.rank(["k0", "k1", "k2", "k3", "k4"])
+    for key in loaded.entries:
+        assert loaded.entries[key] == pytest.approx(usage.entries[key], rel=1e-5)
+
+
+def test_UsageStore_load_0102A(tmp_path):
+    path = tmp_path / "config.json.usage"
+    path.write_text("100\ta\nbroken\n200\tb\t2.5\n300\tc", encoding="utf-8")  # 書き込み途中の行
+    usage = UsageStore(str(path))
+    usage.load()
+    assert usage.entries == {"a": (100.0, 1.0), "b": (200.0, 2.5), "c": (300.0, 1.0)}
+    UsageStore(str(tmp_path / "missing.usage")).load()  # ファイルなし
+
+
+@pytest.fixture
+def cli_config(tmp_path, monkeypatch):
+    config_path = tmp_path / "config.json"
+    launch_dict = {
+        "calc": {"title": "電卓", "program_path": sys.executable},
+        "cmd": {"title": "コマンド", "program_path": sys.executable, "args": ["%ARG%"]},
+        "missing": {"title": "なし", "program_path": str(tmp_path / "missing.exe")},
+    }
+    variable_list = [{"name": "ARG", "value": "--version"}]
+    config_path.write_text(json.dumps({"launch_dict": launch_dict, "variable_list": variable_list}), encoding="utf-8")
+    monkeypatch.setattr(subprocess, "Popen", FakePopen)
+    monkeypatch.setattr(src.main, "instance_address", lambda: str(tmp_path / "none.sock"))  # 起動済みのプロセスなし
+    FakePopen.calls = []
+    return str(config_path)
+
+
+@pytest.mark.parametrize(
+    "test_id, option, expected_rc, expected_out",
+    [
+        ("0101N", ["--list"], 0, "calc\t電卓\ncmd\tコマンド\nmissing\tなし\n"),
+        ("0102N", ["--match", "c"], 0, "calc\t電卓\ncmd\tコマンド\n"),
+        ("0103N", ["--match", "cm"], 0, "cmd\tコマンド\n"),
+        ("0104A", ["--match", "x"], 1, ""),
+    ],
+)
+def test_run_cli_0001X(test_id: str, option: list[str], expected_rc: int, expected_out: str, cli_config, capsys):
+    assert run_cli(analyze_option(["AltFN2.py", "--config", cli_config] + option)) == expected_rc
+    assert capsys.readouterr().out == expected_out
+
+
+def test_run_cli_0201N(cli_config, capsys):
+    assert run_cli(analyze_option(["AltFN2.py", "--config", cli_config, "--launch", "cmd"])) == 0
+    assert FakePopen.calls == [([sys.executable, "--version"], os.path.dirname(sys.executable), False)]
+    # 起動履歴が記録され、一覧の先頭になる
+    assert run_cli(analyze_option(["AltFN2.py", "--config", cli_config, "--list"])) == 0
+    assert capsys.readouterr().out.splitlines()[0] == "cmd\tコマンド"
+
+
+@pytest.mark.parametrize("test_id, key", [("0202A", "missing"), ("0203A", "nokey")])
+def test_run_cli_0002X(test_id: str, key: str, cli_config, capsys):
+    assert run_cli(analyze_option(["AltFN2.py", "--config", cli_config, "--launch", key])) == 1
+    assert FakePopen.calls == []
+    assert "見つかりません" in capsys.readouterr().err
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="unixドメインソケット")
+def test_run_cli_0204N(cli_config, instance_server, monkeypatch, capsys):
+    monkeypatch.setattr(src.main, "instance_address", lambda: instance_server.address)
+    command = f"launch {os.path.abspath(cli_config)}\ncalc"
+    assert run_cli(analyze_option(["AltFN2.py", "--config", cli_config, "--launch", "calc"])) == 0
+    assert instance_server.received.wait(timeout=1)
+    assert instance_server.commands == [command]
+    assert FakePopen.calls == []  # 起動済みのプロセスで起動する
+    instance_server.received.clear()
+    assert run_cli(analyze_option(["AltFN2.py", "--config", cli_config, "--launch", "calc", "--no_forward"])) == 0
+    assert len(FakePopen.calls) == 1
+    assert instance_server.commands == [command]
+    # 起動済みのプロセスの設定ファイルが異なる場合は自プロセスで起動する
+    instance_server.reply = "other"
+    assert run_cli(analyze_option(["AltFN2.py", "--config", cli_config, "--launch", "calc"])) == 0
+    assert len(FakePopen.calls) == 2
+    # 起動済みのプロセスでの起動の失敗は標準エラー出力に出力する
+    instance_server.reply = "error\n起動に失敗しました。"
+    assert run_cli(analyze_option(["AltFN2.py", "--config", cli_config, "--launch", "calc"])) == 1
+    assert len(FakePopen.calls) == 2
+    assert capsys.readouterr().err == "起動に失敗しました。\n"
+
+
+def config_write_old(config: Config) -> str:
+    """従来のMainWindow.config_write()のJSON文字列"""
+    json_dic = dataclasses.asdict(config)
+    remove_none_keys(json_dic)
+    return json.dumps(json_dic, indent=4, sort_keys=True, ensure_ascii=False)
+
+
+def test_ConfigWriter_write_0101N(tmp_path):
+    path = tmp_path / "config.json"
+    config = Config(version="0.5.0", variable_list=[Variable(name="V", value="v")])
+    config.launch_dict["a"] = make_launch("a.exe")
+    writer = ConfigWriter(str(path))
+    writer.loaded(config)
+    assert writer.write(config) is False  # 変更なし
+    config.main_window_geometry = WindowGeometry(width=100, height=200, x=10, y=-20)
+    assert writer.write(config) is True
+    config.main_window_geometry = WindowGeometry(width=300, height=400, x=1, y=2)  # 書き込みに影響しない
+    writer.flush()
+    assert path.read_text(encoding="utf-8") == config_write_old(
+        dataclasses.replace(config, main_window_geometry=WindowGeometry(width=100, height=200, x=10, y=-20))
+    )
+    assert writer.write(config) is True  # ウィンドウの位置とサイズだけの変更
+    writer.flush()
+    assert path.read_text(encoding="utf-8") == config_write_old(config)
+    assert (writer.write_count, writer.full_count) == (2, 1)
+    config.launch_dict["b"] = make_launch("b.exe")
+    writer.mark_dirty()
+    assert writer.write(config) is True
+    writer.flush()
+    assert path.read_text(encoding="utf-8") == config_write_old(config)
+    assert (writer.write_count, writer.full_count) == (3, 2)
+    assert not (tmp_path / "config.json.tmp").exists()
+    writer.shutdown()
+
+
+def test_ConfigWriter_write_0102A(tmp_path):
+    errors = []
+    writer = ConfigWriter(str(tmp_path / "missing" / "config.json"), on_error=errors.append)
+    config = Config()
+    assert writer.write(config) is True
+    writer.flush()
+    assert len(errors) == 1
+    assert writer.write(config) is True  # 失敗した場合は再度書き込む
+    writer.shutdown()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="シンボリックリンクと許可属性")
+def test_ConfigWriter_write_0103N(tmp_path):
+    # シンボリックリンクはリンク先を置き換え、許可属性を引き継ぐ
+    target = tmp_path / "dotfiles" / "config.json"
+    target.parent.mkdir()
+    target.write_text("{}", encoding="utf-8")
+    target.chmod(0o600)
+    path = tmp_path / "config.json"
+    path.symlink_to(target)
+    writer = ConfigWriter(str(path))
+    config = Config(launch_dict={"a": make_launch("a.exe")})
+    assert writer.write(config) is True
+    writer.flush()
+    assert path.is_symlink()
+    assert target.read_text(encoding="utf-8") == config_write_old(config)
+    assert stat.S_IMODE(target.stat().st_mode) == 0o600
+    assert not (target.parent / "config.json.tmp").exists()
+    writer.shutdown()
+
+
+def test_ConfigWriter_write_0104N(tmp_path):
+    # LaunchOptionsのフィールドはLaunchと同じ階層に書き込む
+    path = tmp_path / "config.json"
+    inline = Launch(program_path="c.exe", args=None, work_dir=None, shell=None, options=LaunchOptions(env={"A": "b"}))
+    group = ["a", GroupMember(launch=inline, delay=10)]
+    config = Config(launch_dict={"a": make_launch("a.exe")})
+    config.launch_dict["g"] = Launch(args=None, work_dir=None, shell=None, options=LaunchOptions(group=group))
+    writer = ConfigWriter(str(path))
+    assert writer.write(config) is True
+    writer.flush()
+    json_dic = json.loads(path.read_text(encoding="utf-8"))
+    assert json_dic["launch_dict"]["g"]["group"][0] == "a"
+    assert "options" not in json_dic["launch_dict"]["g"]
+    assert json_dic["launch_dict"]["g"]["group"][1]["launch"]["env"] == {"A": "b"}
+    assert config_from_dict(json_dic) == config
+    writer.shutdown()
+
+
+def test_ConfigWriter_write_0201B(tmp_path):
+    path = tmp_path / "config.json"
+    config = Config(launch_dict={"a": make_launch(ConfigWriter.GEOMETRY_MARKER)})  # 目印と同じ文字列
+    writer = ConfigWriter(str(path))
+    writer.write(config)
+    writer.flush()
+    assert path.read_text(encoding="utf-8") == config_write_old(config)
+    writer.shutdown()
+
+
+def write_json(path, data: dict) -> str:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return str(path)
+
+
+def launch_dic(program_path: str) -> dict:
+    return {"title": program_path, "program_path": program_path}
+
+
+@pytest.fixture
+def sharded_config(tmp_path):
+    write_json(
+        tmp_path / "shards" / "a.json",
+        {
+            "launch_dict": {"a": launch_dic("shard_a"), "x": launch_dic("shard_a")},
+            "variable_list": [{"name": "V", "value": "shard_a"}, {"name": "A", "value": "a"}],
+        },
+    )
+    write_json(
+        tmp_path / "shards" / "b.json", {"launch_dict": {"b": launch_dic("shard_b"), "x": launch_dic("shard_b")}}
+    )
+    write_json(tmp_path / "team.json", {"launch_dict": {"m": launch_dic("team"), "t": launch_dic("team")}})
+    return write_json(
+        tmp_path / "config.json",
+        {
+            "include": ["shards/*.json", "team.json"],
+            "launch_dict": {"m": launch_dic("main")},
+            "variable_list": [{"name": "V", "value": "main"}],
+        },
+    )
+
+
+def test_load_config_files_0101N(sharded_config, tmp_path):
+    loaded = load_config_files(sharded_config)
+    launch_dict = loaded.config.launch_dict
+    assert list(launch_dict) == ["m", "a", "x", "b", "t"]  # 設定ファイル,includeの順
+    assert {key: launch.program_path for key, launch in launch_dict.items()} == {
+        "m": "main",  # 設定ファイルが優先
+        "a": "shard_a",
+        "x": "shard_b",  # 後のファイルが優先
+        "b": "shard_b",
+        "t": "team",
+    }
+    assert loaded.config.variable_list == [Variable(name="V", value="main"), Variable(name="A", value="a")]
+    assert list(loaded.main.launch_dict) == ["m"]
+    assert loaded.paths == [
+        sharded_config,
+        str(tmp_path / "shards"),
+        str(tmp_path / "shards" / "a.json"),
+        str(tmp_path / "shards" / "b.json"),
+        str(tmp_path / "team.json"),
+    ]
+
+
+def test_load_config_files_0102N(sharded_config, tmp_path, monkeypatch):
+    shard_cache = {}
+    load_config_files(sharded_config, shard_cache)
+    decoded = []
+    config_from_dict_org = src.main.config_from_dict
+    monkeypatch.setattr(src.main, "config_from_dict", lambda data: decoded.append(data) or config_from_dict_org(data))
+    time.sleep(0.01)
+    write_json(tmp_path / "shards" / "b.json", {"launch_dict": {"b": launch_dic("changed")}})
+    loaded = load_config_files(sharded_config, shard_cache)
+    assert decoded == [{"launch_dict": {"b": launch_dic("changed")}}]  # 更新したファイルだけを解析
+    assert loaded.config.launch_dict["x"].program_path == "shard_a"
+
+
+def test_load_config_files_0103A(sharded_config, tmp_path):
+    (tmp_path / "team.json").unlink()
+    with pytest.raises(ConfigError):
+        load_config_files(sharded_config)
+
+
+def test_load_config_files_0104A(tmp_path):
+    # 設定の形式の誤り(daciteの例外)もConfigErrorにする
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"launch_dict": {"a": {"title": "a"}}}), encoding="utf-8")
+    with pytest.raises(ConfigError, match="launch_dict.a.program_path"):
+        load_config_files(str(config_path))
+
+
+def test_MainWindow_config_write_0101N(sharded_config):
+    loaded = load_config_files(sharded_config)
+    writer = ConfigWriter(sharded_config)
+    writer.loaded(loaded.main)
+    win = SimpleNamespace(
+        config_data=loaded.config,
+        config_file_data=loaded.main,
+        config_writer=writer,
+        winfo_x=lambda: 1,
+        winfo_y=lambda: 2,
+        winfo_width=lambda: 3,
+        winfo_height=lambda: 4,
+    )
+    assert MainWindow.config_write(win) is True
+    writer.flush()
+    with open(sharded_config, encoding="utf-8") as f:
+        json_dic = json.load(f)
+    assert list(json_dic["launch_dict"]) == ["m"]  # includeのファイルの内容は書き込まない
+    assert json_dic["include"] == ["shards/*.json", "team.json"]
+    assert json_dic["main_window_geometry"] == {"width": 3, "height": 4, "x": 1, "y": 2}
+    writer.shutdown()
+
+
+def make_call_in_ui_window() -> SimpleNamespace:
+    win = SimpleNamespace(
+        ui_queue=queue.SimpleQueue(),
+        ui_wakeup_pending=False,
+        wakeups=[],
+        UI_QUEUE_POLL_INTERVAL=MainWindow.UI_QUEUE_POLL_INTERVAL,
+        metrics=Metrics(),
+    )
+    win.event_generate = lambda sequence, when: win.wakeups.append(sequence)
+    win.call_in_ui = lambda func, *args: MainWindow.call_in_ui(win, func, *args)
+    win.drain_ui_queue = lambda: MainWindow.drain_ui_queue(win)
+    return win
+
+
+def test_MainWindow_call_in_ui_0101N():
+    win = make_call_in_ui_window()
+    calls = []
+    threads = [threading.Thread(target=win.call_in_ui, args=(calls.append, i)) for i in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert win.wakeups == ["<<CallInUi>>"]  # 取り出しまでの仮想イベントは1回
+    MainWindow.drain_ui_queue(win)
+    assert sorted(calls) == list(range(10))
+    win.call_in_ui(calls.append, 10)
+    assert win.wakeups == ["<<CallInUi>>", "<<CallInUi>>"]
+
+
+def test_MainWindow_call_in_ui_0102A():
+    win = make_call_in_ui_window()
+
+    def event_generate(sequence, when):
+        raise RuntimeError("main thread is not in main loop")
+
+    win.event_generate = event_generate
+    calls = []
+    win.call_in_ui(calls.append, 1)
+    win.poll_ui_queue = None
+    win.after = lambda ms, func: None
+    MainWindow.poll_ui_queue(win)  # 定期的な確認で処理する
+    assert calls == [1]
+
+
+def test_MainWindow_show_window_0101N():
+    # ホットキーの入力をkeyboardのスレッドの代わりに別スレッドから送る
+    win = make_call_in_ui_window()
+    win.hotkey_time = None
+    win.hotkey_latency = LatencyStats()
+    win.idle = []
+    win.after_idle = lambda func, *args: win.idle.append((func, args))
+    win.activated = []
+    win.activate_window = lambda: win.activated.append(threading.current_thread())
+    win.on_hotkey = lambda hotkey_time: MainWindow.on_hotkey(win, hotkey_time)
+    win.on_hotkey_shown = lambda: MainWindow.on_hotkey_shown(win)
+    thread = threading.Thread(target=MainWindow.show_window, args=(win,))
+    thread.start()
+    thread.join()
+    assert win.activated == []  # keyboardのスレッドでは表示しない
+    MainWindow.drain_ui_queue(win)
+    assert win.activated == [threading.current_thread()]
+    run_idle(win)
+    assert win.hotkey_latency.count == 1
+    assert 0 <= win.hotkey_latency.to_dict()["last"] < 1000
+
+
+def test_LatencyStats_0101N():
+    stats = LatencyStats(size=100)
+    for i in range(200):
+        stats.add(float(i))
+    histogram = {"<=0.1": 1, "<=1": 1, "<=2": 1, "<=5": 3, "<=10": 5, "<=20": 10, "<=50": 30, "<=100": 50, "<=200": 99}
+    assert stats.to_dict() == {
+        "count": 200,
+        "last": 199.0,
+        "min": 100.0,
+        "p50": 150.0,
+        "p95": 195.0,
+        "max": 199.0,
+        "mean": 99.5,
+        "histogram": histogram,  # ヒストグラムは直近以外の値も含む
+    }
+    assert LatencyStats().to_dict() == {"count": 0}
+    stats.add(5000.0)
+    assert stats.to_dict()["histogram"][">1000"] == 1
+
+
+def test_Metrics_0101N(monkeypatch):
+    now = [10.0]
+    monkeypatch.setattr(time, "perf_counter", lambda: now[0])
+    metrics = Metrics()
+    metrics.enabled = True
+    start_time = time.perf_counter()
+    now[0] += 0.002
+    metrics.add("expand", start_time)
+    metrics.add("spawn", 9.0)
+    assert metrics.to_dict()["expand"]["last"] == pytest.approx(2.0)
+    assert metrics.to_dict()["spawn"]["count"] == 1
+    assert metrics.format().splitlines() == [
+        "変数の展開: 1回 p50=2.00ms p95=2.00ms max=2.00ms",
+        "プロセスの起動: 1回 p50=1002.00ms p95=1002.00ms max=1002.00ms",
+    ]
+    assert Metrics().format() == "記録なし"
+
+
+def test_Metrics_write_0101N(tmp_path):
+    metrics = Metrics(enabled=True)
+    metrics.add("refresh", time.perf_counter())
+    metrics.write(str(tmp_path / "stats.json"))
+    metrics.write(str(tmp_path / "stats.json"))  # 追記
+    lines = (tmp_path / "stats.json").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["refresh"]["count"] == 1
+
+
+def test_MainWindow_key_event_0201N():
+    # 有効な場合だけキー入力と一覧表の更新の処理時間を記録する
+    win = make_key_event_window(["k0001", "k0002"])
+    type_keys(win, "k0")
+    run_idle(win)
+    assert win.metrics.to_dict() == {}
+    win.metrics.enabled = True
+    type_keys(win, "0")
+    run_idle(win)
+    stats = win.metrics.to_dict()
+    assert stats["key_event"]["count"] == 1
+    assert stats["refresh"]["count"] == 1